@@ -0,0 +1,161 @@
+#Fan-in of several aggregators into a single stream of samples.
+#All aggregator connections are multiplexed with a selector on one thread,
+#receive the same subscription, and their samples are merged in timestamp
+#order. Samples are held in a heap until every connected aggregator has sent
+#a sample at least as new, but never once they are the reorder window older
+#than the newest sample, so an aggregator that lags behind cannot hold back
+#the others for long. An aggregator that has sent nothing for the reorder
+#window (in wall clock time) no longer holds samples back at all. Samples
+#older than one already emitted are counted as late and dropped.
+
+import heapq
+import selectors
+import time
+
+import grail_codec
+import solver_aggregator as sa
+
+class SourceStats:
+  """Statistics for one aggregator of a fan-in."""
+  def __init__(self, host, port):
+    self.host = host
+    self.port = port
+    self.samples = 0
+    # Newest sample timestamp received from this aggregator
+    self.last_timestamp = None
+    # How far this aggregator's newest sample is behind the newest overall
+    self.lag = 0
+    # Samples older than an earlier sample from the same aggregator
+    self.out_of_order = 0
+    # Samples dropped because newer samples were already emitted
+    self.late = 0
+    self.connected = True
+    # Time samples last arrived from this aggregator, or it connected
+    self.last_arrival = time.monotonic()
+
+class AggregatorFanIn:
+  def __init__(self, addresses, reorder_window = 1000):
+    """Connect to every (host, port) aggregator address. Samples are
+    released once every connected aggregator has sent one at least as new,
+    or once they are reorder_window timestamp units (milliseconds for
+    GRAIL) older than the newest sample, waiting at most reorder_window
+    milliseconds for an aggregator that sends nothing."""
+    self.reorder_window = reorder_window
+    self.selector = selectors.DefaultSelector()
+    self.sources = []
+    self.stats = []
+    for host, port in addresses:
+      source = sa.SolverAggregator(host, port)
+      source.socket.setblocking(False)
+      self.selector.register(source.socket, selectors.EVENT_READ, len(self.sources))
+      self.sources.append(source)
+      self.stats.append(SourceStats(host, port))
+    # Heap of (timestamp, arrival number, source index, sample)
+    self.pending = []
+    self.arrivals = 0
+    self.newest = None
+    # Timestamp of the most recently emitted sample
+    self.emitted = None
+
+  def connected(self):
+    """True while any aggregator is still connected."""
+    return any(source.connected for source in self.sources)
+
+  def subscribe(self, rules):
+    """Send the same subscription to every aggregator. Responses are
+    handled as they arrive while polling."""
+    request = grail_codec.encodeSubscription(rules)
+    for source in self.sources:
+      if source.connected:
+        source.socket.setblocking(True)
+        source.socket.sendall(request)
+        source.socket.setblocking(False)
+
+  def close(self):
+    for source in self.sources:
+      if source.connected:
+        self.selector.unregister(source.socket)
+        source.close()
+    self.selector.close()
+
+  def readSource(self, index):
+    """Read and decode whatever one aggregator has sent."""
+    source = self.sources[index]
+    stats = self.stats[index]
+    try:
+      count = source.reader.fill()
+    except BlockingIOError:
+      return
+    except ConnectionError:
+      count = 0
+    for frame in source.reader.bufferedFrames():
+      source.handleFrame(frame)
+    if 0 == count:
+      self.selector.unregister(source.socket)
+      source.close()
+      stats.connected = False
+    if source.available_packets:
+      stats.last_arrival = time.monotonic()
+    for sample in source.available_packets:
+      stats.samples += 1
+      if stats.last_timestamp is not None and sample.timestamp < stats.last_timestamp:
+        stats.out_of_order += 1
+      else:
+        stats.last_timestamp = sample.timestamp
+      if self.newest is None or sample.timestamp > self.newest:
+        self.newest = sample.timestamp
+      if self.emitted is not None and sample.timestamp < self.emitted:
+        # Emitting it now would break the timestamp order
+        stats.late += 1
+        continue
+      heapq.heappush(self.pending, (sample.timestamp, self.arrivals, index, sample))
+      self.arrivals += 1
+    source.available_packets = []
+
+  def release(self, everything = False):
+    """Pop the samples that are outside of the reorder window."""
+    ready = []
+    # Samples up to the newest timestamp of the slowest aggregator that is
+    # still sending are ready
+    limit = None
+    now = time.monotonic()
+    for stats in self.stats:
+      if stats.connected and now - stats.last_arrival < self.reorder_window / 1000:
+        if stats.last_timestamp is None:
+          # Wait for its first samples
+          limit = float('-inf')
+        elif limit is None or stats.last_timestamp < limit:
+          limit = stats.last_timestamp
+    # A lagging aggregator holds samples back for at most the window
+    if limit is not None and self.newest is not None:
+      limit = max(limit, self.newest - self.reorder_window)
+    while self.pending and (everything or limit is None or self.pending[0][0] <= limit):
+      timestamp, arrival, index, sample = heapq.heappop(self.pending)
+      if self.emitted is None or timestamp > self.emitted:
+        self.emitted = timestamp
+      ready.append(sample)
+    return ready
+
+  def poll(self, timeout = None):
+    """Wait up to timeout seconds (forever if None) for data from any
+    aggregator and return the samples that are ready, in timestamp order.
+    Once every aggregator has disconnected all held samples are returned."""
+    if self.connected():
+      # Held samples are released after waiting for a silent aggregator
+      if self.pending:
+        wait = self.reorder_window / 1000
+        timeout = wait if timeout is None else min(timeout, wait)
+      for key, events in self.selector.select(timeout):
+        self.readSource(key.data)
+    for stats in self.stats:
+      if stats.last_timestamp is not None:
+        stats.lag = self.newest - stats.last_timestamp
+    return self.release(not self.connected())
+
+  def __iter__(self):
+    """Yield merged samples until every aggregator has disconnected."""
+    while self.connected():
+      for sample in self.poll():
+        yield sample
+    for sample in self.release(True):
+      yield sample
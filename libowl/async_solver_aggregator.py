@@ -0,0 +1,151 @@
+#This class abstracts the details of connecting to a
+#GRAIL3 aggregator as a solver from an asyncio event loop.
+#Solvers subscribe to the aggregator and then iterate over samples:
+#
+#  conn = AsyncSolverAggregator('localhost', 7008)
+#  await conn.connect()
+#  await conn.subscribe([AggrRule(1, [], 1000)])
+#  async for sample in conn:
+#    ...
+
+import asyncio
+
+import grail_codec
+import sensor_sample as samples
+import solver_aggregator as sa
+
+class AsyncSolverAggregator:
+  #Message constants are shared with the blocking client
+  KEEP_ALIVE            = sa.SolverAggregator.KEEP_ALIVE
+  SUBSCRIPTION_RESPONSE = sa.SolverAggregator.SUBSCRIPTION_RESPONSE
+  SERVER_SAMPLE         = sa.SolverAggregator.SERVER_SAMPLE
+  BUFFER_OVERRUN        = sa.SolverAggregator.BUFFER_OVERRUN
+  VER_STRING = sa.SolverAggregator.VER_STRING
+
+  def __init__(self, host, port, queue_size = 10000, keep_alive_interval = 30):
+    """Prepare a connection to the aggregator. Up to queue_size samples are
+    buffered before the reader stops reading from the socket. A keep alive
+    is sent every keep_alive_interval seconds (never if None)."""
+    self.host = host
+    self.port = port
+    self.connected = False
+    self.keep_alive_interval = keep_alive_interval
+    self.samples = asyncio.Queue(queue_size)
+    self.cur_rules = []
+    self.aggregator_overruns = 0
+    self.stream_reader = None
+    self.stream_writer = None
+    self.tasks = []
+    # Future completed by the next subscription response
+    self.sub_response = None
+
+  async def connect(self):
+    """Connect and perform the solver-aggregator handshake."""
+    self.stream_reader, self.stream_writer = await asyncio.open_connection(self.host, self.port)
+    handshake = grail_codec.makeHandshake(self.VER_STRING)
+    # Receive a handshake and then send one
+    try:
+      remote_handshake = await self.stream_reader.readexactly(len(handshake))
+    except asyncio.IncompleteReadError:
+      remote_handshake = b''
+    if handshake != remote_handshake:
+      self.stream_writer.close()
+      raise RuntimeError("Solver-Aggregator handshake error! Verify aggregator port and url.")
+    self.stream_writer.write(handshake)
+    await self.stream_writer.drain()
+    self.connected = True
+    self.tasks = [asyncio.ensure_future(self.readMessages())]
+    if self.keep_alive_interval is not None:
+      self.tasks.append(asyncio.ensure_future(self.sendKeepAlives()))
+
+  async def close(self):
+    """Close the connection and stop the background tasks."""
+    for task in self.tasks:
+      task.cancel()
+    await asyncio.gather(*self.tasks, return_exceptions=True)
+    self.tasks = []
+    if self.stream_writer is not None:
+      self.stream_writer.close()
+    self.connectionLost()
+
+  async def __aenter__(self):
+    await self.connect()
+    return self
+
+  async def __aexit__(self, exc_type, exc, tb):
+    await self.close()
+
+  async def subscribe(self, rules):
+    """Subscribe to data from the aggregator and wait for the response.
+    Returns the rules that the aggregator accepted."""
+    if not self.connected:
+      raise ConnectionError("Solver Aggregator connection closed")
+    self.sub_response = asyncio.get_running_loop().create_future()
+    self.stream_writer.write(grail_codec.encodeSubscription(rules))
+    await self.stream_writer.drain()
+    return await self.sub_response
+
+  def connectionLost(self):
+    if not self.connected:
+      return
+    self.connected = False
+    if self.sub_response is not None and not self.sub_response.done():
+      self.sub_response.set_exception(ConnectionError("Solver Aggregator connection closed"))
+    # Wake any iterators; None marks the end of the stream
+    try:
+      self.samples.put_nowait(None)
+    except asyncio.QueueFull:
+      pass
+
+  async def readMessages(self):
+    """Read messages until the connection closes, queueing samples and
+    completing subscription requests."""
+    try:
+      while True:
+        inlen = grail_codec.LENGTH.unpack(await self.stream_reader.readexactly(4))[0]
+        inbuff = memoryview(await self.stream_reader.readexactly(inlen))
+        # Empty messages carry no type and are skipped
+        if 0 == inlen:
+          continue
+        control = inbuff[0]
+        if self.SERVER_SAMPLE == control:
+          fields = grail_codec.decodeSample(inbuff[1:])
+          if fields is not None:
+            # Waiting here stops reading when the consumer falls behind
+            await self.samples.put(samples.SensorSample(*fields))
+        elif self.SUBSCRIPTION_RESPONSE == control:
+          self.cur_rules = grail_codec.decodeSubscription(inbuff[1:])
+          if self.sub_response is not None and not self.sub_response.done():
+            self.sub_response.set_result(self.cur_rules)
+        elif self.BUFFER_OVERRUN == control:
+          self.aggregator_overruns += 1
+        # Other messages (like keep alive) require no processing
+    except (asyncio.IncompleteReadError, ConnectionError):
+      pass
+    finally:
+      self.connectionLost()
+
+  async def sendKeepAlives(self):
+    """Periodically send a keep alive so the aggregator knows we are here."""
+    keep_alive = grail_codec.encodeKeepAlive(self.KEEP_ALIVE)
+    try:
+      while self.connected:
+        await asyncio.sleep(self.keep_alive_interval)
+        self.stream_writer.write(keep_alive)
+        await self.stream_writer.drain()
+    except ConnectionError:
+      self.connectionLost()
+
+  def __aiter__(self):
+    return self
+
+  async def __anext__(self):
+    # The end marker may not have fit into a full queue
+    if not self.connected and self.samples.empty():
+      raise StopAsyncIteration
+    sample = await self.samples.get()
+    if sample is None:
+      # Leave the end marker for any other iterators
+      self.samples.put_nowait(None)
+      raise StopAsyncIteration
+    return sample
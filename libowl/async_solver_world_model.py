@@ -0,0 +1,207 @@
+#This class abstracts the details of connecting to a
+#GRAIL3 world model as a solver from an asyncio event loop.
+#Pushes are queued to a writer task that pipelines them onto the socket and
+#a reader task passes transient requests to coroutine callbacks, so a
+#single event loop can drive many solver connections.
+
+import asyncio
+import inspect
+import traceback
+
+import grail_codec
+import solver_world_model as swm
+import transient_matcher
+import wm_encoder
+
+class AsyncSolverWorldModel:
+  #Message constants are shared with the blocking client
+  KEEP_ALIVE       = swm.SolverWorldModel.KEEP_ALIVE
+  START_TRANSIENT  = swm.SolverWorldModel.START_TRANSIENT
+  STOP_TRANSIENT   = swm.SolverWorldModel.STOP_TRANSIENT
+  CREATE_URI       = swm.SolverWorldModel.CREATE_URI
+  EXPIRE_URI       = swm.SolverWorldModel.EXPIRE_URI
+  DELETE_URI       = swm.SolverWorldModel.DELETE_URI
+  VER_STRING = swm.SolverWorldModel.VER_STRING
+
+  def __init__(self, host, port, origin, start_transient_callback = None,
+      stop_transient_callback = None, queue_size = 10000, encoder_cache_size = 8192):
+    """Prepare a connection to the world model. Up to queue_size messages
+    wait for the writer before pushes start waiting for it. The transient
+    callbacks may be coroutine functions and receive a list of
+    TransientRequests."""
+    # The origin string of this solver
+    # This provides data provenance
+    self.origin = origin
+    # Encodes outgoing messages and caches encoded URIs and names
+    self.encoder = wm_encoder.WMEncoder(origin, encoder_cache_size)
+    self.host = host
+    self.port = port
+    self.connected = False
+    self.name_to_alias = {}
+    self.alias_to_name = {}
+    # Tracks transient requests so that only requested URIs are pushed
+    self.transients = transient_matcher.TransientMatcher()
+    # Callback for when the world model requests transient data
+    self.start_transient_callback = start_transient_callback
+    # Callback for when the world model no longer wants a transient type
+    self.stop_transient_callback = stop_transient_callback
+    self.outgoing = asyncio.Queue(queue_size)
+    # Exceptions raised by the transient callbacks
+    self.callback_errors = 0
+    self.stream_reader = None
+    self.stream_writer = None
+    self.tasks = []
+
+  async def connect(self):
+    """Connect and perform the solver-world model handshake."""
+    self.stream_reader, self.stream_writer = await asyncio.open_connection(self.host, self.port)
+    handshake = grail_codec.makeHandshake(self.VER_STRING)
+    # Send and receive handshakes
+    self.stream_writer.write(handshake)
+    await self.stream_writer.drain()
+    try:
+      inshake = await self.stream_reader.readexactly(len(handshake))
+    except asyncio.IncompleteReadError:
+      inshake = b''
+    if handshake != inshake:
+      self.stream_writer.close()
+      raise RuntimeError("Solver-World Model handshake error! Verify world model port and url.")
+    self.connected = True
+    self.tasks = [asyncio.ensure_future(self.readMessages()),
+                  asyncio.ensure_future(self.writeMessages())]
+
+  async def close(self):
+    """Send any queued messages, then close the connection."""
+    if self.connected:
+      await self.flush()
+    for task in self.tasks:
+      task.cancel()
+    await asyncio.gather(*self.tasks, return_exceptions=True)
+    self.tasks = []
+    if self.stream_writer is not None:
+      self.stream_writer.close()
+    self.connected = False
+
+  async def __aenter__(self):
+    await self.connect()
+    return self
+
+  async def __aexit__(self, exc_type, exc, tb):
+    await self.close()
+
+  async def flush(self):
+    """Wait until every queued message has been written to the socket."""
+    await self.outgoing.join()
+
+  async def queueMessage(self, message):
+    if not self.connected:
+      raise ConnectionError("Solver World Model connection closed")
+    await self.outgoing.put(message)
+    # The connection may have dropped while waiting for room in the queue
+    if not self.connected:
+      self.discardQueued()
+      raise ConnectionError("Solver World Model connection closed")
+
+  async def addSolutionTypes(self, attributes, transient = False):
+    """Add some SolutionType objects to the known list"""
+    new_aliases = swm.assignAliases(self.name_to_alias, self.alias_to_name, attributes, transient)
+    # Need to let the world model know what types we can provide
+    if (len(new_aliases) > 0):
+      if transient:
+        for name, alias, is_transient in new_aliases:
+          self.transients.addType(alias)
+      await self.queueMessage(self.encoder.encodeTypeAnnounce(new_aliases))
+
+  async def pushData(self, wmdata_vector, create_uris = False):
+    """Queue URI attributes for sending, automatically declaring new solution
+    types as non-streaming types, transient if the attribute is, if they
+    were not previously declared. Attributes of transient types are only
+    sent for URIs the world model requested."""
+    new_types = [attr for wmdata in wmdata_vector for attr in wmdata.attributes
+                 if attr.name not in self.name_to_alias]
+    if new_types:
+      await self.addSolutionTypes([attr for attr in new_types if not attr.transient])
+      await self.addSolutionTypes([attr for attr in new_types if attr.transient], True)
+    if self.transients.types:
+      wmdata_vector = self.transients.filter(wmdata_vector, self.name_to_alias)
+      if 0 == len(wmdata_vector):
+        return
+    await self.queueMessage(self.encoder.encodeSolverData(wmdata_vector, self.name_to_alias, create_uris))
+
+  async def createURI(self, uri, creation_time):
+    """Create an object with the given name in the world model."""
+    await self.queueMessage(self.encoder.encodeURIMessage(self.CREATE_URI, uri, creation_time))
+
+  async def expireURI(self, uri, expiration_time):
+    """Expire the object with the given name in the world model."""
+    await self.queueMessage(self.encoder.encodeURIMessage(self.EXPIRE_URI, uri, expiration_time))
+
+  async def deleteURI(self, uri):
+    """Delete an object in the world model."""
+    await self.queueMessage(self.encoder.encodeURIMessage(self.DELETE_URI, uri))
+
+  async def writeMessages(self):
+    """Write queued messages, pipelining everything that is queued before
+    waiting for the socket to drain."""
+    written = 0
+    try:
+      while True:
+        self.stream_writer.write(await self.outgoing.get())
+        written = 1
+        while not self.outgoing.empty():
+          self.stream_writer.write(self.outgoing.get_nowait())
+          written += 1
+        await self.stream_writer.drain()
+        for i in range(written):
+          self.outgoing.task_done()
+        written = 0
+    except ConnectionError:
+      for i in range(written):
+        self.outgoing.task_done()
+      self.connectionLost()
+
+  async def readMessages(self):
+    """Read messages until the connection closes, passing transient
+    requests to the callbacks."""
+    try:
+      while True:
+        inlen = grail_codec.LENGTH.unpack(await self.stream_reader.readexactly(4))[0]
+        inbuff = memoryview(await self.stream_reader.readexactly(inlen))
+        # Empty messages carry no type and are skipped
+        if 0 == inlen:
+          continue
+        control = inbuff[0]
+        if control == self.START_TRANSIENT:
+          requests = grail_codec.decodeTransientRequests(inbuff[1:])
+          self.transients.start(requests)
+          callback = self.start_transient_callback
+        elif control == self.STOP_TRANSIENT:
+          requests = grail_codec.decodeTransientRequests(inbuff[1:])
+          self.transients.stop(requests)
+          callback = self.stop_transient_callback
+        else:
+          continue
+        if callback is not None:
+          # A failing callback must not stop transient requests from being
+          # tracked
+          try:
+            result = callback(requests)
+            if inspect.isawaitable(result):
+              await result
+          except Exception:
+            self.callback_errors += 1
+            print("Solver World Model transient callback failed")
+            traceback.print_exc()
+    except (asyncio.IncompleteReadError, ConnectionError):
+      self.connectionLost()
+
+  def connectionLost(self):
+    self.connected = False
+    self.discardQueued()
+
+  def discardQueued(self):
+    """Release anyone waiting for queued messages that can no longer be
+    sent."""
+    while not self.outgoing.empty():
+      self.outgoing.get_nowait()
+      self.outgoing.task_done()
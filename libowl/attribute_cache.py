@@ -0,0 +1,131 @@
+#Local cache of world model attributes for clients.
+#Each (uri, attribute name) pair maps to the newest WMAttribute seen for it
+#and the time it was stored. Entries older than ttl seconds are not served,
+#and at most max_entries pairs are kept with the least recently used evicted
+#first. Streaming updates store newer values as they arrive. Attributes that
+#an object is known not to have are cached as well, so that looking them up
+#again does not need another request.
+
+import collections
+import time
+
+class AttributeCache:
+  def __init__(self, max_entries = 100000, ttl = 10.0):
+    """Keep up to max_entries attributes, each served for ttl seconds after
+    it was stored (forever if ttl is None)."""
+    self.max_entries = max_entries
+    self.ttl = ttl
+    # (uri, name) -> [WMAttribute or None if the object has none, time stored]
+    self.entries = collections.OrderedDict()
+    # URI -> set of cached attribute names
+    self.names = {}
+    self.hits = 0
+    self.misses = 0
+    self.expirations = 0
+    self.evictions = 0
+
+  def __len__(self):
+    return len(self.entries)
+
+  def clear(self):
+    self.entries.clear()
+    self.names.clear()
+
+  def remove(self, key):
+    del self.entries[key]
+    names = self.names[key[0]]
+    names.discard(key[1])
+    if 0 == len(names):
+      del self.names[key[0]]
+
+  def put(self, uri, attr, now = None):
+    """Store an attribute unless a newer one is already cached."""
+    if now is None:
+      now = time.monotonic()
+    key = (uri, attr.name)
+    entry = self.entries.get(key)
+    if entry is not None:
+      self.entries.move_to_end(key)
+      if entry[0] is None or attr.creation >= entry[0].creation:
+        entry[0] = attr
+        entry[1] = now
+      return
+    self.add(key, attr, now)
+
+  def putMissing(self, uri, name, now = None):
+    """Store that an object has no attribute with this name."""
+    if now is None:
+      now = time.monotonic()
+    key = (uri, name)
+    if key in self.entries:
+      self.entries[key] = [None, now]
+      self.entries.move_to_end(key)
+    else:
+      self.add(key, None, now)
+
+  def add(self, key, attr, now):
+    self.entries[key] = [attr, now]
+    self.names.setdefault(key[0], set()).add(key[1])
+    if len(self.entries) > self.max_entries:
+      self.remove(next(iter(self.entries)))
+      self.evictions += 1
+
+  def putData(self, wmdata, now = None):
+    """Store every attribute of a WMData."""
+    if now is None:
+      now = time.monotonic()
+    for attr in wmdata.attributes:
+      self.put(wmdata.uri, attr, now)
+
+  def get(self, uri, name, now = None):
+    """Return the cached attribute, or None if it is missing, stale, or
+    known to be absent."""
+    entry = self.lookup(uri, name, now)
+    return None if entry is None else entry[0]
+
+  def lookup(self, uri, name, now = None):
+    """Return the fresh [attribute or None, time stored] entry, or None."""
+    key = (uri, name)
+    entry = self.entries.get(key)
+    if entry is None:
+      self.misses += 1
+      return None
+    if self.ttl is not None:
+      if now is None:
+        now = time.monotonic()
+      if now - entry[1] > self.ttl:
+        self.remove(key)
+        self.expirations += 1
+        self.misses += 1
+        return None
+    self.entries.move_to_end(key)
+    self.hits += 1
+    return entry
+
+  def getAll(self, uri, names, now = None):
+    """Return the cached attributes of a URI with the given names, leaving
+    out those known to be absent, or None unless every name is cached and
+    fresh."""
+    if now is None:
+      now = time.monotonic()
+    result = []
+    for name in names:
+      entry = self.lookup(uri, name, now)
+      if entry is None:
+        return None
+      if entry[0] is not None:
+        result.append(entry[0])
+    return result
+
+  def invalidate(self, uri, name = None):
+    """Forget one attribute of a URI, or all of them if name is None."""
+    names = [name] if name is not None else list(self.names.get(uri, ()))
+    for attr_name in names:
+      if (uri, attr_name) in self.entries:
+        self.remove((uri, attr_name))
+
+  def stats(self):
+    """Entry, hit, miss, expiration, and eviction counts."""
+    return {'entries': len(self.entries), 'hits': self.hits,
+            'misses': self.misses, 'expirations': self.expirations,
+            'evictions': self.evictions}
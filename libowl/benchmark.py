@@ -0,0 +1,206 @@
+#Throughput and latency benchmarks for the solver clients.
+#Runs against the in-process fake servers so no real aggregator or world
+#model is needed:
+#
+#  python benchmark.py [--samples N] [--devices N] [--payload BYTES] [--rate SAMPLES_PER_SEC]
+
+import argparse
+import struct
+import time
+import tracemalloc
+
+import aggregator_rules
+import fake_servers
+import grail_codec
+import sample_batch
+import solver_aggregator as sa
+import solver_world_model as swm
+import transient_request
+import wm_data
+import wm_encoder
+
+def percentile(values, fraction):
+  ordered = sorted(values)
+  if 0 == len(ordered):
+    return 0
+  return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+def report(name, count, seconds, unit):
+  print("{:<28} {:>12.0f} {}/sec ({} in {:.3f}s)".format(name, count / seconds, unit, count, seconds))
+
+def benchDecode(args):
+  """Samples per second decoded with handleMessage."""
+  generator = fake_servers.SampleGenerator(args.devices, payload_size = args.payload)
+  server = fake_servers.FakeAggregator(generator = generator, total = args.samples)
+  agg = sa.SolverAggregator(server.host, server.port)
+  agg.sendSubscription([sa.AggrRule(1, [], 1000)])
+  start = time.perf_counter()
+  received = 0
+  while agg.handleMessage() is not None:
+    if agg.available_packets:
+      received += len(agg.available_packets)
+      agg.available_packets = []
+  report("decode handleMessage", received, time.perf_counter() - start, "samples")
+  server.close()
+
+def benchBatchDecode(args):
+  """Samples per second decoded with handleBatch, if NumPy is available."""
+  if sample_batch.numpy is None:
+    print("{:<28} skipped, NumPy is not installed".format("decode handleBatch"))
+    return
+  generator = fake_servers.SampleGenerator(args.devices, payload_size = args.payload)
+  server = fake_servers.FakeAggregator(generator = generator, total = args.samples)
+  agg = sa.SolverAggregator(server.host, server.port)
+  agg.sendSubscription([sa.AggrRule(1, [], 1000)])
+  start = time.perf_counter()
+  received = 0
+  batch = agg.handleBatch()
+  while batch is not None:
+    received += len(batch)
+    batch = agg.handleBatch()
+  report("decode handleBatch", received, time.perf_counter() - start, "samples")
+  server.close()
+
+def benchLatency(args):
+  """Time from a sample leaving the fake aggregator until it is decoded.
+  Each payload carries its send time."""
+  count = min(args.samples, 20000)
+  generator = fake_servers.SampleGenerator(args.devices)
+  generator.frames = lambda total: b''.join(
+      generator.frame(struct.pack('!Q', time.perf_counter_ns()) + bytes(args.payload))
+      for i in range(total))
+  server = fake_servers.FakeAggregator(generator = generator, rate = args.rate, total = count)
+  agg = sa.SolverAggregator(server.host, server.port)
+  agg.sendSubscription([sa.AggrRule(1, [], 1000)])
+  latencies = []
+  while agg.handleMessage() is not None:
+    now = time.perf_counter_ns()
+    for sample in agg.available_packets:
+      latencies.append((now - struct.unpack_from('!Q', sample.sense_data)[0]) / 1000.0)
+    agg.available_packets = []
+  print("{:<28} p50 {:.1f}us p99 {:.1f}us ({} samples at {} samples/sec)".format(
+      "sample latency", percentile(latencies, 0.5), percentile(latencies, 0.99),
+      len(latencies), args.rate))
+  server.close()
+
+def benchDecodeMemory(args):
+  """Bytes allocated and kept per decoded sample message."""
+  count = min(args.samples, 20000)
+  generator = fake_servers.SampleGenerator(args.devices, payload_size = args.payload)
+  server = fake_servers.FakeAggregator(generator = generator, total = count)
+  agg = sa.SolverAggregator(server.host, server.port)
+  agg.sendSubscription([sa.AggrRule(1, [], 1000)])
+  tracemalloc.start()
+  before = tracemalloc.get_traced_memory()[0]
+  while agg.handleMessage() is not None:
+    pass
+  after = tracemalloc.get_traced_memory()[0]
+  tracemalloc.stop()
+  received = max(1, len(agg.available_packets))
+  print("{:<28} {:>12.0f} bytes/sample kept".format("decode memory", (after - before) / received))
+  server.close()
+
+def makePushes(args, count):
+  return [[wm_data.WMData('benchmark.object.{}'.format(i % args.devices),
+            [wm_data.WMAttribute('location.x', bytes(args.payload), i),
+             wm_data.WMAttribute('location.y', bytes(args.payload), i)])]
+          for i in range(count)]
+
+def benchEncode(args, coalesce = False):
+  """pushData attributes per second and encode latency."""
+  count = min(args.samples, 50000)
+  server = fake_servers.FakeWorldModel()
+  wm = swm.SolverWorldModel(server.host, server.port, 'benchmark')
+  if coalesce:
+    wm.setCoalescing()
+  pushes = makePushes(args, count)
+  latencies = []
+  start = time.perf_counter()
+  for push in pushes:
+    before = time.perf_counter_ns()
+    wm.pushData(push)
+    latencies.append((time.perf_counter_ns() - before) / 1000.0)
+  wm.flush()
+  server.waitForAttributes(2 * count)
+  name = "pushData coalesced" if coalesce else "pushData"
+  report(name, server.attributes, time.perf_counter() - start, "attributes")
+  print("{:<28} p50 {:.1f}us p99 {:.1f}us, {} messages".format(
+      name + " latency", percentile(latencies, 0.5), percentile(latencies, 0.99),
+      server.count(swm.SolverWorldModel.SOLVER_DATA)))
+  wm.close()
+  server.close()
+
+def benchEncodeMemory(args):
+  """Bytes allocated while encoding each solver data message."""
+  count = min(args.samples, 10000)
+  encoder = wm_encoder.WMEncoder('benchmark')
+  aliases = {'location.x': 0, 'location.y': 1}
+  pushes = makePushes(args, count)
+  allocated = 0
+  tracemalloc.start()
+  for push in pushes:
+    before = tracemalloc.get_traced_memory()[0]
+    tracemalloc.reset_peak()
+    encoder.encodeSolverData(push, aliases)
+    allocated += tracemalloc.get_traced_memory()[1] - before
+  tracemalloc.stop()
+  print("{:<28} {:>12.0f} bytes/message allocated".format("encode memory", allocated / count))
+
+def timeCall(name, function, *args):
+  """Report calls per second of function(*args), running for about 0.2s."""
+  count = 0
+  batch = 1
+  start = time.perf_counter()
+  elapsed = 0.0
+  while elapsed < 0.2:
+    for i in range(batch):
+      function(*args)
+    count += batch
+    batch *= 2
+    elapsed = time.perf_counter() - start
+  print("{:<28} {:>12.0f} messages/sec ({:.2f}us each)".format(name, count / elapsed, 1e6 * elapsed / count))
+
+def benchCodec(args):
+  """Encode and decode rates of each message type with grail_codec."""
+  origin16 = 'benchmark'.encode('utf-16-be')
+  rules = [aggregator_rules.AggrRule(1, [aggregator_rules.IDMask(i) for i in range(100)], 1000)
+           for j in range(10)]
+  subscription = memoryview(grail_codec.encodeSubscription(rules))[5:]
+  sample = memoryview(grail_codec.encodeSample(1, (0, 1), (0, 2), 3, -50.0, bytes(args.payload)))[5:]
+  type_info = [['type.{}'.format(i), i, False] for i in range(100)]
+  announce = memoryview(grail_codec.encodeTypeAnnounce(type_info, origin16))[5:]
+  requests = [transient_request.TransientRequest(i, ['object.{}.*'.format(j) for j in range(100)]) for i in range(10)]
+  transients = memoryview(grail_codec.encodeTransientRequests(grail_codec.WM_START_TRANSIENT, requests))[5:]
+  aliases = {'location.x': 0, 'location.y': 1}
+  pushes = [push[0] for push in makePushes(args, 100)]
+  solver_data = memoryview(grail_codec.encodeSolverData(pushes, aliases))[5:]
+  timeCall("encode subscription", grail_codec.encodeSubscription, rules)
+  timeCall("decode subscription", grail_codec.decodeSubscription, subscription)
+  timeCall("encode sample", grail_codec.encodeSample, 1, (0, 1), (0, 2), 3, -50.0, bytes(args.payload))
+  timeCall("decode sample", grail_codec.decodeSample, sample)
+  timeCall("encode type announce", grail_codec.encodeTypeAnnounce, type_info, origin16)
+  timeCall("decode type announce", grail_codec.decodeTypeAnnounce, announce)
+  timeCall("encode transient request", grail_codec.encodeTransientRequests, grail_codec.WM_START_TRANSIENT, requests)
+  timeCall("decode transient request", grail_codec.decodeTransientRequests, transients)
+  timeCall("encode solver data", grail_codec.encodeSolverData, pushes, aliases)
+  timeCall("decode solver data", grail_codec.decodeSolverData, solver_data)
+  timeCall("encode uri message", grail_codec.encodeURIMessage, grail_codec.WM_EXPIRE_URI, 'benchmark.object', origin16, 0)
+
+def main():
+  parser = argparse.ArgumentParser(description = "Benchmark the GRAIL solver clients against fake servers")
+  parser.add_argument('--samples', type = int, default = 100000, help = "samples or pushes per benchmark")
+  parser.add_argument('--devices', type = int, default = 1000, help = "distinct devices or objects")
+  parser.add_argument('--payload', type = int, default = 8, help = "sense data or attribute bytes")
+  parser.add_argument('--rate', type = int, default = 10000, help = "samples per second in the latency benchmark")
+  args = parser.parse_args()
+  benchCodec(args)
+  benchDecode(args)
+  benchBatchDecode(args)
+  benchLatency(args)
+  benchDecodeMemory(args)
+  benchEncode(args)
+  benchEncode(args, coalesce = True)
+  benchEncodeMemory(args)
+
+if __name__ == '__main__':
+  main()
@@ -22,13 +22,11 @@
 #
 ################################################################################
 
+import grail_codec
+
 def splitURIFromRest(buff):
   """Take in a buffer with a sized URI in UTF 16 format.
   Return the string that was at the beginning of the buffer and
   the rest of the buffer after the string"""
-  #The first four bytes are for the length of the string
-  strlen = struct.unpack('!L', buff[0:4])[0]
-  bstr = buff[4:4+strlen]
-  #Make another container for everything after the string
-  rest = buff[4+strlen:]
-  return bstr.decode('utf-16'), rest
+  string, offset = grail_codec.readSizedString(buff, 0)
+  return string, buff[offset:]
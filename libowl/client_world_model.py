@@ -0,0 +1,227 @@
+#This class abstracts the details of connecting to a
+#GRAIL3 world model as a client.
+#Clients request snapshots of the state of objects, ranges of their history,
+#and streams of their updates, and search for object URIs. The current state
+#seen in snapshots and streams is kept in an attribute_cache.AttributeCache
+#so that repeated reads of the same attributes are served from memory.
+
+import re
+import socket
+
+import attribute_cache
+import frame_reader
+import grail_codec
+import wm_data
+
+class ClientWorldModel:
+  #Message constants
+  KEEP_ALIVE        = grail_codec.CLIENT_KEEP_ALIVE
+  SNAPSHOT_REQUEST  = grail_codec.CLIENT_SNAPSHOT_REQUEST
+  RANGE_REQUEST     = grail_codec.CLIENT_RANGE_REQUEST
+  STREAM_REQUEST    = grail_codec.CLIENT_STREAM_REQUEST
+  ATTRIBUTE_ALIAS   = grail_codec.CLIENT_ATTRIBUTE_ALIAS
+  ORIGIN_ALIAS      = grail_codec.CLIENT_ORIGIN_ALIAS
+  REQUEST_COMPLETE  = grail_codec.CLIENT_REQUEST_COMPLETE
+  CANCEL_REQUEST    = grail_codec.CLIENT_CANCEL_REQUEST
+  DATA_RESPONSE     = grail_codec.CLIENT_DATA_RESPONSE
+  URI_SEARCH        = grail_codec.CLIENT_URI_SEARCH
+  URI_RESPONSE      = grail_codec.CLIENT_URI_RESPONSE
+  ORIGIN_PREFERENCE = grail_codec.CLIENT_ORIGIN_PREFERENCE
+  VER_STRING = "GRAIL client protocol"
+
+  def __init__(self, host, port, cache_size = 100000, cache_ttl = 10.0):
+    """Connect to the world model. Up to cache_size attributes of the current
+    state are cached, each for cache_ttl seconds (forever if None) unless a
+    stream updates it."""
+    self.connected = False
+    self.host = host
+    self.port = port
+    self.cache = attribute_cache.AttributeCache(cache_size, cache_ttl)
+    # Names of the aliases the world model uses in data responses
+    self.attribute_aliases = {}
+    self.origin_aliases = {}
+    self.next_ticket = 1
+    # Ticket -> WMData received for a request without a callback and not yet
+    # taken
+    self.results = {}
+    # Tickets of requests for the current state, whose data is cached
+    self.current = set()
+    # Ticket -> function called with each WMData of a stream
+    self.callbacks = {}
+    # Tickets of requests without a callback that completed and were not
+    # waited for yet
+    self.completed = set()
+    # URIs of the last search, until taken
+    self.uri_results = None
+    self.connect()
+
+  def connect(self):
+    """Connect to the world model and perform the handshake."""
+    self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    if self.socket is None:
+        raise RuntimeError("Unable to create client-world model socket!")
+    self.socket.connect((self.host, self.port))
+    handshake = grail_codec.makeHandshake(self.VER_STRING)
+    # Send and receive handshakes
+    self.socket.sendall(handshake)
+    inshake = frame_reader.recvExactly(self.socket, len(handshake))
+    if handshake != inshake:
+      self.socket.close()
+      raise RuntimeError("Client-World Model handshake error! Verify world model port and url.")
+    self.connected = True
+    self.reader = frame_reader.FrameReader(self.socket)
+
+  def close(self):
+    """Close this connection"""
+    self.socket.close()
+    self.connected = False
+
+  def handleMessage(self):
+    """Handle the next message and return its type, or None once the
+    connection closed."""
+    inbuff = self.reader.nextFrame()
+    if inbuff is None:
+      self.close()
+      print("Client World Model connection closed")
+      return None
+    # Empty messages carry no type and are skipped
+    if 0 == len(inbuff):
+      return self.KEEP_ALIVE
+    control = inbuff[0]
+    if self.DATA_RESPONSE == control:
+      self.decodeDataResponse(inbuff[1:])
+    elif self.ATTRIBUTE_ALIAS == control:
+      self.attribute_aliases.update(grail_codec.decodeAliases(inbuff[1:]))
+    elif self.ORIGIN_ALIAS == control:
+      self.origin_aliases.update(grail_codec.decodeAliases(inbuff[1:]))
+    elif self.REQUEST_COMPLETE == control:
+      ticket = grail_codec.decodeTicket(inbuff[1:])
+      self.current.discard(ticket)
+      # Requests with a callback are not waited for
+      if self.callbacks.pop(ticket, None) is None:
+        self.completed.add(ticket)
+    elif self.URI_RESPONSE == control:
+      self.uri_results = grail_codec.decodeURIResponse(inbuff[1:])
+    return control
+
+  def decodeDataResponse(self, inbuff):
+    """Decode a data response and store, cache, or pass on its WMData."""
+    uri, ticket, attributes = grail_codec.decodeDataResponse(inbuff)
+    wmdata = wm_data.WMData(uri, [], ticket)
+    for name_alias, creation, expiration, origin_alias, data in attributes:
+      name = self.attribute_aliases.get(name_alias, name_alias)
+      origin = self.origin_aliases.get(origin_alias, origin_alias)
+      wmdata.attributes.append(wm_data.WMAttribute(name, data, creation, expiration, origin))
+    if ticket in self.current:
+      for attr in wmdata.attributes:
+        # Expired attributes are no longer part of the current state
+        if 0 == attr.expiration:
+          self.cache.put(uri, attr)
+        else:
+          self.cache.invalidate(uri, attr.name)
+    callback = self.callbacks.get(ticket)
+    if callback is not None:
+      callback(wmdata)
+    else:
+      self.results.setdefault(ticket, []).append(wmdata)
+
+  def request(self, control, uri, attributes, start, stop, callback = None):
+    """Send a snapshot, range, or stream request and return its ticket."""
+    ticket = self.next_ticket
+    self.next_ticket = (self.next_ticket + 1) & 0xFFFFFFFF
+    if callback is None:
+      self.results[ticket] = []
+    else:
+      self.callbacks[ticket] = callback
+    # Snapshots of the current state and streams keep the cache up to date
+    if self.STREAM_REQUEST == control or (self.SNAPSHOT_REQUEST == control and 0 == stop):
+      self.current.add(ticket)
+    self.socket.sendall(grail_codec.encodeClientRequest(control, ticket, uri, attributes, start, stop))
+    return ticket
+
+  def snapshotRequest(self, uri, attributes, start = 0, stop = 0):
+    """Request the state at time stop (now if 0) of objects whose URIs match
+    the uri expression, with attributes matching any of the attribute
+    expressions, counting attributes created after start. Times are in
+    milliseconds since the epoch. Returns the request ticket."""
+    return self.request(self.SNAPSHOT_REQUEST, uri, attributes, start, stop)
+
+  def rangeRequest(self, uri, attributes, start, stop):
+    """Request every change between start and stop of matching objects.
+    Returns the request ticket."""
+    return self.request(self.RANGE_REQUEST, uri, attributes, start, stop)
+
+  def streamRequest(self, uri, attributes, interval, callback = None):
+    """Request updates of matching objects at most every interval
+    milliseconds until cancelled. Each update is passed to callback as a
+    WMData, or kept for takeResults without one. Returns the request
+    ticket."""
+    return self.request(self.STREAM_REQUEST, uri, attributes, 0, interval, callback)
+
+  def cancelRequest(self, ticket):
+    """Stop a stream or other pending request."""
+    self.socket.sendall(grail_codec.encodeTicket(self.CANCEL_REQUEST, ticket))
+
+  def takeResults(self, ticket):
+    """Return and forget the WMData received so far for a request."""
+    results = self.results.get(ticket, [])
+    if ticket in self.results:
+      self.results[ticket] = []
+    return results
+
+  def waitFor(self, ticket):
+    """Handle messages until a request completes and return its WMData."""
+    while ticket not in self.completed:
+      if self.handleMessage() is None:
+        raise ConnectionError("World model connection closed before the request completed")
+    self.completed.discard(ticket)
+    return self.results.pop(ticket, [])
+
+  def snapshot(self, uri, attributes, start = 0, stop = 0):
+    """Wait for a snapshot (see snapshotRequest) and return its WMData."""
+    return self.waitFor(self.snapshotRequest(uri, attributes, start, stop))
+
+  def range(self, uri, attributes, start, stop):
+    """Wait for a range request and return its WMData."""
+    return self.waitFor(self.rangeRequest(uri, attributes, start, stop))
+
+  def getAttributes(self, uri, names):
+    """Return the current WMAttributes of one object with the given names,
+    from the cache if all of them are cached and otherwise from a snapshot.
+    Attributes the object does not have are left out, and cached as absent
+    for the cache's time to live."""
+    cached = self.cache.getAll(uri, names)
+    if cached is not None:
+      return cached
+    found = {}
+    for wmdata in self.snapshot(re.escape(uri), [re.escape(name) for name in names]):
+      for attr in wmdata.attributes:
+        if 0 == attr.expiration:
+          found[attr.name] = attr
+    for name in names:
+      if name not in found:
+        # Remember that the object has no such attribute
+        self.cache.putMissing(uri, name)
+    return [found[name] for name in names if name in found]
+
+  def getAttribute(self, uri, name):
+    """Return one current WMAttribute of an object, or None if it has none
+    with that name."""
+    attributes = self.getAttributes(uri, [name])
+    return attributes[0] if attributes else None
+
+  def searchURIs(self, expression):
+    """Return the URIs of objects that match the expression."""
+    self.uri_results = None
+    self.socket.sendall(grail_codec.encodeURISearch(expression))
+    while self.uri_results is None:
+      if self.handleMessage() is None:
+        raise ConnectionError("World model connection closed before the search completed")
+    uris = self.uri_results
+    self.uri_results = None
+    return uris
+
+  def setOriginPreference(self, weights):
+    """Prefer data from some origins over others with a dictionary of origin
+    to weight. Origins with negative weights are ignored."""
+    self.socket.sendall(grail_codec.encodeOriginPreference(weights))
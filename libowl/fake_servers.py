@@ -0,0 +1,320 @@
+#In-process stand-ins for a GRAIL aggregator and world model.
+#The fake servers speak enough of the solver and client protocols to drive
+#the clients in this library without real servers: handshakes, subscription
+#responses, generated SERVER_SAMPLE streams, recording of the TYPE_ANNOUNCE
+#and SOLVER_DATA messages that solvers send, and answers to client queries.
+#Each runs on a background thread listening on localhost (on a free port
+#unless one is given).
+
+import re
+import socket
+import threading
+import time
+
+import client_world_model
+import frame_reader
+import grail_codec
+import solver_aggregator as sa
+import solver_world_model as swm
+import transient_request
+
+class SampleGenerator:
+  """Synthetic load of server samples from many devices."""
+  def __init__(self, devices = 100, receivers = 4, payload_size = 8, phy_layer = 1, start_time = 0):
+    self.devices = devices
+    self.receivers = receivers
+    self.payload_size = payload_size
+    self.phy_layer = phy_layer
+    # Sample timestamps start here and advance by one per sample
+    self.timestamp = start_time
+    self.sequence = 0
+
+  def frame(self, payload = None):
+    """Return the next server sample message with its length prefix. The
+    payload defaults to payload_size zero bytes."""
+    if payload is None:
+      payload = bytes(self.payload_size)
+    device = self.sequence % self.devices
+    receiver = (self.sequence // self.devices) % self.receivers
+    rssi = -40.0 - (self.sequence % 50)
+    frame = grail_codec.encodeSample(self.phy_layer, (0, device), (0, 1000 + receiver),
+        self.timestamp, rssi, payload)
+    self.sequence += 1
+    self.timestamp += 1
+    return frame
+
+  def frames(self, count):
+    """Return count server sample messages joined together."""
+    return b''.join(self.frame() for i in range(count))
+
+class FakeServer:
+  """Accepts connections on a background thread and serves each on its own
+  thread."""
+  def __init__(self, port = 0):
+    self.listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    self.listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    self.listener.bind(('127.0.0.1', port))
+    self.listener.listen()
+    self.host, self.port = self.listener.getsockname()
+    self.running = True
+    self.connections = []
+    self.lock = threading.Lock()
+    threading.Thread(target = self.acceptLoop, daemon = True).start()
+
+  def acceptLoop(self):
+    while self.running:
+      try:
+        conn, address = self.listener.accept()
+      except OSError:
+        return
+      with self.lock:
+        self.connections.append(conn)
+      threading.Thread(target = self.serveConnection, args = (conn,), daemon = True).start()
+
+  def serveConnection(self, conn):
+    try:
+      self.serve(conn)
+    except OSError:
+      pass
+    finally:
+      conn.close()
+
+  def disconnectAll(self):
+    """Drop every client connection, as a server restart would."""
+    with self.lock:
+      for conn in self.connections:
+        try:
+          conn.shutdown(socket.SHUT_RDWR)
+        except OSError:
+          pass
+      self.connections = []
+
+  def close(self):
+    self.running = False
+    self.listener.close()
+    self.disconnectAll()
+
+class FakeAggregator(FakeServer):
+  def __init__(self, port = 0, generator = None, rate = None, total = None):
+    """Serve samples from generator (a default SampleGenerator if None) to
+    every subscribed solver, at rate samples per second (as fast as possible
+    if None), stopping after total samples if given."""
+    self.generator = generator if generator is not None else SampleGenerator()
+    self.rate = rate
+    self.total = total
+    self.subscriptions = 0
+    FakeServer.__init__(self, port)
+
+  def serve(self, conn):
+    handshake = grail_codec.makeHandshake(sa.SolverAggregator.VER_STRING)
+    conn.sendall(handshake)
+    if handshake != frame_reader.recvExactly(conn, len(handshake)):
+      return
+    reader = frame_reader.FrameReader(conn)
+    # Wait for a subscription, ignoring keep alives
+    frame = reader.nextFrame()
+    while frame is not None and (0 == len(frame) or sa.SolverAggregator.SUBSCRIPTION_REQUEST != frame[0]):
+      frame = reader.nextFrame()
+    if frame is None:
+      return
+    # Accept every requested rule
+    rules = grail_codec.decodeSubscription(frame[1:])
+    with self.lock:
+      self.subscriptions += 1
+    conn.sendall(grail_codec.encodeSubscription(rules, sa.SolverAggregator.SUBSCRIPTION_RESPONSE))
+    self.sendSamples(conn)
+
+  def sendSamples(self, conn):
+    sent = 0
+    start = time.monotonic()
+    while self.running and (self.total is None or sent < self.total):
+      count = 256
+      if self.total is not None:
+        count = min(count, self.total - sent)
+      if self.rate is not None:
+        # Send whatever is due, at least one sample at a time
+        due = int((time.monotonic() - start) * self.rate) - sent
+        if due <= 0:
+          time.sleep(min(0.01, 1.0 / self.rate))
+          continue
+        count = min(count, due)
+      with self.lock:
+        data = self.generator.frames(count)
+      conn.sendall(data)
+      sent += count
+    # Let the client read everything before the connection closes
+    conn.shutdown(socket.SHUT_WR)
+    while conn.recv(4096):
+      pass
+
+class FakeWorldModel(FakeServer):
+  def __init__(self, port = 0):
+    """Record the messages solvers send."""
+    self.messages = {}
+    # Type of every message received, in order
+    self.controls = []
+    self.bytes_received = 0
+    self.attributes = 0
+    self.type_names = {}
+    # (uri, attribute name) of every solution received, in order
+    self.solutions = []
+    # (type, uri, attribute alias or None, timestamp) of expire messages
+    self.expirations = []
+    self.received = threading.Condition()
+    self.clients = []
+    FakeServer.__init__(self, port)
+
+  def serve(self, conn):
+    handshake = grail_codec.makeHandshake(swm.SolverWorldModel.VER_STRING)
+    conn.sendall(handshake)
+    if handshake != frame_reader.recvExactly(conn, len(handshake)):
+      return
+    with self.lock:
+      self.clients.append(conn)
+    with self.received:
+      self.received.notify_all()
+    try:
+      reader = frame_reader.FrameReader(conn)
+      frame = reader.nextFrame()
+      while frame is not None:
+        self.record(frame)
+        frame = reader.nextFrame()
+    finally:
+      with self.lock:
+        if conn in self.clients:
+          self.clients.remove(conn)
+
+  def record(self, frame):
+    with self.received:
+      self.bytes_received += 4 + len(frame)
+      if 0 < len(frame):
+        control = frame[0]
+        self.messages[control] = self.messages.get(control, 0) + 1
+        self.controls.append(control)
+        if swm.SolverWorldModel.SOLVER_DATA == control:
+          self.attributes += grail_codec.DATA_FLAGS.unpack_from(frame, 1)[1]
+          create_uris, wmdata_vector = grail_codec.decodeSolverData(frame[1:], self.type_names)
+          self.solutions.extend((wmdata.uri, attr.name) for wmdata in wmdata_vector for attr in wmdata.attributes)
+        elif swm.SolverWorldModel.TYPE_ANNOUNCE == control:
+          self.recordTypes(frame)
+        elif swm.SolverWorldModel.EXPIRE_URI == control:
+          uri, timestamp, origin = grail_codec.decodeURIMessage(control, frame[1:])
+          self.expirations.append((control, uri, None, timestamp))
+        elif swm.SolverWorldModel.EXPIRE_ATTRIBUTE == control:
+          uri, alias, timestamp, origin = grail_codec.decodeAttributeMessage(control, frame[1:])
+          self.expirations.append((control, uri, alias, timestamp))
+      self.received.notify_all()
+
+  def recordTypes(self, frame):
+    type_info, origin = grail_codec.decodeTypeAnnounce(frame[1:])
+    for name, alias, transient in type_info:
+      self.type_names[alias] = name
+
+  def count(self, control):
+    with self.received:
+      return self.messages.get(control, 0)
+
+  def waitForAttributes(self, total, timeout = 10):
+    """Wait until total attributes have arrived. Returns True if they did."""
+    with self.received:
+      return self.received.wait_for(lambda: self.attributes >= total, timeout)
+
+  def disconnectAll(self):
+    with self.lock:
+      self.clients = []
+    FakeServer.disconnectAll(self)
+
+  def waitForMessages(self, control, total, timeout = 10):
+    """Wait until total messages of a type have arrived. Returns True if
+    they did."""
+    with self.received:
+      return self.received.wait_for(lambda: self.messages.get(control, 0) >= total, timeout)
+
+  def waitForClients(self, count, timeout = 10):
+    """Wait until count solvers are connected. Returns True if they are."""
+    with self.received:
+      return self.received.wait_for(lambda: len(self.clients) >= count, timeout)
+
+  def requestTransient(self, control, requests):
+    """Send a start or stop transient message to every client. requests is
+    a list of (type alias, [name expressions]) pairs."""
+    message = grail_codec.encodeTransientRequests(control,
+        [transient_request.TransientRequest(alias, expressions) for alias, expressions in requests])
+    with self.lock:
+      for conn in self.clients:
+        conn.sendall(message)
+
+class FakeClientWorldModel(FakeServer):
+  def __init__(self, port = 0, objects = None):
+    """Answer client requests from objects, a dictionary of URI to a list of
+    WMAttributes. Streams get every attribute passed to publish."""
+    self.objects = objects if objects is not None else {}
+    self.requests = 0
+    self.streams = []
+    FakeServer.__init__(self, port)
+
+  def serve(self, conn):
+    handshake = grail_codec.makeHandshake(client_world_model.ClientWorldModel.VER_STRING)
+    conn.sendall(handshake)
+    if handshake != frame_reader.recvExactly(conn, len(handshake)):
+      return
+    reader = frame_reader.FrameReader(conn)
+    frame = reader.nextFrame()
+    while frame is not None:
+      if 0 < len(frame):
+        self.handleRequest(conn, frame[0], frame[1:])
+      frame = reader.nextFrame()
+
+  def matches(self, uri, attributes):
+    """Attributes of matching objects as (uri, [WMAttribute]) pairs."""
+    found = []
+    with self.lock:
+      for obj_uri, obj_attributes in self.objects.items():
+        if re.fullmatch(uri, obj_uri):
+          found.append((obj_uri, [attr for attr in obj_attributes
+                                  if any(re.fullmatch(name, attr.name) for name in attributes)]))
+    return found
+
+  def sendData(self, conn, ticket, uri, attributes):
+    """Send the aliases and a data response for the attributes."""
+    names = sorted(set(attr.name for attr in attributes))
+    origins = sorted(set(attr.origin for attr in attributes))
+    conn.sendall(grail_codec.encodeAliases(grail_codec.CLIENT_ATTRIBUTE_ALIAS, list(enumerate(names))) +
+        grail_codec.encodeAliases(grail_codec.CLIENT_ORIGIN_ALIAS, list(enumerate(origins))) +
+        grail_codec.encodeDataResponse(uri, ticket,
+            [(names.index(attr.name), attr.creation, attr.expiration, origins.index(attr.origin), attr.data)
+             for attr in attributes]))
+
+  def handleRequest(self, conn, control, inbuff):
+    if control in (grail_codec.CLIENT_SNAPSHOT_REQUEST, grail_codec.CLIENT_RANGE_REQUEST,
+                   grail_codec.CLIENT_STREAM_REQUEST):
+      ticket, uri, attributes, start, stop = grail_codec.decodeClientRequest(inbuff)
+      with self.lock:
+        self.requests += 1
+        if grail_codec.CLIENT_STREAM_REQUEST == control:
+          self.streams.append((conn, ticket, uri, attributes))
+      for obj_uri, obj_attributes in self.matches(uri, attributes):
+        if obj_attributes:
+          self.sendData(conn, ticket, obj_uri, obj_attributes)
+      if grail_codec.CLIENT_STREAM_REQUEST != control:
+        conn.sendall(grail_codec.encodeTicket(grail_codec.CLIENT_REQUEST_COMPLETE, ticket))
+    elif grail_codec.CLIENT_CANCEL_REQUEST == control:
+      ticket = grail_codec.decodeTicket(inbuff)
+      with self.lock:
+        self.streams = [stream for stream in self.streams if stream[0] is not conn or stream[1] != ticket]
+      conn.sendall(grail_codec.encodeTicket(grail_codec.CLIENT_REQUEST_COMPLETE, ticket))
+    elif grail_codec.CLIENT_URI_SEARCH == control:
+      expression = grail_codec.decodeURISearch(inbuff)
+      with self.lock:
+        uris = [uri for uri in self.objects if re.fullmatch(expression, uri)]
+      conn.sendall(grail_codec.encodeURIResponse(uris))
+
+  def publish(self, uri, attr):
+    """Update an attribute of an object and send it to matching streams."""
+    with self.lock:
+      attributes = [old for old in self.objects.setdefault(uri, []) if old.name != attr.name]
+      self.objects[uri] = attributes + [attr]
+      streams = list(self.streams)
+    for conn, ticket, uri_exp, attr_exps in streams:
+      if re.fullmatch(uri_exp, uri) and any(re.fullmatch(name, attr.name) for name in attr_exps):
+        self.sendData(conn, ticket, uri, [attr])
@@ -0,0 +1,156 @@
+#Capture and replay of raw GRAIL aggregator messages.
+#A FrameRecorder appends every received message, with its length prefix, to
+#a capture file and writes a sidecar index of sample timestamps to file
+#offsets. A FrameReplay memory maps the capture and serves the messages to
+#a SolverAggregator (through its source argument) as if they had come from
+#an aggregator, as fast as possible or paced by the sample timestamps.
+
+import bisect
+import mmap
+import os
+import struct
+import time
+
+_LENGTH = struct.Struct('!L')
+#Sample timestamp and the file offset of its message
+_INDEX_ENTRY = struct.Struct('!QQ')
+#Message type and timestamp offsets in a server sample message
+_SERVER_SAMPLE = 6
+_TIMESTAMP = struct.Struct('!Q')
+_TIMESTAMP_OFFSET = 34
+
+def indexPath(path):
+  return path + '.idx'
+
+def sampleTimestamp(frame):
+  """The timestamp of a server sample message, or None for other messages."""
+  if len(frame) >= _TIMESTAMP_OFFSET + 8 and _SERVER_SAMPLE == frame[0]:
+    return _TIMESTAMP.unpack_from(frame, _TIMESTAMP_OFFSET)[0]
+  return None
+
+class FrameRecorder:
+  def __init__(self, path, index_interval = 1000):
+    """Append messages to the capture at path. An index entry is written
+    for the first sample at least index_interval timestamp units
+    (milliseconds for GRAIL) after the previously indexed one."""
+    self.data = open(path, 'ab')
+    self.index = open(indexPath(path), 'ab')
+    self.index_interval = index_interval
+    self.last_indexed = None
+    self.frames = 0
+
+  def record(self, frame):
+    """Append one message, given without its length prefix."""
+    timestamp = sampleTimestamp(frame)
+    if timestamp is not None and (self.last_indexed is None or
+        timestamp >= self.last_indexed + self.index_interval):
+      self.index.write(_INDEX_ENTRY.pack(timestamp, self.data.tell()))
+      self.last_indexed = timestamp
+    self.data.write(_LENGTH.pack(len(frame)))
+    self.data.write(frame)
+    self.frames += 1
+
+  def flush(self):
+    self.data.flush()
+    self.index.flush()
+
+  def close(self):
+    self.data.close()
+    self.index.close()
+
+class FrameReplay:
+  def __init__(self, path, speed = None, units_per_second = 1000):
+    """Replay the capture at path. Messages are served as fast as possible
+    if speed is None, otherwise sample messages are delayed to match their
+    timestamps (units_per_second per second) multiplied by speed."""
+    self.file = open(path, 'rb')
+    # Empty files cannot be mapped, as when nothing was recorded
+    if 0 == os.fstat(self.file.fileno()).st_size:
+      self.data = b''
+    else:
+      self.data = mmap.mmap(self.file.fileno(), 0, access = mmap.ACCESS_READ)
+    self.view = memoryview(self.data)
+    self.offset = 0
+    self.speed = speed
+    self.units_per_second = units_per_second
+    # Wall clock time and sample timestamp that pacing is measured from
+    self.start_time = None
+    self.start_timestamp = None
+    self.timestamps = []
+    self.offsets = []
+    try:
+      with open(indexPath(path), 'rb') as index:
+        entries = index.read()
+      for timestamp, offset in _INDEX_ENTRY.iter_unpack(entries[:len(entries) - len(entries) % _INDEX_ENTRY.size]):
+        self.timestamps.append(timestamp)
+        self.offsets.append(offset)
+    except FileNotFoundError:
+      pass
+
+  def close(self):
+    """Release the capture. Frames returned earlier must no longer be used."""
+    self.view.release()
+    if isinstance(self.data, mmap.mmap):
+      self.data.close()
+    self.file.close()
+
+  def popFrame(self):
+    """Return the next message without its length prefix, or None at the end
+    of the capture."""
+    if self.offset + 4 > len(self.data):
+      return None
+    length = _LENGTH.unpack_from(self.data, self.offset)[0]
+    start = self.offset + 4
+    if start + length > len(self.data):
+      # Truncated final message
+      return None
+    self.offset = start + length
+    return self.view[start:start + length]
+
+  def nextFrame(self):
+    """Return the next message, waiting first if replay is paced."""
+    frame = self.popFrame()
+    if frame is not None and self.speed is not None:
+      timestamp = sampleTimestamp(frame)
+      if timestamp is not None:
+        self.pace(timestamp)
+    return frame
+
+  def pace(self, timestamp):
+    now = time.monotonic()
+    if self.start_time is None:
+      self.start_time = now
+      self.start_timestamp = timestamp
+      return
+    due = self.start_time + (timestamp - self.start_timestamp) / (self.units_per_second * self.speed)
+    if due > now:
+      time.sleep(due - now)
+
+  def readFrames(self):
+    """Return the next message in a list, or an empty list at the end."""
+    frame = self.nextFrame()
+    if frame is None:
+      return []
+    return [frame]
+
+  def seek(self, timestamp):
+    """Move to the first sample message with a timestamp of at least
+    timestamp. Pacing restarts from there."""
+    position = bisect.bisect_right(self.timestamps, timestamp) - 1
+    self.offset = self.offsets[position] if 0 <= position else 0
+    self.start_time = None
+    while True:
+      start = self.offset
+      frame = self.popFrame()
+      if frame is None:
+        return
+      frame_time = sampleTimestamp(frame)
+      if frame_time is not None and frame_time >= timestamp:
+        self.offset = start
+        return
+
+  def __iter__(self):
+    frame = self.nextFrame()
+    while frame is not None:
+      yield frame
+      frame = self.nextFrame()
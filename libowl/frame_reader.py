@@ -0,0 +1,118 @@
+#Length-prefixed frame reader shared by the GRAIL solver clients.
+#GRAIL messages are a four byte big endian length followed by the message.
+#The reader receives directly into a reusable buffer and hands out
+#memoryview slices so that decoding does not copy the message bytes.
+
+import struct
+
+_LENGTH = struct.Struct('!L')
+#Largest number of buffers passed to a single sendmsg call
+_MAX_BUFFERS = 1024
+
+def recvExactly(sock, size):
+  """Receive exactly size bytes from the socket, looping over short reads.
+  Returns fewer bytes only if the connection was closed."""
+  buff = bytearray(size)
+  view = memoryview(buff)
+  got = 0
+  while got < size:
+    count = sock.recv_into(view[got:])
+    if 0 == count:
+      break
+    got += count
+  return bytes(buff[:got])
+
+def sendBuffers(sock, buffers):
+  """Send a list of buffers with scatter-gather sendmsg calls, continuing
+  after partial sends until every byte has been written."""
+  buffers = [memoryview(buff).cast('B') for buff in buffers if 0 < len(buff)]
+  first = 0
+  while first < len(buffers):
+    # Stay within the operating system's limit on buffers per call
+    sent = sock.sendmsg(buffers[first:first + _MAX_BUFFERS])
+    while first < len(buffers) and sent >= len(buffers[first]):
+      sent -= len(buffers[first])
+      first += 1
+    if 0 < sent:
+      buffers[first] = buffers[first][sent:]
+
+class FrameReader:
+  """Read complete GRAIL frames from a socket.
+
+  Frames are returned as memoryview slices of the internal buffer without
+  the length prefix. A frame is only valid until the next call that reads
+  from the socket, so callers must copy any bytes they want to keep."""
+
+  def __init__(self, sock, initial_size = 65536):
+    self.socket = sock
+    self.buff = bytearray(initial_size)
+    self.view = memoryview(self.buff)
+    # Unconsumed data lies in buff[start:end]
+    self.start = 0
+    self.end = 0
+
+  def popFrame(self):
+    """Return the next complete frame that is already buffered, or None."""
+    available = self.end - self.start
+    if available < 4:
+      return None
+    length = _LENGTH.unpack_from(self.buff, self.start)[0]
+    if available < 4 + length:
+      return None
+    frame = self.view[self.start + 4:self.start + 4 + length]
+    self.start += 4 + length
+    return frame
+
+  def bufferedFrames(self):
+    """Yield every complete frame already buffered without touching the
+    socket."""
+    frame = self.popFrame()
+    while frame is not None:
+      yield frame
+      frame = self.popFrame()
+
+  def fill(self):
+    """Make room in the buffer and perform a single receive.
+    Returns the number of bytes read, which is 0 when the connection closed.
+    Invalidates all frames previously returned."""
+    pending = self.end - self.start
+    # Move the partial frame to the front of the buffer
+    if 0 < self.start:
+      if 0 < pending:
+        self.buff[0:pending] = self.buff[self.start:self.end]
+      self.start = 0
+      self.end = pending
+    # Grow the buffer if the next frame will not fit into it
+    needed = len(self.buff)
+    if pending >= 4:
+      needed = max(needed, 4 + _LENGTH.unpack_from(self.buff, 0)[0])
+    if self.end == len(self.buff) or needed > len(self.buff):
+      # Exported memoryviews prevent resizing in place so allocate anew
+      new_buff = bytearray(max(needed, 2 * len(self.buff)))
+      new_buff[0:pending] = self.buff[0:pending]
+      self.buff = new_buff
+      self.view = memoryview(self.buff)
+    count = self.socket.recv_into(self.view[self.end:])
+    self.end += count
+    return count
+
+  def nextFrame(self):
+    """Return the next frame, blocking until one is complete.
+    Returns None if the connection closed."""
+    frame = self.popFrame()
+    while frame is None:
+      if 0 == self.fill():
+        return None
+      frame = self.popFrame()
+    return frame
+
+  def readFrames(self):
+    """Block until at least one frame is available and then return every
+    complete frame that arrived with it. Returns an empty list if the
+    connection closed."""
+    frames = list(self.bufferedFrames())
+    while 0 == len(frames):
+      if 0 == self.fill():
+        return frames
+      frames = list(self.bufferedFrames())
+    return frames
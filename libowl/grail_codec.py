@@ -0,0 +1,559 @@
+#Encoders and decoders for the messages of the GRAIL solver and client
+#protocols. Solvers speak the aggregator protocol (subscriptions and server
+#samples) and the world model protocol (type announcements, transient
+#requests, solver data, and URI changes), and clients query the world model
+#with the client protocol (requests, aliases, and data responses). Every
+#message is a four byte length, a one byte message type, and a payload.
+#Encoders size each message up front and write it into one buffer with
+#precompiled structs, returning it with its length prefix. Decoders take the
+#payload without the message type and read it by offset with unpack_from, so
+#they accept a memoryview of a receive buffer and take time linear in the
+#message size. Malformed payloads raise struct.error (or UnicodeDecodeError
+#for bad strings).
+
+import struct
+
+import aggregator_rules
+import transient_request
+import wm_data
+
+#Aggregator message types
+AGGR_KEEP_ALIVE            = 0
+AGGR_SUBSCRIPTION_REQUEST  = 3
+AGGR_SUBSCRIPTION_RESPONSE = 4
+AGGR_SERVER_SAMPLE         = 6
+AGGR_BUFFER_OVERRUN        = 7
+
+#World model message types
+WM_KEEP_ALIVE       = 0
+WM_TYPE_ANNOUNCE    = 1
+WM_START_TRANSIENT  = 2
+WM_STOP_TRANSIENT   = 3
+WM_SOLVER_DATA      = 4
+WM_CREATE_URI       = 5
+WM_EXPIRE_URI       = 6
+WM_DELETE_URI       = 7
+WM_EXPIRE_ATTRIBUTE = 8
+WM_DELETE_ATTRIBUTE = 9
+
+#World model client message types
+CLIENT_KEEP_ALIVE        = 0
+CLIENT_SNAPSHOT_REQUEST  = 1
+CLIENT_RANGE_REQUEST     = 2
+CLIENT_STREAM_REQUEST    = 3
+CLIENT_ATTRIBUTE_ALIAS   = 4
+CLIENT_ORIGIN_ALIAS      = 5
+CLIENT_REQUEST_COMPLETE  = 6
+CLIENT_CANCEL_REQUEST    = 7
+CLIENT_DATA_RESPONSE     = 8
+CLIENT_URI_SEARCH        = 9
+CLIENT_URI_RESPONSE      = 10
+CLIENT_ORIGIN_PREFERENCE = 11
+
+LENGTH = struct.Struct('!L')
+#Message length and type
+HEADER = struct.Struct('!LB')
+TIME = struct.Struct('!Q')
+FLAG = struct.Struct('!B')
+#Physical layer and number of transmitter/mask pairs of a rule
+RULE_HEADER = struct.Struct('!BL')
+#Physical layer, transmitter high and low, receiver high and low, timestamp,
+#and rssi of a server sample
+SAMPLE_HEADER = struct.Struct('!BQQQQQf')
+#Message length, type, create URI flag, and number of attributes
+DATA_HEADER = struct.Struct('!LBBL')
+#Create URI flag and number of attributes
+DATA_FLAGS = struct.Struct('!BL')
+#Attribute alias, creation time, and URI length
+ATTR_HEADER = struct.Struct('!LQL')
+#Alias and name length of an announced type
+TYPE_HEADER = struct.Struct('!LL')
+#Alias and number of expressions of a transient request
+TRANSIENT_HEADER = struct.Struct('!LL')
+#Start time and stop time (or update interval for streams) of a request
+REQUEST_TIMES = struct.Struct('!QQ')
+#Message length, type, and ticket
+TICKET_HEADER = struct.Struct('!LBL')
+#Attribute alias, creation time, expiration time, origin alias, and data
+#length of an attribute in a data response
+CLIENT_ATTR_HEADER = struct.Struct('!LQQLL')
+#Origin preference weight
+WEIGHT = struct.Struct('!l')
+#Bytes of one transmitter id and mask pair
+TXER_SIZE = 32
+
+def encodeUTF16(string):
+  return string.encode('utf-16-be')
+
+def makeHandshake(ver_string):
+  """The handshake is the length of the message, the protocol string, and
+  the version (0)."""
+  return LENGTH.pack(len(ver_string)) + ver_string.encode('utf-8') + b'\x00\x00'
+
+def encodeKeepAlive(control = AGGR_KEEP_ALIVE):
+  """Encode a keep alive message, which has no payload."""
+  return HEADER.pack(1, control)
+
+def readSizedString(buff, offset):
+  """Read a sized UTF 16 string starting at offset in the buffer without
+  copying the remainder of the buffer.
+  Return the string and the offset of the first byte after it"""
+  strlen = LENGTH.unpack_from(buff, offset)[0]
+  start = offset + 4
+  if start + strlen > len(buff):
+    raise struct.error("Sized string runs past the end of the message")
+  return str(buff[start:start + strlen], 'utf-16-be'), start + strlen
+
+def txerBytes(txer):
+  """The 32 id and mask bytes of an aggregator_rules.IDMask, or the bytes
+  themselves as decoded from a subscription."""
+  if isinstance(txer, (bytes, bytearray, memoryview)):
+    return txer
+  return txer.id + txer.mask
+
+def encodeSubscription(rules, control = AGGR_SUBSCRIPTION_REQUEST):
+  """Encode a subscription request (or response) for the given AggrRules,
+  prepended with the message length."""
+  size = 5 + sum(13 + TXER_SIZE * len(rule.txers) for rule in rules)
+  buff = bytearray(4 + size)
+  HEADER.pack_into(buff, 0, size, control)
+  LENGTH.pack_into(buff, 5, len(rules))
+  offset = 9
+  for rule in rules:
+    RULE_HEADER.pack_into(buff, offset, rule.phy_layer, len(rule.txers))
+    offset += 5
+    # Push each transmitter/mask pair
+    for txer in rule.txers:
+      buff[offset:offset + TXER_SIZE] = txerBytes(txer)
+      offset += TXER_SIZE
+    TIME.pack_into(buff, offset, rule.update_interval)
+    offset += 8
+  return buff
+
+def decodeSubscription(inbuff):
+  """Decode the rules of a subscription request or response (without its
+  message type) into a list of AggrRules whose transmitters are the 32 id
+  and mask bytes of each pair."""
+  num_rules = LENGTH.unpack_from(inbuff, 0)[0]
+  offset = 4
+  rules = []
+  for i in range(num_rules):
+    phy_layer, num_txers = RULE_HEADER.unpack_from(inbuff, offset)
+    offset += 5
+    end = offset + TXER_SIZE * num_txers
+    if end > len(inbuff):
+      raise struct.error("Subscription rule runs past the end of the message")
+    # Copy since the frame buffer is reused
+    txlist = [bytes(inbuff[start:start + TXER_SIZE]) for start in range(offset, end, TXER_SIZE)]
+    offset = end
+    update_interval = TIME.unpack_from(inbuff, offset)[0]
+    offset += 8
+    rules.append(aggregator_rules.AggrRule(phy_layer, txlist, update_interval))
+  return rules
+
+def encodeSample(phy_layer, txid, rxid, timestamp, rssi, sense_data = b''):
+  """Encode a server sample message, prepended with the message length.
+  The ids are (high, low) pairs of 64 bit values."""
+  size = 1 + SAMPLE_HEADER.size + len(sense_data)
+  buff = bytearray(4 + size)
+  HEADER.pack_into(buff, 0, size, AGGR_SERVER_SAMPLE)
+  SAMPLE_HEADER.pack_into(buff, 5, phy_layer, txid[0], txid[1], rxid[0], rxid[1], timestamp, rssi)
+  buff[5 + SAMPLE_HEADER.size:] = sense_data
+  return buff
+
+def decodeSample(inbuff):
+  """Unpack a server sample (without its message type) into the physical
+  layer, transmitter id, receiver id, timestamp, rssi, and sense data.
+  Returns None for an empty message."""
+  if (0 == len(inbuff)):
+    return None
+  phy_layer, tx_hi, tx_lo, rx_hi, rx_lo, timestamp, rssi = SAMPLE_HEADER.unpack_from(inbuff, 0)
+  # Copy since the frame buffer is reused
+  return phy_layer, (tx_hi, tx_lo), (rx_hi, rx_lo), timestamp, rssi, bytes(inbuff[SAMPLE_HEADER.size:])
+
+def encodeTypeAnnounce(type_info, origin16, encode_string = encodeUTF16):
+  """Encode a type announcement of [name, alias, transient] entries from
+  the origin with the given UTF-16 encoding, prepended with the message
+  length."""
+  names = [encode_string(info[0]) for info in type_info]
+  size = 5 + sum(9 + len(name16) for name16 in names) + len(origin16)
+  buff = bytearray(4 + size)
+  HEADER.pack_into(buff, 0, size, WM_TYPE_ANNOUNCE)
+  LENGTH.pack_into(buff, 5, len(type_info))
+  offset = 9
+  for info, name16 in zip(type_info, names):
+    # Pack the alias number, name as utf 16, and transient status
+    TYPE_HEADER.pack_into(buff, offset, info[1], len(name16))
+    offset += 8
+    buff[offset:offset + len(name16)] = name16
+    offset += len(name16)
+    FLAG.pack_into(buff, offset, info[2])
+    offset += 1
+  #Add the origin string to the end of the message
+  buff[offset:] = origin16
+  return buff
+
+def decodeTypeAnnounce(inbuff):
+  """Decode a type announcement (without its message type) into a list of
+  [name, alias, transient] entries and the origin."""
+  count = LENGTH.unpack_from(inbuff, 0)[0]
+  offset = 4
+  type_info = []
+  for i in range(count):
+    alias, namelen = TYPE_HEADER.unpack_from(inbuff, offset)
+    offset += 8
+    if offset + namelen > len(inbuff):
+      raise struct.error("Type name runs past the end of the message")
+    name = str(inbuff[offset:offset + namelen], 'utf-16-be')
+    offset += namelen
+    transient = FLAG.unpack_from(inbuff, offset)[0]
+    offset += 1
+    type_info.append([name, alias, bool(transient)])
+  return type_info, str(inbuff[offset:], 'utf-16-be')
+
+def encodeTransientRequests(control, requests):
+  """Encode a start or stop transient message for a list of
+  TransientRequests, prepended with the message length."""
+  expressions = [[exp.encode('utf-16-be') for exp in request.expressions] for request in requests]
+  size = 5 + sum(8 + sum(4 + len(exp16) for exp16 in exps) for exps in expressions)
+  buff = bytearray(4 + size)
+  HEADER.pack_into(buff, 0, size, control)
+  LENGTH.pack_into(buff, 5, len(requests))
+  offset = 9
+  for request, exps in zip(requests, expressions):
+    TRANSIENT_HEADER.pack_into(buff, offset, request.name, len(exps))
+    offset += 8
+    for exp16 in exps:
+      LENGTH.pack_into(buff, offset, len(exp16))
+      offset += 4
+      buff[offset:offset + len(exp16)] = exp16
+      offset += len(exp16)
+  return buff
+
+def decodeTransientRequests(inbuff):
+  """Decode a start or stop transient message (without its message type)
+  into a list of TransientRequests"""
+  num_aliases = LENGTH.unpack_from(inbuff, 0)[0]
+  offset = 4
+  new_trans_requests = []
+  for i in range(num_aliases):
+    type_alias, total_expressions = TRANSIENT_HEADER.unpack_from(inbuff, offset)
+    offset += 8
+    t_request = transient_request.TransientRequest(type_alias, [])
+    for j in range(total_expressions):
+      exp, offset = readSizedString(inbuff, offset)
+      t_request.expressions.append(exp)
+    new_trans_requests.append(t_request)
+  return new_trans_requests
+
+def encodeAttributes(wmdata_vector, name_to_alias, reserve = 0, encode_string = encodeUTF16):
+  """Encode the attributes of the WMData objects as they appear in a
+  solver data message, after reserve unused bytes. Returns the buffer and
+  the number of attributes. Every attribute name must already have an
+  alias."""
+  uris = []
+  size = reserve
+  total_solns = 0
+  for wmdata in wmdata_vector:
+    # Each URI is encoded once no matter how many attributes it has
+    uri16 = encode_string(wmdata.uri)
+    uris.append(uri16)
+    for attr in wmdata.attributes:
+      size += 20 + len(uri16) + len(attr.data)
+    total_solns += len(wmdata.attributes)
+  buff = bytearray(size)
+  offset = reserve
+  for wmdata, uri16 in zip(wmdata_vector, uris):
+    urilen = len(uri16)
+    for attr in wmdata.attributes:
+      ATTR_HEADER.pack_into(buff, offset, name_to_alias[attr.name], int(attr.creation), urilen)
+      offset += 16
+      buff[offset:offset + urilen] = uri16
+      offset += urilen
+      datalen = len(attr.data)
+      LENGTH.pack_into(buff, offset, datalen)
+      offset += 4
+      buff[offset:offset + datalen] = attr.data
+      offset += datalen
+  return buff, total_solns
+
+def encodeSolverDataHeader(attributes_size, total_solns, create_uris = False):
+  """Encode the length prefix and header of a solver data message holding
+  total_solns attributes that take attributes_size bytes."""
+  return DATA_HEADER.pack(6 + attributes_size, WM_SOLVER_DATA, create_uris, total_solns)
+
+def encodeSolverData(wmdata_vector, name_to_alias, create_uris = False, encode_string = encodeUTF16):
+  """Encode a solver data message, prepended with the message length.
+  Every attribute name must already have an alias."""
+  buff, total_solns = encodeAttributes(wmdata_vector, name_to_alias, DATA_HEADER.size, encode_string)
+  DATA_HEADER.pack_into(buff, 0, len(buff) - 4, WM_SOLVER_DATA, create_uris, total_solns)
+  return buff
+
+def decodeSolverData(inbuff, alias_to_name = None):
+  """Decode a solver data message (without its message type) into the
+  create URI flag and a list of WMData, one for each run of attributes with
+  the same URI. Attribute names are looked up in alias_to_name if given and
+  are the aliases otherwise."""
+  create_uris, total_solns = DATA_FLAGS.unpack_from(inbuff, 0)
+  offset = 5
+  result = []
+  for i in range(total_solns):
+    alias, creation, urilen = ATTR_HEADER.unpack_from(inbuff, offset)
+    offset += 16
+    if offset + urilen > len(inbuff):
+      raise struct.error("URI runs past the end of the message")
+    uri = str(inbuff[offset:offset + urilen], 'utf-16-be')
+    offset += urilen
+    datalen = LENGTH.unpack_from(inbuff, offset)[0]
+    offset += 4
+    if offset + datalen > len(inbuff):
+      raise struct.error("Attribute data runs past the end of the message")
+    # Copy since the frame buffer is reused
+    data = bytes(inbuff[offset:offset + datalen])
+    offset += datalen
+    name = alias if alias_to_name is None else alias_to_name[alias]
+    attr = wm_data.WMAttribute(name, data, creation)
+    if result and result[-1].uri == uri:
+      result[-1].attributes.append(attr)
+    else:
+      result.append(wm_data.WMData(uri, [attr]))
+  return bool(create_uris), result
+
+def encodeURIMessage(control, uri, origin16, timestamp = None, encode_string = encodeUTF16):
+  """Encode a create, expire, or delete URI message from the origin with
+  the given UTF-16 encoding, prepended with the message length. Delete
+  messages have no timestamp."""
+  uri16 = encode_string(uri)
+  size = 5 + len(uri16) + len(origin16)
+  if timestamp is not None:
+    size += 8
+  buff = bytearray(4 + size)
+  HEADER.pack_into(buff, 0, size, control)
+  LENGTH.pack_into(buff, 5, len(uri16))
+  offset = 9 + len(uri16)
+  buff[9:offset] = uri16
+  if timestamp is not None:
+    TIME.pack_into(buff, offset, timestamp)
+    offset += 8
+  buff[offset:] = origin16
+  return buff
+
+def decodeURIMessage(control, inbuff):
+  """Decode a create, expire, or delete URI message (without its message
+  type) into the URI, the timestamp (None for delete), and the origin."""
+  uri, offset = readSizedString(inbuff, 0)
+  timestamp = None
+  if WM_DELETE_URI != control:
+    timestamp = TIME.unpack_from(inbuff, offset)[0]
+    offset += 8
+  return uri, timestamp, str(inbuff[offset:], 'utf-16-be')
+
+def encodeAttributeMessage(control, uri, alias, origin16, timestamp = None, encode_string = encodeUTF16):
+  """Encode an expire or delete attribute message for the attribute with
+  the given alias of a URI, from the origin with the given UTF-16 encoding,
+  prepended with the message length. Delete messages have no timestamp."""
+  uri16 = encode_string(uri)
+  size = 9 + len(uri16) + len(origin16)
+  if timestamp is not None:
+    size += 8
+  buff = bytearray(4 + size)
+  HEADER.pack_into(buff, 0, size, control)
+  LENGTH.pack_into(buff, 5, len(uri16))
+  offset = 9 + len(uri16)
+  buff[9:offset] = uri16
+  LENGTH.pack_into(buff, offset, alias)
+  offset += 4
+  if timestamp is not None:
+    TIME.pack_into(buff, offset, timestamp)
+    offset += 8
+  buff[offset:] = origin16
+  return buff
+
+def decodeAttributeMessage(control, inbuff):
+  """Decode an expire or delete attribute message (without its message
+  type) into the URI, the attribute alias, the timestamp (None for delete),
+  and the origin."""
+  uri, offset = readSizedString(inbuff, 0)
+  alias = LENGTH.unpack_from(inbuff, offset)[0]
+  offset += 4
+  timestamp = None
+  if WM_DELETE_ATTRIBUTE != control:
+    timestamp = TIME.unpack_from(inbuff, offset)[0]
+    offset += 8
+  return uri, alias, timestamp, str(inbuff[offset:], 'utf-16-be')
+
+def encodeClientRequest(control, ticket, uri, attributes, start = 0, stop = 0):
+  """Encode a snapshot, range, or stream request with the given ticket for
+  objects matching the uri expression and attributes matching any of the
+  attribute expressions, prepended with the message length. Streams take
+  the update interval in place of the stop time."""
+  uri16 = uri.encode('utf-16-be')
+  names = [name.encode('utf-16-be') for name in attributes]
+  size = 29 + len(uri16) + sum(4 + len(name16) for name16 in names)
+  buff = bytearray(4 + size)
+  TICKET_HEADER.pack_into(buff, 0, size, control, ticket)
+  offset = 13 + len(uri16)
+  LENGTH.pack_into(buff, 9, len(uri16))
+  buff[13:offset] = uri16
+  LENGTH.pack_into(buff, offset, len(names))
+  offset += 4
+  for name16 in names:
+    LENGTH.pack_into(buff, offset, len(name16))
+    offset += 4
+    buff[offset:offset + len(name16)] = name16
+    offset += len(name16)
+  REQUEST_TIMES.pack_into(buff, offset, start, stop)
+  return buff
+
+def decodeClientRequest(inbuff):
+  """Decode a snapshot, range, or stream request (without its message type)
+  into the ticket, uri expression, attribute expressions, start, and stop
+  time or update interval."""
+  ticket = LENGTH.unpack_from(inbuff, 0)[0]
+  uri, offset = readSizedString(inbuff, 4)
+  count = LENGTH.unpack_from(inbuff, offset)[0]
+  offset += 4
+  attributes = []
+  for i in range(count):
+    name, offset = readSizedString(inbuff, offset)
+    attributes.append(name)
+  start, stop = REQUEST_TIMES.unpack_from(inbuff, offset)
+  return ticket, uri, attributes, start, stop
+
+def encodeTicket(control, ticket):
+  """Encode a request complete or cancel request message, prepended with the
+  message length."""
+  return TICKET_HEADER.pack(5, control, ticket)
+
+def decodeTicket(inbuff):
+  """Decode the ticket of a request complete or cancel request message
+  (without its message type)."""
+  return LENGTH.unpack_from(inbuff, 0)[0]
+
+def encodeAliases(control, aliases):
+  """Encode an attribute or origin alias message for a list of (alias, name)
+  pairs, prepended with the message length."""
+  names = [name.encode('utf-16-be') for alias, name in aliases]
+  size = 5 + sum(8 + len(name16) for name16 in names)
+  buff = bytearray(4 + size)
+  HEADER.pack_into(buff, 0, size, control)
+  LENGTH.pack_into(buff, 5, len(aliases))
+  offset = 9
+  for (alias, name), name16 in zip(aliases, names):
+    TYPE_HEADER.pack_into(buff, offset, alias, len(name16))
+    offset += 8
+    buff[offset:offset + len(name16)] = name16
+    offset += len(name16)
+  return buff
+
+def decodeAliases(inbuff):
+  """Decode an attribute or origin alias message (without its message type)
+  into a list of (alias, name) pairs."""
+  count = LENGTH.unpack_from(inbuff, 0)[0]
+  offset = 4
+  aliases = []
+  for i in range(count):
+    alias = LENGTH.unpack_from(inbuff, offset)[0]
+    name, offset = readSizedString(inbuff, offset + 4)
+    aliases.append((alias, name))
+  return aliases
+
+def encodeDataResponse(uri, ticket, attributes):
+  """Encode a data response for one object, prepended with the message
+  length. attributes are (name alias, creation, expiration, origin alias,
+  data) tuples."""
+  uri16 = uri.encode('utf-16-be')
+  size = 13 + len(uri16) + sum(CLIENT_ATTR_HEADER.size + len(attr[4]) for attr in attributes)
+  buff = bytearray(4 + size)
+  HEADER.pack_into(buff, 0, size, CLIENT_DATA_RESPONSE)
+  LENGTH.pack_into(buff, 5, len(uri16))
+  offset = 9 + len(uri16)
+  buff[9:offset] = uri16
+  TYPE_HEADER.pack_into(buff, offset, ticket, len(attributes))
+  offset += 8
+  for name_alias, creation, expiration, origin_alias, data in attributes:
+    CLIENT_ATTR_HEADER.pack_into(buff, offset, name_alias, creation, expiration, origin_alias, len(data))
+    offset += CLIENT_ATTR_HEADER.size
+    buff[offset:offset + len(data)] = data
+    offset += len(data)
+  return buff
+
+def decodeDataResponse(inbuff):
+  """Decode a data response (without its message type) into the URI, the
+  ticket, and a list of (name alias, creation, expiration, origin alias,
+  data) tuples."""
+  uri, offset = readSizedString(inbuff, 0)
+  ticket, count = TYPE_HEADER.unpack_from(inbuff, offset)
+  offset += 8
+  attributes = []
+  for i in range(count):
+    name_alias, creation, expiration, origin_alias, datalen = CLIENT_ATTR_HEADER.unpack_from(inbuff, offset)
+    offset += CLIENT_ATTR_HEADER.size
+    if offset + datalen > len(inbuff):
+      raise struct.error("Attribute data runs past the end of the message")
+    # Copy since the frame buffer is reused
+    attributes.append((name_alias, creation, expiration, origin_alias, bytes(inbuff[offset:offset + datalen])))
+    offset += datalen
+  return uri, ticket, attributes
+
+def encodeURISearch(expression):
+  """Encode a search for URIs matching the expression, prepended with the
+  message length."""
+  expression16 = expression.encode('utf-16-be')
+  return HEADER.pack(1 + len(expression16), CLIENT_URI_SEARCH) + expression16
+
+def decodeURISearch(inbuff):
+  """Decode the expression of a URI search (without its message type)."""
+  return str(inbuff, 'utf-16-be')
+
+def encodeURIResponse(uris):
+  """Encode the URIs found by a search, prepended with the message
+  length."""
+  uris16 = [uri.encode('utf-16-be') for uri in uris]
+  size = 1 + sum(4 + len(uri16) for uri16 in uris16)
+  buff = bytearray(4 + size)
+  HEADER.pack_into(buff, 0, size, CLIENT_URI_RESPONSE)
+  offset = 5
+  for uri16 in uris16:
+    LENGTH.pack_into(buff, offset, len(uri16))
+    offset += 4
+    buff[offset:offset + len(uri16)] = uri16
+    offset += len(uri16)
+  return buff
+
+def decodeURIResponse(inbuff):
+  """Decode the URIs of a URI response (without its message type)."""
+  offset = 0
+  uris = []
+  while offset < len(inbuff):
+    uri, offset = readSizedString(inbuff, offset)
+    uris.append(uri)
+  return uris
+
+def encodeOriginPreference(weights):
+  """Encode origin preferences from a dictionary of origin to weight,
+  prepended with the message length."""
+  origins = [(origin.encode('utf-16-be'), weight) for origin, weight in weights.items()]
+  size = 1 + sum(8 + len(origin16) for origin16, weight in origins)
+  buff = bytearray(4 + size)
+  HEADER.pack_into(buff, 0, size, CLIENT_ORIGIN_PREFERENCE)
+  offset = 5
+  for origin16, weight in origins:
+    LENGTH.pack_into(buff, offset, len(origin16))
+    offset += 4
+    buff[offset:offset + len(origin16)] = origin16
+    offset += len(origin16)
+    WEIGHT.pack_into(buff, offset, weight)
+    offset += 4
+  return buff
+
+def decodeOriginPreference(inbuff):
+  """Decode origin preferences (without the message type) into a
+  dictionary of origin to weight."""
+  offset = 0
+  weights = {}
+  while offset < len(inbuff):
+    origin, offset = readSizedString(inbuff, offset)
+    weights[origin] = WEIGHT.unpack_from(inbuff, offset)[0]
+    offset += 4
+  return weights
@@ -0,0 +1,129 @@
+#Low overhead counters and latency histograms for the solver clients.
+#Clients only call into an Instrumentation object when one has been set, so
+#with instrumentation off the cost is a single None check per message.
+#Counts and bytes are kept per message type in each direction, latencies in
+#power of two nanosecond buckets per stage (recv, decode, encode, send), and
+#queue depths as the latest and highest value seen. Hooks are called with
+#every event and exporters are passed snapshots on request.
+
+import time
+
+class LatencyHistogram:
+  """Histogram of durations in power of two nanosecond buckets."""
+  __slots__ = ('buckets', 'count', 'total', 'max')
+
+  def __init__(self):
+    # Bucket i holds durations of less than 2**i nanoseconds
+    self.buckets = [0] * 64
+    self.count = 0
+    self.total = 0
+    self.max = 0
+
+  def record(self, nanoseconds):
+    self.buckets[min(63, nanoseconds.bit_length())] += 1
+    self.count += 1
+    self.total += nanoseconds
+    if nanoseconds > self.max:
+      self.max = nanoseconds
+
+  def percentile(self, fraction):
+    """Upper bound in nanoseconds of the bucket holding the given fraction
+    of durations, or 0 if nothing was recorded."""
+    if 0 == self.count:
+      return 0
+    wanted = fraction * self.count
+    seen = 0
+    for bucket, count in enumerate(self.buckets):
+      seen += count
+      if seen >= wanted:
+        return min(1 << bucket, self.max)
+    return self.max
+
+  def mean(self):
+    if 0 == self.count:
+      return 0
+    return self.total / self.count
+
+class Instrumentation:
+  def __init__(self):
+    # Message counts and bytes by message type, including length prefixes
+    self.messages_in = {}
+    self.bytes_in = {}
+    self.messages_out = {}
+    self.bytes_out = {}
+    # Latency histograms by stage name
+    self.latencies = {}
+    # Latest and highest depth of each named queue
+    self.queue_depths = {}
+    self.max_queue_depths = {}
+    self.reconnects = 0
+    # Functions called as hook(event, name, value) for every event
+    self.hooks = []
+    self.start_time = time.time()
+
+  def addHook(self, hook):
+    """Call hook(event, name, value) for every received or sent message
+    ('in'/'out', message type, bytes), timing ('latency', stage,
+    nanoseconds), queue depth ('queue', name, depth), and reconnect
+    ('reconnect', None, total)."""
+    self.hooks.append(hook)
+
+  def callHooks(self, event, name, value):
+    for hook in self.hooks:
+      hook(event, name, value)
+
+  def received(self, control, size):
+    self.messages_in[control] = self.messages_in.get(control, 0) + 1
+    self.bytes_in[control] = self.bytes_in.get(control, 0) + size
+    if self.hooks:
+      self.callHooks('in', control, size)
+
+  def sent(self, control, size, count = 1):
+    self.messages_out[control] = self.messages_out.get(control, 0) + count
+    self.bytes_out[control] = self.bytes_out.get(control, 0) + size
+    if self.hooks:
+      self.callHooks('out', control, size)
+
+  def timing(self, stage, nanoseconds):
+    histogram = self.latencies.get(stage)
+    if histogram is None:
+      histogram = self.latencies[stage] = LatencyHistogram()
+    histogram.record(nanoseconds)
+    if self.hooks:
+      self.callHooks('latency', stage, nanoseconds)
+
+  def queueDepth(self, name, depth):
+    self.queue_depths[name] = depth
+    if depth > self.max_queue_depths.get(name, 0):
+      self.max_queue_depths[name] = depth
+    if self.hooks:
+      self.callHooks('queue', name, depth)
+
+  def reconnected(self):
+    self.reconnects += 1
+    if self.hooks:
+      self.callHooks('reconnect', None, self.reconnects)
+
+  def snapshot(self):
+    """Return the current values as a dictionary of plain values."""
+    return {
+      'uptime': time.time() - self.start_time,
+      'messages_in': dict(self.messages_in),
+      'bytes_in': dict(self.bytes_in),
+      'messages_out': dict(self.messages_out),
+      'bytes_out': dict(self.bytes_out),
+      'latency': {stage: {'count': histogram.count,
+                          'mean': histogram.mean(),
+                          'p50': histogram.percentile(0.5),
+                          'p99': histogram.percentile(0.99),
+                          'max': histogram.max}
+                  for stage, histogram in self.latencies.items()},
+      'queue_depths': dict(self.queue_depths),
+      'max_queue_depths': dict(self.max_queue_depths),
+      'reconnects': self.reconnects,
+    }
+
+  def export(self, exporter):
+    """Pass a snapshot to exporter, such as a function that logs it or sends
+    it to a metrics system."""
+    exporter(self.snapshot())
@@ -0,0 +1,93 @@
+#Suppresses pushes of attributes whose data has not changed.
+#The cache remembers a hash of the data last pushed for each (uri, attribute
+#name) pair, holding at most max_entries pairs with the least recently
+#pushed evicted first. An unchanged attribute is sent anyway once
+#refresh_interval seconds have passed since it was last sent. Entries must
+#be invalidated when the world model drops the data, as when objects or
+#attributes are expired or deleted, or a push may have been lost.
+
+import collections
+import time
+
+import wm_data
+
+class PushCache:
+  def __init__(self, max_entries = 100000, refresh_interval = None):
+    self.max_entries = max_entries
+    self.refresh_interval = refresh_interval
+    # (uri, name) -> [data hash, time last sent]
+    self.entries = collections.OrderedDict()
+    # URI -> set of cached attribute names
+    self.names = {}
+    self.lookups = 0
+    self.suppressed = 0
+    self.refreshed = 0
+    self.evictions = 0
+
+  def __len__(self):
+    return len(self.entries)
+
+  def clear(self):
+    """Forget all pushed data so that everything is sent again."""
+    self.entries.clear()
+    self.names.clear()
+
+  def remove(self, key):
+    del self.entries[key]
+    names = self.names[key[0]]
+    names.discard(key[1])
+    if 0 == len(names):
+      del self.names[key[0]]
+
+  def invalidate(self, uri, name = None):
+    """Forget the pushed data of one attribute of a URI, or of all of them
+    if name is None, so that it is sent again."""
+    names = [name] if name is not None else list(self.names.get(uri, ()))
+    for attr_name in names:
+      if (uri, attr_name) in self.entries:
+        self.remove((uri, attr_name))
+
+  def changed(self, uri, attr, now):
+    """Record the attribute as pushed and return True unless it matches the
+    last pushed data and is not due for a refresh."""
+    self.lookups += 1
+    key = (uri, attr.name)
+    digest = hash(bytes(attr.data))
+    entry = self.entries.get(key)
+    if entry is None:
+      self.entries[key] = [digest, now]
+      self.names.setdefault(uri, set()).add(attr.name)
+      if len(self.entries) > self.max_entries:
+        self.remove(next(iter(self.entries)))
+        self.evictions += 1
+      return True
+    self.entries.move_to_end(key)
+    if entry[0] != digest:
+      entry[0] = digest
+      entry[1] = now
+      return True
+    if self.refresh_interval is not None and now - entry[1] >= self.refresh_interval:
+      entry[1] = now
+      self.refreshed += 1
+      return True
+    self.suppressed += 1
+    return False
+
+  def filter(self, wmdata_vector):
+    """Return the WMData with unchanged attributes removed, leaving out
+    objects that have nothing left to send."""
+    now = time.monotonic()
+    result = []
+    for wmdata in wmdata_vector:
+      attributes = [attr for attr in wmdata.attributes if self.changed(wmdata.uri, attr, now)]
+      if len(attributes) == len(wmdata.attributes):
+        result.append(wmdata)
+      elif 0 < len(attributes):
+        result.append(wm_data.WMData(wmdata.uri, attributes, wmdata.ticket))
+    return result
+
+  def stats(self):
+    """Lookup, suppression, refresh, and eviction counts."""
+    return {'entries': len(self.entries), 'lookups': self.lookups,
+            'suppressed': self.suppressed, 'refreshed': self.refreshed,
+            'evictions': self.evictions}
@@ -0,0 +1,73 @@
+#Accumulates solver data pushes so that many small pushes are sent to the
+#world model as a few merged SOLVER_DATA messages.
+#Consecutive pushes with the same create_uris flag share a message, so the
+#order of pushes and the create_uris setting of every attribute are kept.
+#There is no timer: the delay is only checked when asked, so the owner must
+#poll due() (SolverWorldModel.flushIfDue) while it has nothing else to do or
+#pending pushes wait until the next push.
+
+import time
+
+class PushCoalescer:
+  def __init__(self, max_bytes = 65536, max_attributes = 4096, max_delay = 0.01):
+    """Pending pushes should be flushed once they hold max_bytes of encoded
+    attributes, max_attributes attributes, or when the oldest has waited
+    max_delay seconds."""
+    self.max_bytes = max_bytes
+    self.max_attributes = max_attributes
+    self.max_delay = max_delay
+    # Each segment is [create_uris, attribute count, encoded attribute buffers]
+    self.segments = []
+    self.pending_bytes = 0
+    self.pending_attributes = 0
+    # Time of the oldest pending push
+    self.oldest = None
+    # Number of flushes and of messages sent by them
+    self.flushes = 0
+    self.messages = 0
+
+  def __len__(self):
+    return self.pending_attributes
+
+  def add(self, attributes, total_solns, create_uris):
+    """Add the encoded attributes of one push. Returns True if a threshold
+    was reached and the pending pushes should be flushed."""
+    if 0 == total_solns:
+      return False
+    create_uris = bool(create_uris)
+    if self.segments and self.segments[-1][0] == create_uris:
+      segment = self.segments[-1]
+      segment[1] += total_solns
+      segment[2].append(attributes)
+    else:
+      self.segments.append([create_uris, total_solns, [attributes]])
+    if self.oldest is None:
+      self.oldest = time.monotonic()
+    self.pending_bytes += len(attributes)
+    self.pending_attributes += total_solns
+    return (self.pending_bytes >= self.max_bytes or
+            self.pending_attributes >= self.max_attributes or
+            self.due())
+
+  def due(self):
+    """True if the oldest pending push has waited for max_delay seconds.
+    Only checked when called; nothing flushes by itself."""
+    return (self.oldest is not None and
+            time.monotonic() - self.oldest >= self.max_delay)
+
+  def take(self, encoder):
+    """Remove the pending pushes and return the buffers of the merged
+    messages, in order, ready to be sent together."""
+    buffers = []
+    for create_uris, total_solns, parts in self.segments:
+      size = sum(len(part) for part in parts)
+      buffers.append(encoder.encodeSolverDataHeader(size, total_solns, create_uris))
+      buffers.extend(parts)
+    if self.segments:
+      self.flushes += 1
+      self.messages += len(self.segments)
+    self.segments = []
+    self.pending_bytes = 0
+    self.pending_attributes = 0
+    self.oldest = None
+    return buffers
@@ -0,0 +1,30 @@
+#Jittered exponential backoff for reconnecting the solver clients.
+#Each failed attempt doubles (by default) the delay before the next one, up
+#to a maximum, and every delay is randomly shortened by up to the jitter
+#fraction so that many clients do not retry in lockstep after a server
+#restart.
+
+import random
+
+class Backoff:
+  def __init__(self, initial_delay = 0.1, max_delay = 30.0, multiplier = 2.0, jitter = 0.5, max_attempts = None):
+    """Delays are in seconds. After max_attempts attempts (never if None)
+    nextDelay returns None to give up."""
+    self.initial_delay = initial_delay
+    self.max_delay = max_delay
+    self.multiplier = multiplier
+    self.jitter = jitter
+    self.max_attempts = max_attempts
+    self.attempts = 0
+
+  def reset(self):
+    """Start over after a successful connection."""
+    self.attempts = 0
+
+  def nextDelay(self):
+    """Return the delay before the next attempt, or None to give up."""
+    if self.max_attempts is not None and self.attempts >= self.max_attempts:
+      return None
+    delay = min(self.max_delay, self.initial_delay * self.multiplier ** self.attempts)
+    self.attempts += 1
+    return delay * (1.0 - self.jitter * random.random())
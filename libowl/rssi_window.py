@@ -0,0 +1,222 @@
+#Streaming RSSI statistics per (transmitter, receiver) link.
+#Samples update running count, sum, sum of squares, minimum, maximum, and a
+#1 dB histogram (for the median) of the current pane in constant time. A
+#window is made of one pane (tumbling) or several panes that slide by one
+#pane at a time. When a window closes a LinkSummary is emitted for every link
+#heard in it and links that have been silent for too long are evicted.
+#Statistics are kept in flat arrays indexed by a link's slot.
+
+import array
+
+#Median histogram covers -128 dBm up to (but not including) 0 dBm
+HIST_MIN = -128
+HIST_BINS = 128
+_EMPTY_HIST = array.array('I', [0]) * HIST_BINS
+
+class LinkSummary:
+  """Statistics of one link over one window."""
+  __slots__ = ('device_id', 'receiver_id', 'window_start', 'window_end',
+               'count', 'mean', 'variance', 'median', 'min', 'max')
+
+  def __init__(self, device_id, receiver_id, window_start, window_end, count, mean, variance, median, minimum, maximum):
+    self.device_id = device_id
+    self.receiver_id = receiver_id
+    self.window_start = window_start
+    self.window_end = window_end
+    self.count = count
+    self.mean = mean
+    self.variance = variance
+    self.median = median
+    self.min = minimum
+    self.max = maximum
+
+  def __str__(self):
+    return "[{}, {}) {} -> {}: {} samples, mean {:.2f}, var {:.2f}, median {}, min {}, max {}".format(
+        self.window_start, self.window_end, self.device_id, self.receiver_id, self.count,
+        self.mean, self.variance, self.median, self.min, self.max)
+
+class WindowedRSSI:
+  def __init__(self, window, slide = None, idle_timeout = None, handler = None, median = True):
+    """Summarize links over windows of window timestamp units (milliseconds
+    for GRAIL). Windows advance by slide, which must divide window, or by a
+    whole window (tumbling) if slide is None. Links with no samples for
+    idle_timeout are evicted. It defaults to, and is raised to at least, one
+    window so links are not evicted while an open pane holds their samples.
+    Summaries are passed to handler or, without one, appended to
+    self.summaries. Turning off median skips the per-link histograms."""
+    if slide is None:
+      slide = window
+    if slide <= 0 or window % slide != 0:
+      raise ValueError("The window slide must evenly divide the window")
+    self.window = window
+    self.slide = slide
+    self.panes = window // slide
+    self.idle_timeout = window if idle_timeout is None else max(window, idle_timeout)
+    self.handler = handler
+    self.median = median
+    self.summaries = []
+    # Link (device_id, receiver_id) to its slot
+    self.slots = {}
+    self.free_slots = []
+    self.capacity = 0
+    self.last_seen = array.array('Q')
+    # Statistics per pane, each an array indexed by slot
+    self.counts = [array.array('I') for i in range(self.panes)]
+    self.sums = [array.array('d') for i in range(self.panes)]
+    self.sumsqs = [array.array('d') for i in range(self.panes)]
+    self.mins = [array.array('d') for i in range(self.panes)]
+    self.maxs = [array.array('d') for i in range(self.panes)]
+    self.hists = [array.array('I') for i in range(self.panes)]
+    # Number of the newest pane, counted in slides since time 0
+    self.current = None
+    # Samples too old for any open window
+    self.late = 0
+    self.evicted = 0
+
+  @classmethod
+  def fromRule(cls, rule, panes = 1, **kwargs):
+    """Windows of panes update intervals of an AggrRule, sliding by one
+    update interval."""
+    return cls(rule.update_interval * panes, rule.update_interval, **kwargs)
+
+  def grow(self):
+    """Double the number of link slots."""
+    added = max(64, self.capacity)
+    self.last_seen.extend([0] * added)
+    for p in range(self.panes):
+      self.counts[p].extend([0] * added)
+      self.sums[p].extend([0.0] * added)
+      self.sumsqs[p].extend([0.0] * added)
+      self.mins[p].extend([0.0] * added)
+      self.maxs[p].extend([0.0] * added)
+      if self.median:
+        self.hists[p].extend([0] * (added * HIST_BINS))
+    self.free_slots.extend(range(self.capacity + added - 1, self.capacity - 1, -1))
+    self.capacity += added
+
+  def clearSlot(self, pane, slot):
+    self.counts[pane][slot] = 0
+    self.sums[pane][slot] = 0.0
+    self.sumsqs[pane][slot] = 0.0
+    if self.median:
+      start = slot * HIST_BINS
+      self.hists[pane][start:start + HIST_BINS] = _EMPTY_HIST
+
+  def add(self, sample):
+    """Add a SensorSample."""
+    self.addValues(sample.device_id, sample.receiver_id, sample.timestamp, sample.rssi)
+
+  def addBatch(self, batch):
+    """Add every sample of a sample_batch.SampleBatch."""
+    rows = batch.samples
+    for tx_hi, tx_lo, rx_hi, rx_lo, timestamp, rssi in zip(
+        rows['txid_hi'].tolist(), rows['txid_lo'].tolist(),
+        rows['rxid_hi'].tolist(), rows['rxid_lo'].tolist(),
+        rows['timestamp'].tolist(), rows['rssi'].tolist()):
+      self.addValues((tx_hi, tx_lo), (rx_hi, rx_lo), timestamp, rssi)
+
+  def addValues(self, device_id, receiver_id, timestamp, rssi):
+    """Add one RSSI reading of the link from device_id to receiver_id."""
+    pane_number = timestamp // self.slide
+    if self.current is None or pane_number > self.current:
+      self.advance(timestamp)
+    elif pane_number <= self.current - self.panes:
+      self.late += 1
+      return
+    pane = pane_number % self.panes
+    key = (device_id, receiver_id)
+    slot = self.slots.get(key)
+    if slot is None:
+      if 0 == len(self.free_slots):
+        self.grow()
+      slot = self.free_slots.pop()
+      self.slots[key] = slot
+      for p in range(self.panes):
+        self.clearSlot(p, slot)
+    if timestamp > self.last_seen[slot]:
+      self.last_seen[slot] = timestamp
+    count = self.counts[pane][slot]
+    if 0 == count or rssi < self.mins[pane][slot]:
+      self.mins[pane][slot] = rssi
+    if 0 == count or rssi > self.maxs[pane][slot]:
+      self.maxs[pane][slot] = rssi
+    self.counts[pane][slot] = count + 1
+    self.sums[pane][slot] += rssi
+    self.sumsqs[pane][slot] += rssi * rssi
+    if self.median:
+      bin_number = min(HIST_BINS - 1, max(0, int(rssi - HIST_MIN)))
+      self.hists[pane][slot * HIST_BINS + bin_number] += 1
+
+  def advance(self, timestamp):
+    """Close every window that ends at or before timestamp."""
+    pane_number = timestamp // self.slide
+    if self.current is None:
+      self.current = pane_number
+      return
+    last_data = self.current
+    while self.current < pane_number:
+      self.emit(self.current)
+      self.current += 1
+      self.clearPane(self.current % self.panes)
+      if self.current - self.panes >= last_data:
+        # Every pane is empty so the windows until the new pane are too
+        self.current = pane_number
+
+  def clearPane(self, pane):
+    for slot in self.slots.values():
+      self.clearSlot(pane, slot)
+
+  def flush(self):
+    """Emit the window ending with the newest pane, even if it is not over."""
+    if self.current is not None:
+      self.emit(self.current)
+
+  def emit(self, last_pane):
+    """Emit summaries of the window ending with pane number last_pane and
+    evict idle links."""
+    window_end = (last_pane + 1) * self.slide
+    window_start = window_end - self.window
+    idle = []
+    for key, slot in self.slots.items():
+      count = 0
+      total = 0.0
+      total_sq = 0.0
+      minimum = None
+      maximum = None
+      for p in range(self.panes):
+        pane_count = self.counts[p][slot]
+        if 0 < pane_count:
+          count += pane_count
+          total += self.sums[p][slot]
+          total_sq += self.sumsqs[p][slot]
+          if minimum is None or self.mins[p][slot] < minimum:
+            minimum = self.mins[p][slot]
+          if maximum is None or self.maxs[p][slot] > maximum:
+            maximum = self.maxs[p][slot]
+      if 0 < count:
+        mean = total / count
+        variance = max(0.0, total_sq / count - mean * mean)
+        median = self.histogramMedian(slot, count) if self.median else None
+        summary = LinkSummary(key[0], key[1], window_start, window_end,
+            count, mean, variance, median, minimum, maximum)
+        if self.handler is not None:
+          self.handler(summary)
+        else:
+          self.summaries.append(summary)
+      if self.last_seen[slot] + self.idle_timeout <= window_end:
+        idle.append(key)
+    for key in idle:
+      self.free_slots.append(self.slots.pop(key))
+      self.evicted += 1
+
+  def histogramMedian(self, slot, count):
+    """The median RSSI of a link as the middle of its 1 dB histogram bin."""
+    start = slot * HIST_BINS
+    half = (count + 1) // 2
+    seen = 0
+    for bin_number in range(HIST_BINS):
+      for p in range(self.panes):
+        seen += self.hists[p][start + bin_number]
+      if seen >= half:
+        return HIST_MIN + bin_number + 0.5
+    return HIST_MIN + HIST_BINS - 0.5
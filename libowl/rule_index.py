@@ -0,0 +1,97 @@
+#Client side routing of aggregator samples to many consumers.
+#Consumers register AggrRules with a handler or queue. The rules are compiled
+#into one hash table per distinct mask plus a table of physical layers whose
+#rules accept every transmitter, so each sample is matched with a few
+#dictionary lookups no matter how many consumers share the connection.
+
+import collections
+import struct
+
+def idValue(packed):
+  """Convert a packed 128 bit id or mask from an IDMask into an integer."""
+  high, low = struct.unpack('!QQ', packed)
+  return (high << 64) | low
+
+def sampleId(device_id):
+  """Convert a sample's (high, low) device id into an integer."""
+  return (device_id[0] << 64) | device_id[1]
+
+class RuleIndex:
+  def __init__(self):
+    # Registered [rule, handler] pairs
+    self.entries = []
+    # Compiled tables, rebuilt when the registered rules change
+    self.phy_table = None
+    self.mask_tables = None
+    # Samples routed and samples that matched no rule
+    self.routed = 0
+    self.unmatched = 0
+
+  def addHandler(self, rule, handler):
+    """Call handler with every sample matching the AggrRule. A rule with no
+    transmitters matches every sample from its physical layer."""
+    self.entries.append([rule, handler])
+    self.phy_table = None
+
+  def addQueue(self, rule, maxlen = None):
+    """Return a deque that receives every sample matching the AggrRule.
+    With maxlen set the oldest samples are discarded when it is full."""
+    queue = collections.deque(maxlen = maxlen)
+    self.addHandler(rule, queue.append)
+    return queue
+
+  def removeHandler(self, handler):
+    """Remove every rule registered with handler."""
+    self.entries = [entry for entry in self.entries if entry[1] != handler]
+    self.phy_table = None
+
+  def aggrRules(self):
+    """The registered rules, suitable for a single aggregator subscription."""
+    return [entry[0] for entry in self.entries]
+
+  def compile(self):
+    """Build the lookup tables for the registered rules."""
+    phy_table = {}
+    mask_tables = {}
+    for rule, handler in self.entries:
+      if 0 == len(rule.txers):
+        phy_table.setdefault(rule.phy_layer, []).append(handler)
+      for txer in rule.txers:
+        mask = idValue(txer.mask)
+        key = (rule.phy_layer, idValue(txer.id) & mask)
+        mask_tables.setdefault(mask, {}).setdefault(key, []).append(handler)
+    self.mask_tables = list(mask_tables.items())
+    self.phy_table = phy_table
+
+  def match(self, phy_layer, device_id):
+    """Return the handlers of all rules matching the physical layer and
+    (high, low) device id, with each handler listed once."""
+    if self.phy_table is None:
+      self.compile()
+    matches = self.phy_table.get(phy_layer)
+    value = sampleId(device_id)
+    for mask, table in self.mask_tables:
+      handlers = table.get((phy_layer, value & mask))
+      if handlers is not None:
+        if matches is None:
+          matches = handlers
+        else:
+          matches = matches + handlers
+    if matches is None:
+      return ()
+    if 1 < len(matches):
+      # A handler gets each sample once even if several of its rules match
+      matches = list(dict.fromkeys(matches))
+    return matches
+
+  def route(self, sample):
+    """Pass a SensorSample to every matching handler.
+    Returns the number of handlers called."""
+    handlers = self.match(sample.phy_layer, sample.device_id)
+    if 0 == len(handlers):
+      self.unmatched += 1
+      return 0
+    self.routed += 1
+    for handler in handlers:
+      handler(sample)
+    return len(handlers)
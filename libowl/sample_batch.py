@@ -0,0 +1,97 @@
+#Columnar decoding of aggregator server samples.
+#Many SERVER_SAMPLE messages are decoded at once into a NumPy structured
+#array so that solvers can filter and aggregate them without creating a
+#SensorSample object for every packet.
+#NumPy is only required when batch decoding is used.
+
+try:
+  import numpy
+except ImportError:
+  numpy = None
+
+import grail_codec
+import sensor_sample as samples
+
+#Physical layer, transmitter, receiver, timestamp, and rssi as sent over the
+#network after the message type byte
+WIRE_FIELDS = [('phy', 'u1'),
+               ('txid_hi', '>u8'), ('txid_lo', '>u8'),
+               ('rxid_hi', '>u8'), ('rxid_lo', '>u8'),
+               ('timestamp', '>u8'), ('rssi', '>f4')]
+#Size of the fixed portion of a server sample, before the sense data
+HEADER_SIZE = grail_codec.SAMPLE_HEADER.size
+
+#The decoded sample fields in native byte order with the location of each
+#sample's sense data in the batch's shared buffer
+SAMPLE_FIELDS = [('phy', 'u1'),
+                 ('txid_hi', 'u8'), ('txid_lo', 'u8'),
+                 ('rxid_hi', 'u8'), ('rxid_lo', 'u8'),
+                 ('timestamp', 'u8'), ('rssi', 'f4'),
+                 ('sense_offset', 'u8'), ('sense_length', 'u4')]
+
+def requireNumpy():
+  if numpy is None:
+    raise RuntimeError("NumPy is required for batch sample decoding!")
+
+class SampleBatch:
+  """A batch of server samples stored as a structured array.
+  The sense data of every sample is stored back to back in sense_data and
+  located with the sense_offset and sense_length fields."""
+
+  def __init__(self, samples, sense_data):
+    self.samples = samples
+    self.sense_data = sense_data
+
+  def __len__(self):
+    return len(self.samples)
+
+  def senseData(self, index):
+    """Return a memoryview of the sense data of one sample."""
+    row = self.samples[index]
+    offset = int(row['sense_offset'])
+    return memoryview(self.sense_data)[offset:offset + int(row['sense_length'])]
+
+  def select(self, selection):
+    """Return a new batch with the samples chosen by a boolean mask or index
+    array. The sense data buffer is shared with this batch."""
+    return SampleBatch(self.samples[selection], self.sense_data)
+
+  def sensorSample(self, index):
+    """Create a SensorSample for one sample of the batch."""
+    row = self.samples[index]
+    return samples.SensorSample(int(row['phy']),
+        (int(row['txid_hi']), int(row['txid_lo'])),
+        (int(row['rxid_hi']), int(row['rxid_lo'])),
+        int(row['timestamp']), float(row['rssi']),
+        bytes(self.senseData(index)))
+
+  def sensorSamples(self):
+    """Create SensorSample objects for every sample in the batch."""
+    return [self.sensorSample(i) for i in range(len(self.samples))]
+
+def emptyBatch():
+  """Return a batch with no samples."""
+  requireNumpy()
+  return SampleBatch(numpy.zeros(0, dtype=SAMPLE_FIELDS), b'')
+
+def decodeServerSamples(frames):
+  """Decode server sample messages (without their message type byte) into a
+  single SampleBatch. Messages too short to hold a sample are skipped."""
+  requireNumpy()
+  frames = [frame for frame in frames if len(frame) >= HEADER_SIZE]
+  if 0 == len(frames):
+    return emptyBatch()
+  # Gather the fixed size headers and decode them in one step
+  headers = numpy.frombuffer(b''.join(frame[:HEADER_SIZE] for frame in frames),
+      dtype=WIRE_FIELDS)
+  batch = numpy.empty(len(frames), dtype=SAMPLE_FIELDS)
+  for name, _ in WIRE_FIELDS:
+    batch[name] = headers[name]
+  # Copy all sense data into one shared buffer
+  sense_data = b''.join(frame[HEADER_SIZE:] for frame in frames)
+  lengths = numpy.fromiter((len(frame) - HEADER_SIZE for frame in frames),
+      dtype='u4', count=len(frames))
+  batch['sense_length'] = lengths
+  batch['sense_offset'][0] = 0
+  numpy.cumsum(lengths[:-1], dtype='u8', out=batch['sense_offset'][1:])
+  return SampleBatch(batch, sense_data)
@@ -0,0 +1,112 @@
+#Fixed capacity ring buffer of sensor samples.
+#The ring preallocates its sample objects so that memory use stays flat no
+#matter how far a solver falls behind the aggregator. When the ring is full
+#new samples either replace the oldest ones, are dropped, or make the
+#producer wait for the consumer. Pushing and drain never allocate; pop hands
+#its slot to the caller and allocates a replacement, so consumers that keep
+#up with a busy aggregator should use drain.
+
+import threading
+
+import sensor_sample as samples
+
+class SampleRing:
+  #Overflow policies
+  DROP_OLDEST = 'drop_oldest'
+  DROP_NEWEST = 'drop_newest'
+  BLOCK       = 'block'
+
+  def __init__(self, capacity, policy = DROP_OLDEST, block_timeout = None):
+    """Create a ring holding up to capacity samples. With the BLOCK policy
+    push waits up to block_timeout seconds (forever if None) for space and
+    drops the sample if none was made. BLOCK requires the consumer to run in
+    another thread."""
+    if capacity < 1:
+      raise ValueError("Sample ring capacity must be positive")
+    if policy not in (self.DROP_OLDEST, self.DROP_NEWEST, self.BLOCK):
+      raise ValueError("Unknown sample ring policy {}".format(policy))
+    self.capacity = capacity
+    self.policy = policy
+    self.block_timeout = block_timeout
+    self.slots = [self.newSlot() for i in range(capacity)]
+    # Index of the oldest sample and the number of stored samples
+    self.head = 0
+    self.count = 0
+    # Samples lost because the ring was full
+    self.dropped = 0
+    # The highest number of samples held at once
+    self.high_water = 0
+    self.lock = threading.Lock()
+    self.not_empty = threading.Condition(self.lock)
+    self.not_full = threading.Condition(self.lock)
+
+  @staticmethod
+  def newSlot():
+    return samples.SensorSample(0, None, None, 0, 0.0, b'')
+
+  def __len__(self):
+    return self.count
+
+  def push(self, phy, device_id, receiver_id, timestamp, rssi, sense_data):
+    """Store a sample in the ring, returning False if it was dropped."""
+    with self.lock:
+      if self.count == self.capacity:
+        if self.DROP_NEWEST == self.policy:
+          self.dropped += 1
+          return False
+        elif self.DROP_OLDEST == self.policy:
+          self.head = (self.head + 1) % self.capacity
+          self.count -= 1
+          self.dropped += 1
+        elif not self.not_full.wait_for(lambda: self.count < self.capacity, self.block_timeout):
+          self.dropped += 1
+          return False
+      slot = self.slots[(self.head + self.count) % self.capacity]
+      slot.phy_layer = phy
+      slot.device_id = device_id
+      slot.receiver_id = receiver_id
+      slot.timestamp = timestamp
+      slot.rssi = rssi
+      slot.sense_data = sense_data
+      self.count += 1
+      if self.count > self.high_water:
+        self.high_water = self.count
+      self.not_empty.notify()
+      return True
+
+  def pop(self, timeout = 0):
+    """Remove and return the oldest sample, waiting up to timeout seconds
+    (forever if None) for one to arrive. Returns None if the ring is empty.
+    The returned sample belongs to the caller and is replaced in the ring by
+    a newly allocated slot; use drain to consume without allocating."""
+    with self.lock:
+      if 0 == self.count and not self.not_empty.wait_for(lambda: 0 < self.count, timeout):
+        return None
+      sample = self.slots[self.head]
+      self.slots[self.head] = self.newSlot()
+      self.head = (self.head + 1) % self.capacity
+      self.count -= 1
+      self.not_full.notify()
+      return sample
+
+  def drain(self, handler, limit = None):
+    """Pass up to limit of the oldest samples to handler and remove them.
+    The sample objects are reused by the ring, so handler must copy any
+    values it keeps. Returns the number of samples handled."""
+    with self.lock:
+      total = self.count if limit is None else min(limit, self.count)
+      for i in range(total):
+        handler(self.slots[(self.head + i) % self.capacity])
+      self.head = (self.head + total) % self.capacity
+      self.count -= total
+      self.not_full.notify_all()
+      return total
+
+  def popAll(self):
+    """Remove and return all stored samples, oldest first."""
+    result = []
+    sample = self.pop()
+    while sample is not None:
+      result.append(sample)
+      sample = self.pop()
+    return result
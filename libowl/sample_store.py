@@ -0,0 +1,197 @@
+#In-memory store of recent samples, indexed by transmitter and receiver.
+#Samples are appended to a series for their device and one for their
+#receiver. A series is a list of chunks of preallocated column arrays
+#(timestamp, rssi, physical layer, and the id of the other end of the link),
+#so queries can hand out memoryviews of the columns without copying and
+#appends never move data that has been handed out. Chunk sizes double up to
+#chunk_size so that rarely heard devices take little memory. Full chunks
+#older than max_age are evicted in the order they filled up (so the open
+#chunk of a series may hold older samples), and series that have been
+#silent for max_age are dropped. Sense data is not stored.
+
+import array
+import bisect
+import collections
+
+class SeriesSlice:
+  """Columns of consecutive samples of one series as memoryviews. other_hi
+  and other_lo are the receiver id of a device series or the device id of a
+  receiver series."""
+  __slots__ = ('timestamps', 'rssi', 'phy', 'other_hi', 'other_lo')
+
+  def __init__(self, timestamps, rssi, phy, other_hi, other_lo):
+    self.timestamps = timestamps
+    self.rssi = rssi
+    self.phy = phy
+    self.other_hi = other_hi
+    self.other_lo = other_lo
+
+  def __len__(self):
+    return len(self.timestamps)
+
+class Chunk:
+  __slots__ = ('timestamps', 'rssi', 'phy', 'other_hi', 'other_lo', 'count', 'capacity', 'ordered', 'newest')
+
+  def __init__(self, size):
+    self.timestamps = array.array('Q', bytes(8 * size))
+    self.rssi = array.array('f', bytes(4 * size))
+    self.phy = array.array('B', bytes(size))
+    self.other_hi = array.array('Q', bytes(8 * size))
+    self.other_lo = array.array('Q', bytes(8 * size))
+    self.count = 0
+    self.capacity = size
+    # False once a sample arrived with an earlier timestamp than the last
+    self.ordered = True
+    self.newest = 0
+
+  def view(self, start, stop):
+    return SeriesSlice(memoryview(self.timestamps)[start:stop], memoryview(self.rssi)[start:stop],
+        memoryview(self.phy)[start:stop], memoryview(self.other_hi)[start:stop],
+        memoryview(self.other_lo)[start:stop])
+
+  def select(self, indices):
+    """Copy the samples at the given indices into a new slice."""
+    columns = [array.array(column.typecode, (column[i] for i in indices))
+               for column in (self.timestamps, self.rssi, self.phy, self.other_hi, self.other_lo)]
+    return SeriesSlice(*[memoryview(column) for column in columns])
+
+class SampleStore:
+  def __init__(self, max_age = 60000, chunk_size = 1024):
+    """Keep samples for max_age timestamp units (milliseconds for GRAIL)
+    after the newest sample, in chunks of chunk_size samples."""
+    self.max_age = max_age
+    self.chunk_size = chunk_size
+    # Device or receiver id -> list of chunks, oldest first
+    self.device_series = {}
+    self.receiver_series = {}
+    # (newest timestamp, series, is a device series) of each full chunk in
+    # the order they filled
+    self.full_chunks = collections.deque()
+    self.newest = 0
+    # Timestamp at which silent series are next looked for
+    self.next_sweep = max_age
+    self.samples = 0
+    self.evicted_chunks = 0
+
+  def __len__(self):
+    """Number of stored samples."""
+    return self.samples
+
+  def devices(self):
+    return list(self.device_series)
+
+  def receivers(self):
+    return list(self.receiver_series)
+
+  def append(self, series, is_device, phy, other, timestamp, rssi):
+    chunk = series[-1] if series else None
+    if chunk is None or chunk.count == chunk.capacity:
+      if chunk is None:
+        chunk = Chunk(min(16, self.chunk_size))
+      else:
+        self.full_chunks.append((chunk.newest, series, is_device))
+        chunk = Chunk(min(2 * chunk.capacity, self.chunk_size))
+      series.append(chunk)
+    i = chunk.count
+    chunk.timestamps[i] = timestamp
+    chunk.rssi[i] = rssi
+    chunk.phy[i] = phy
+    chunk.other_hi[i] = other[0]
+    chunk.other_lo[i] = other[1]
+    chunk.count = i + 1
+    if timestamp >= chunk.newest:
+      chunk.newest = timestamp
+    else:
+      chunk.ordered = False
+
+  def add(self, phy, device_id, receiver_id, timestamp, rssi, sense_data = None):
+    """Store one sample. Takes the fields of a SensorSample in order."""
+    series = self.device_series.get(device_id)
+    if series is None:
+      series = self.device_series[device_id] = []
+    self.append(series, True, phy, receiver_id, timestamp, rssi)
+    series = self.receiver_series.get(receiver_id)
+    if series is None:
+      series = self.receiver_series[receiver_id] = []
+    self.append(series, False, phy, device_id, timestamp, rssi)
+    self.samples += 1
+    if timestamp > self.newest:
+      self.newest = timestamp
+      self.evict()
+
+  def addSample(self, sample):
+    self.add(sample.phy_layer, sample.device_id, sample.receiver_id, sample.timestamp, sample.rssi)
+
+  def addSamples(self, sample_list):
+    for sample in sample_list:
+      self.add(sample.phy_layer, sample.device_id, sample.receiver_id, sample.timestamp, sample.rssi)
+
+  def addBatch(self, batch):
+    """Store every sample of a sample_batch.SampleBatch."""
+    rows = batch.samples
+    for phy, tx_hi, tx_lo, rx_hi, rx_lo, timestamp, rssi in zip(
+        rows['phy'].tolist(), rows['txid_hi'].tolist(), rows['txid_lo'].tolist(),
+        rows['rxid_hi'].tolist(), rows['rxid_lo'].tolist(),
+        rows['timestamp'].tolist(), rows['rssi'].tolist()):
+      self.add(phy, (tx_hi, tx_lo), (rx_hi, rx_lo), timestamp, rssi)
+
+  def evict(self):
+    """Drop full chunks and silent series older than max_age."""
+    cutoff = self.newest - self.max_age
+    full_chunks = self.full_chunks
+    while full_chunks and full_chunks[0][0] < cutoff:
+      newest, series, is_device = full_chunks.popleft()
+      # Chunks of a series fill up in order, so this is its oldest chunk
+      chunk = series.pop(0)
+      if is_device:
+        self.samples -= chunk.count
+      self.evicted_chunks += 1
+    if self.newest >= self.next_sweep:
+      self.next_sweep = self.newest + self.max_age
+      for index in (self.device_series, self.receiver_series):
+        silent = [key for key, series in index.items() if series[-1].newest < cutoff]
+        for key in silent:
+          series = index.pop(key)
+          if index is self.device_series:
+            self.samples -= sum(chunk.count for chunk in series)
+          self.evicted_chunks += len(series)
+          series.clear()
+      # Forget queued chunks of dropped series
+      self.full_chunks = collections.deque(entry for entry in full_chunks if entry[1])
+
+  def series(self, device_id, receiver_id):
+    if device_id is not None:
+      return self.device_series.get(device_id, ())
+    return self.receiver_series.get(receiver_id, ())
+
+  def lastN(self, n, device_id = None, receiver_id = None):
+    """The last n samples of a device (or of a receiver if no device_id is
+    given) as a list of SeriesSlices, oldest first."""
+    result = []
+    for chunk in reversed(self.series(device_id, receiver_id)):
+      if n <= 0:
+        break
+      start = max(0, chunk.count - n)
+      result.append(chunk.view(start, chunk.count))
+      n -= chunk.count - start
+    result.reverse()
+    return result
+
+  def range(self, start, stop, device_id = None, receiver_id = None):
+    """The samples of a device (or of a receiver) with start <= timestamp <
+    stop as a list of SeriesSlices. Chunks that received samples out of
+    order are copied instead of viewed."""
+    result = []
+    for chunk in self.series(device_id, receiver_id):
+      if chunk.newest < start:
+        continue
+      if chunk.ordered:
+        first = bisect.bisect_left(chunk.timestamps, start, 0, chunk.count)
+        last = bisect.bisect_left(chunk.timestamps, stop, first, chunk.count)
+        if first < last:
+          result.append(chunk.view(first, last))
+      else:
+        indices = [i for i in range(chunk.count) if start <= chunk.timestamps[i] < stop]
+        if indices:
+          result.append(chunk.select(indices))
+    return result
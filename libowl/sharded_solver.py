@@ -0,0 +1,184 @@
+#Runs a CPU heavy solver on several processes.
+#Samples are sharded by device id so that all samples of a device, and any
+#state the solver keeps for it, always go to the same worker. Batches of
+#samples are written into a shared memory block per worker instead of being
+#pickled, and the workers' WMData results are pushed to the world model
+#together.
+
+import multiprocessing
+import pickle
+import struct
+import traceback
+from multiprocessing import shared_memory
+
+import sensor_sample as samples
+
+#Physical layer, transmitter high and low, receiver high and low,
+#timestamp, rssi, and length of the sense data that follows
+_RECORD = struct.Struct('=BQQQQQfL')
+
+def packSamples(buff, sample_list):
+  """Write as many samples as fit into buff. Returns the number of samples
+  and bytes written."""
+  offset = 0
+  count = 0
+  for sample in sample_list:
+    sense_len = len(sample.sense_data)
+    if offset + _RECORD.size + sense_len > len(buff):
+      break
+    _RECORD.pack_into(buff, offset, sample.phy_layer,
+        sample.device_id[0], sample.device_id[1],
+        sample.receiver_id[0], sample.receiver_id[1],
+        sample.timestamp, sample.rssi, sense_len)
+    offset += _RECORD.size
+    buff[offset:offset + sense_len] = sample.sense_data
+    offset += sense_len
+    count += 1
+  return count, offset
+
+def unpackSamples(buff, count):
+  """Read count samples written by packSamples."""
+  result = []
+  offset = 0
+  for i in range(count):
+    phy, tx_hi, tx_lo, rx_hi, rx_lo, timestamp, rssi, sense_len = _RECORD.unpack_from(buff, offset)
+    offset += _RECORD.size
+    sense_data = bytes(buff[offset:offset + sense_len])
+    offset += sense_len
+    result.append(samples.SensorSample(phy, (tx_hi, tx_lo), (rx_hi, rx_lo), timestamp, rssi, sense_data))
+  return result
+
+class WorkerError(RuntimeError):
+  """A worker's solve function raised. The message holds the worker's
+  traceback and the original exception is chained when it can be sent."""
+
+class WorkerFailure:
+  """Sent back by a worker instead of results when solve raises."""
+  def __init__(self, error, trace):
+    try:
+      pickle.dumps(error)
+    except Exception:
+      error = None
+    self.error = error
+    self.trace = trace
+
+def workerMain(solve, shm_name, conn):
+  """Worker process loop: solve each batch written to shared memory and send
+  back the results."""
+  shm = shared_memory.SharedMemory(name = shm_name)
+  # State that persists across batches, such as per device filters
+  state = {}
+  try:
+    while True:
+      request = conn.recv()
+      if request is None:
+        break
+      try:
+        result = solve(unpackSamples(shm.buf, request), state)
+      except Exception as error:
+        result = WorkerFailure(error, traceback.format_exc())
+      conn.send(result)
+  finally:
+    shm.close()
+
+class ShardedSolver:
+  def __init__(self, solve, workers = None, buffer_size = 1 << 22, world_model = None, create_uris = False):
+    """Start worker processes that call solve(samples, state) for each batch
+    of SensorSamples. solve must be a module level function returning a list
+    of WMData, and state is a dictionary private to the worker. Each worker
+    gets a shared memory block of buffer_size bytes. If world_model is given
+    the results of every round are sent with one pushData call."""
+    if workers is None:
+      workers = multiprocessing.cpu_count()
+    self.world_model = world_model
+    self.create_uris = create_uris
+    self.blocks = []
+    self.conns = []
+    self.processes = []
+    for i in range(workers):
+      block = shared_memory.SharedMemory(create = True, size = buffer_size)
+      parent_conn, child_conn = multiprocessing.Pipe()
+      process = multiprocessing.Process(target = workerMain, args = (solve, block.name, child_conn), daemon = True)
+      process.start()
+      child_conn.close()
+      self.blocks.append(block)
+      self.conns.append(parent_conn)
+      self.processes.append(process)
+    # Samples waiting to be sent to each worker
+    self.pending = [[] for i in range(workers)]
+    # Workers that are solving a batch
+    self.busy = [False] * workers
+    self.batches = 0
+    self.samples = 0
+
+  def shard(self, device_id):
+    """The worker responsible for a device."""
+    return hash(device_id) % len(self.processes)
+
+  def add(self, sample):
+    """Queue a sample for its device's worker."""
+    self.pending[self.shard(sample.device_id)].append(sample)
+
+  def addSamples(self, sample_list):
+    for sample in sample_list:
+      self.pending[self.shard(sample.device_id)].append(sample)
+
+  def dispatch(self):
+    """Send queued samples to every idle worker."""
+    for worker, pending in enumerate(self.pending):
+      if self.busy[worker] or 0 == len(pending):
+        continue
+      count, size = packSamples(self.blocks[worker].buf, pending)
+      if 0 == count:
+        raise RuntimeError("Sample does not fit into the shared memory buffer!")
+      # Samples that did not fit wait for the next round
+      self.pending[worker] = pending[count:]
+      self.conns[worker].send(count)
+      self.busy[worker] = True
+      self.batches += 1
+      self.samples += count
+
+  def collect(self):
+    """Wait for every busy worker and return their combined results. Raises
+    WorkerError if solve raised in any worker."""
+    results = []
+    failure = None
+    for worker, conn in enumerate(self.conns):
+      if self.busy[worker]:
+        result = conn.recv()
+        self.busy[worker] = False
+        if isinstance(result, WorkerFailure):
+          if failure is None:
+            failure = (worker, result)
+        else:
+          results.extend(result)
+    if failure is not None:
+      worker, result = failure
+      raise WorkerError("Solver worker {} failed:\n{}".format(worker, result.trace)) from result.error
+    return results
+
+  def process(self, sample_list = ()):
+    """Shard and solve the samples along with any still queued, then push
+    the results to the world model if there is one. Returns the results."""
+    self.addSamples(sample_list)
+    results = []
+    while any(self.pending):
+      self.dispatch()
+      results.extend(self.collect())
+    if self.world_model is not None and 0 < len(results):
+      self.world_model.pushData(results, self.create_uris)
+    return results
+
+  def close(self):
+    """Stop the workers and release the shared memory."""
+    for worker, conn in enumerate(self.conns):
+      if self.busy[worker]:
+        conn.recv()
+      conn.send(None)
+      conn.close()
+    for process in self.processes:
+      process.join()
+    for block in self.blocks:
+      block.close()
+      block.unlink()
+    self.processes = []
@@ -2,24 +2,19 @@
 #GRAIL3 aggregator as a solver.
 #Solvers subscribe to the aggregator and then receive packets.
 
-import struct
 import socket
+import time
+
+import aggregator_rules
+import grail_codec
 import sensor_sample as samples
+import frame_reader
+import sample_batch
+import sample_ring
 
-class IDMask:
-  #Takes in id and mask numbers
-  def __init__(self, sensor_id, mask = 0xFFFFFFFF):
-    """ID and mask for rule matching in the aggregator."""
-    # Leave the upper 8 bytes 0 since we aren't support 128bit values.
-    self.id = struct.pack('!QQ', 0, sensor_id)
-    self.mask = struct.pack('!QQ', 0, mask)
-
-class AggrRule:
-  #Physical layer (1 byte), an array of transmitter/mask values, and an 8-byte update interval in milliseconds
-  def __init__(self, phy_layer, txers, update_interval):
-    self.phy_layer = phy_layer
-    self.txers = txers
-    self.update_interval = update_interval
+#Rules are shared with the other clients
+IDMask = aggregator_rules.IDMask
+AggrRule = aggregator_rules.AggrRule
 
 class SolverAggregator:
   #Message constants
@@ -33,23 +28,58 @@ class SolverAggregator:
   BUFFER_OVERRUN        = 7
   VER_STRING = "GRAIL solver protocol"
 
-  def __init__(self, host, port):
+  def __init__(self, host, port, ring_capacity = None, overflow_policy = sample_ring.SampleRing.DROP_OLDEST, source = None):
+    """Connect to the aggregator. If ring_capacity is given then samples are
+    stored in a fixed size sample_ring.SampleRing (self.sample_ring) that
+    handles overflow with overflow_policy instead of in available_packets.
+    If source is given (such as a frame_capture.FrameReplay) then messages
+    are read from it instead of from an aggregator."""
     self.connected = False
     self.host = host
     self.port = port
+    self.socket = None
+
+    self.available_packets = []
+    self.sample_ring = None
+    if ring_capacity is not None:
+      self.sample_ring = sample_ring.SampleRing(ring_capacity, overflow_policy)
+    # Routes samples to consumers instead of storing them when set
+    self.rule_index = None
+    # Records every received message when set
+    self.recorder = None
+    # Also keeps every sample for queries when set
+    self.sample_store = None
+    # Counts messages and times each stage when set
+    self.instruments = None
+    self.cur_rules = []
+    # Number of BUFFER_OVERRUN messages, each reporting that the aggregator
+    # dropped data because this solver was not reading fast enough
+    self.aggregator_overruns = 0
+    # Reconnects with this reconnect.Backoff when set
+    self.backoff = None
+    # Rules of the last subscription, replayed after reconnecting
+    self.subscription = None
+    self.reconnects = 0
+    # Seconds from losing the connection until it was restored, last time
+    self.recovery_time = None
+
+    if source is not None:
+      self.reader = source
+      self.connected = True
+    else:
+      self.connect()
+
+  def connect(self):
+    """Connect to the aggregator and perform the handshake."""
     self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
     if self.socket is None:
         raise RuntimeError("Unable to create solver-aggregator socket!")
-    self.socket.connect((host, port))
+    self.socket.connect((self.host, self.port))
     # Make the solver-aggregator handshake
-    handshake = b''
-    #The handshake is the length of the message, the protocol string, and the version (0).
-    handshake += struct.pack('!L', len(self.VER_STRING))
-    handshake += self.VER_STRING.encode('utf-8')
-    handshake += b'\x00\x00'
+    handshake = grail_codec.makeHandshake(self.VER_STRING)
     #Receive a handshake and then send one
     #TODO Should verify the bytes of the received message
-    remote_handshake = self.socket.recv(len(handshake))
+    remote_handshake = frame_reader.recvExactly(self.socket, len(handshake))
     if len(handshake) != len(remote_handshake):
         raise RuntimeError("Solver-Aggregator handshake error! Verify aggregator port and url.")
     for i in range(len(handshake)):
@@ -57,30 +87,106 @@ class SolverAggregator:
         self.connected = False
         raise RuntimeError("Solver-Aggregator handshake error! Verify aggregator port and url.")
     # Return the handshake
-    self.socket.send(handshake)
+    self.socket.sendall(handshake)
     self.connected = True
+    self.reader = frame_reader.FrameReader(self.socket)
 
-    self.available_packets = []
-    self.cur_rules = []
+  def droppedSamples(self):
+    """Number of samples dropped because the local sample ring was full."""
+    if self.sample_ring is None:
+      return 0
+    return self.sample_ring.dropped
 
   def close(self):
     """Close the connected socket."""
-    self.socket.close()
+    if self.socket is not None:
+      self.socket.close()
     self.connected = False
 
+  def setReconnect(self, backoff):
+    """Reconnect when the connection drops, waiting between attempts as
+    given by a reconnect.Backoff, and replay the last subscription. Pass
+    None to end the session when the connection drops instead."""
+    self.backoff = backoff
+
+  def reconnect(self):
+    """Reconnect and replay the subscription. Returns False if reconnecting
+    is off or the backoff gave up."""
+    if self.backoff is None or self.host is None:
+      return False
+    lost = time.monotonic()
+    self.close()
+    self.backoff.reset()
+    delay = self.backoff.nextDelay()
+    while delay is not None:
+      time.sleep(delay)
+      try:
+        self.connect()
+        if self.subscription is not None:
+          self.socket.sendall(grail_codec.encodeSubscription(self.subscription))
+      except (OSError, RuntimeError):
+        self.close()
+        delay = self.backoff.nextDelay()
+        continue
+      self.reconnects += 1
+      self.recovery_time = time.monotonic() - lost
+      if self.instruments is not None:
+        self.instruments.reconnected()
+        self.instruments.timing('recover', int(self.recovery_time * 1e9))
+      return True
+    return False
+
+  def readFrames(self, single):
+    """Read the next message (or every available message unless single),
+    reconnecting if the connection drops and reconnecting is on."""
+    while True:
+      try:
+        if self.instruments is None:
+          frames = self.reader.nextFrame() if single else self.reader.readFrames()
+        else:
+          start = time.perf_counter_ns()
+          frames = self.reader.nextFrame() if single else self.reader.readFrames()
+          self.instruments.timing('recv', time.perf_counter_ns() - start)
+      except ConnectionError:
+        frames = None if single else []
+      # Keep alives are empty frames, a closed connection gives no frame
+      closed = frames is None if single else 0 == len(frames)
+      if not closed or not self.reconnect():
+        return frames
+
   def handleMessage(self):
-    """Handle the next message (currently of type unknown)"""
-    # Get the message length
-    in_bytes = self.socket.recv(4)
-    # Session ends of the packet is malformed or no data is read
-    if 4 != len(in_bytes):
+    """Handle the next message (currently of type unknown)
+    Messages that arrived together are served from the read buffer without
+    another receive."""
+    inbuff = self.readFrames(True)
+    # Session ends if the connection closed and was not restored
+    if inbuff is None:
         self.close()
         print("Solver Aggregator connection closed")
         return None
-    inlen = struct.unpack('!L', (in_bytes))[0]
-    # Attempt to receive the packet
-    inbuff = self.socket.recv(inlen)
-    # The next byte indicates the message type
+    return self.handleFrame(inbuff)
+
+  def handleFrame(self, inbuff):
+    """Handle one complete message without its length prefix and return
+    its type."""
+    if self.instruments is None:
+      return self.decodeFrame(inbuff)
+    start = time.perf_counter_ns()
+    control = self.decodeFrame(inbuff)
+    self.instruments.timing('decode', time.perf_counter_ns() - start)
+    self.instruments.received(control, 4 + len(inbuff))
+    if self.SERVER_SAMPLE == control:
+      self.instruments.queueDepth('samples', len(self.sample_ring if self.sample_ring is not None else self.available_packets))
+    return control
+
+  def decodeFrame(self, inbuff):
+    """Decode one message and return its type."""
+    if self.recorder is not None:
+      self.recorder.record(inbuff)
+    # Empty messages carry no type and are skipped
+    if 0 == len(inbuff):
+      return self.KEEP_ALIVE
+    # The first byte indicates the message type
     control = inbuff[0]
     if self.SUBSCRIPTION_RESPONSE == control:
       self.decodeSubResponse(inbuff[1:])
@@ -88,59 +194,103 @@ class SolverAggregator:
     elif self.SERVER_SAMPLE == control:
       self.decodeServerSample(inbuff[1:])
       return self.SERVER_SAMPLE
+    elif self.BUFFER_OVERRUN == control:
+      self.aggregator_overruns += 1
+      return self.BUFFER_OVERRUN
     else:
       # Other message (like keep alive) require no processing
       # TODO Check that this was a valid message type
       return control
 
+  def handleBatch(self):
+    """Handle every message that is currently available, blocking until at
+    least one arrives. Server samples are decoded together into a
+    sample_batch.SampleBatch instead of being added to available_packets.
+    Returns the (possibly empty) batch or None if the connection closed.
+    Requires NumPy."""
+    frames = self.readFrames(False)
+    if self.instruments is not None:
+      start = time.perf_counter_ns()
+    if not frames:
+      self.close()
+      print("Solver Aggregator connection closed")
+      return None
+    sample_frames = []
+    for inbuff in frames:
+      if self.recorder is not None:
+        self.recorder.record(inbuff)
+      # Keep alives are empty and only counted
+      if 0 == len(inbuff):
+        control = self.KEEP_ALIVE
+      else:
+        control = inbuff[0]
+      if self.SERVER_SAMPLE == control:
+        sample_frames.append(inbuff[1:])
+      elif self.SUBSCRIPTION_RESPONSE == control:
+        self.decodeSubResponse(inbuff[1:])
+      elif self.BUFFER_OVERRUN == control:
+        self.aggregator_overruns += 1
+      if self.instruments is not None:
+        self.instruments.received(control, 4 + len(inbuff))
+    batch = sample_batch.decodeServerSamples(sample_frames)
+    if self.sample_store is not None:
+      self.sample_store.addBatch(batch)
+    if self.instruments is not None:
+      self.instruments.timing('decode', time.perf_counter_ns() - start)
+    return batch
+
   def decodeSubResponse(self, inbuff):
     """Decode a subscription response and store the current rules in
        self.cur_rules"""
-    print("Got subscription response!")
-    num_rules = struct.unpack('!L', inbuff[0:4])[0]
-    rest = inbuff[4:]
-    rules = []
-    for i in range(num_rules):
-      phy_layer, num_txers = struct.unpack('!BL', rest[0:5])
-      txlist = []
-      rest = rest[5:]
-      for j in range(num_txers):
-        txlist.append(rest[0:32])
-        rest = rest[32:]
-      update_interval = struct.unpack('!Q', rest[0:8])[0]
-      rest = rest[8:]
-      rule = AggrRule(phy_layer, txlist, update_interval)
-      rules.append(rule)
     # Overwrite existing rules with new ones
     # TODO Verify that this is proper GRAIL behavior
-    self.cur_rules = rules
+    self.cur_rules = grail_codec.decodeSubscription(inbuff)
 
   #Decode a server sample message
   def decodeServerSample(self, inbuff):
     """Decode a data message"""
-    print("Decoding a server sample!")
-    if (0 < len(inbuff)):
-      phy_layer = inbuff[0]
-      rest = inbuff[1:]
-      txid = struct.unpack('!QQ', rest[0:16])
-      rxid = struct.unpack('!QQ', rest[16:32])
-      timestamp, rssi = struct.unpack('!Qf', rest[32:44])
-      sense_data = rest[44:]
-      self.available_packets.append(samples.SensorSample(phy_layer, txid, rxid, timestamp, rssi, sense_data))
+    fields = grail_codec.decodeSample(inbuff)
+    if fields is not None:
+      if self.sample_store is not None:
+        self.sample_store.add(*fields)
+      if self.rule_index is not None:
+        self.rule_index.route(samples.SensorSample(*fields))
+      elif self.sample_ring is not None:
+        self.sample_ring.push(*fields)
+      else:
+        self.available_packets.append(samples.SensorSample(*fields))
+
+  def setRecorder(self, recorder):
+    """Pass every received message to a frame_capture.FrameRecorder, or stop
+    recording if recorder is None."""
+    self.recorder = recorder
+
+  def setInstrumentation(self, instruments):
+    """Count messages and time each stage with an
+    instrumentation.Instrumentation, or stop if instruments is None."""
+    self.instruments = instruments
+
+  def setSampleStore(self, store):
+    """Also store every sample in a sample_store.SampleStore for last-N and
+    time range queries, or stop if store is None."""
+    self.sample_store = store
+
+  def setRuleIndex(self, index):
+    """Route every sample through a rule_index.RuleIndex to the consumers
+    registered with it rather than storing samples. Pass None to go back to
+    storing samples."""
+    self.rule_index = index
 
   def sendSubscription(self, rules):
-    """Subscribe to data from the aggregator"""
-    # Start assembling a request message
-    buff = struct.pack('!BL', self.SUBSCRIPTION_REQUEST, len(rules))
-    for rule in rules:
-      buff += struct.pack('!BL', rule.phy_layer, len(rule.txers))
-      # Push each transmitter/mask pair
-      for txer in rule.txers:
-        buff += txer.id + txer.mask
-      buff += struct.pack('!Q', rule.update_interval)
-    # Send the message prepended with the length
-    len_hdr = struct.pack('!L', len(buff))
-    self.socket.send(len_hdr + buff)
+    """Subscribe to data from the aggregator. When reading from a source
+    nothing is sent and messages are read up to the recorded subscription
+    response."""
+    self.subscription = rules
+    if self.socket is not None:
+      request = grail_codec.encodeSubscription(rules)
+      self.socket.sendall(request)
+      if self.instruments is not None:
+        self.instruments.sent(self.SUBSCRIPTION_REQUEST, len(request))
 
     # Get the subscription response
     response = self.handleMessage()
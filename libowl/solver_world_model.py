@@ -2,223 +2,555 @@
 #GRAIL3 aggregator as a solver.
 #Solvers subscribe to the aggregator and then receive packets.
 
-import struct
+import collections
+import select
 import socket
+import time
 
-import transient_request
-import wm_data
-import buffer_manip
+import frame_reader
+import grail_codec
+import wm_encoder
+import push_coalescer
+import timer_wheel
+import transient_matcher
 
 
+def assignAliases(name_to_alias, alias_to_name, attributes, transient = False):
+  """Assign aliases to the names of attributes that do not have one yet.
+  Returns [name, alias, transient] entries for a type announcement."""
+  new_aliases = []
+  for attr in attributes:
+    # Add if this is new
+    if (attr.name not in name_to_alias):
+      new_alias = int(len(name_to_alias))
+      name_to_alias[attr.name] = new_alias
+      alias_to_name[new_alias] = attr.name
+      # TODO This would be more readable as a map or actual type
+      new_aliases.append([attr.name, new_alias, transient])
+  return new_aliases
+
 class SolverWorldModel:
   #Message constants
-  KEEP_ALIVE       = 0
-  TYPE_ANNOUNCE    = 1
-  START_TRANSIENT  = 2
-  STOP_TRANSIENT   = 3
-  SOLVER_DATA      = 4
-  CREATE_URI       = 5
-  EXPIRE_URI       = 6
-  DELETE_URI       = 7
-  EXPIRE_ATTRIBUTE = 8
-  DELETE_ATTRIBUTE = 9
+  KEEP_ALIVE       = grail_codec.WM_KEEP_ALIVE
+  TYPE_ANNOUNCE    = grail_codec.WM_TYPE_ANNOUNCE
+  START_TRANSIENT  = grail_codec.WM_START_TRANSIENT
+  STOP_TRANSIENT   = grail_codec.WM_STOP_TRANSIENT
+  SOLVER_DATA      = grail_codec.WM_SOLVER_DATA
+  CREATE_URI       = grail_codec.WM_CREATE_URI
+  EXPIRE_URI       = grail_codec.WM_EXPIRE_URI
+  DELETE_URI       = grail_codec.WM_DELETE_URI
+  EXPIRE_ATTRIBUTE = grail_codec.WM_EXPIRE_ATTRIBUTE
+  DELETE_ATTRIBUTE = grail_codec.WM_DELETE_ATTRIBUTE
   VER_STRING = "GRAIL world model protocol"
 
-  def __init__(self, host, port, origin, start_transient_callback = None, stop_transient_callback = None):
+  def __init__(self, host, port, origin, start_transient_callback = None, stop_transient_callback = None, encoder_cache_size = 8192):
     # The origin string of this solver
     # This provides data provenance
     self.origin = origin
+    # Encodes outgoing messages and caches encoded URIs and names
+    self.encoder = wm_encoder.WMEncoder(origin, encoder_cache_size)
+    # Merges pushes into fewer messages when coalescing is enabled
+    self.coalescer = None
+    # Counts messages and times each stage when set
+    self.instruments = None
+    # Suppresses unchanged attributes when set
+    self.push_cache = None
+    # Tracks transient requests so that only requested URIs are pushed
+    self.transients = transient_matcher.TransientMatcher()
+    # Sends expire messages when their time comes if set
+    self.wheel = None
+    # (uri, name) of attributes or (uri, None) of URIs -> timer_wheel.Timer
+    self.expirations = {}
     self.connected = False
     self.host = host
     self.port = port
+    # Reconnects with this reconnect.Backoff when set
+    self.backoff = None
+    # Messages waiting for the connection to be restored
+    self.pending = collections.deque()
+    self.max_pending = 0
+    self.dropped_messages = 0
+    # Seconds between checks for a closed connection before sending, and
+    # the time of the next check
+    self.peer_check_interval = 0.1
+    self.next_peer_check = 0
+    # Time the connection was lost and of the next reconnect attempt
+    self.lost_time = None
+    self.next_attempt = None
+    self.reconnects = 0
+    # Seconds from losing the connection until it was restored, last time
+    self.recovery_time = None
+    self.connect()
+
+    self.name_to_alias = {}
+    self.alias_to_name = {}
+    # Every [name, alias, transient] entry announced, to announce again
+    # after reconnecting
+    self.announced = []
+
+    # Callback for when the world model requests transient data
+    self.start_transient_callback = start_transient_callback
+    # Callback for when the world model no longer wants a transient type
+    self.stop_transient_callback = stop_transient_callback
+
+  def connect(self):
+    """Connect to the world model and perform the handshake."""
     self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
     if self.socket is None:
         raise RuntimeError("Unable to create solver-aggregator socket!")
-    self.socket.connect((host, port))
-    handshake = b''
-    # The handshake is the length of the message, the protocol string, and the version (0).
-    handshake += struct.pack('!L', len(self.VER_STRING))
-    handshake += self.VER_STRING.encode('utf-8')
-    handshake += b'\x00\x00'
+    self.socket.connect((self.host, self.port))
+    handshake = grail_codec.makeHandshake(self.VER_STRING)
     # Send and receive handshakes
-    self.socket.send(handshake)
-    inshake = self.socket.recv(len(handshake))
-    # TODO Can python's socket return without getting the full handshake?
-    while (len(inshake) < len(handshake)):
-      print ("Waiting for {} bytes more of handshake.".format(len(handshake) - len(inshake)))
-      inshake += self.socket.recv(len(handshake) - len(inshake))
+    self.socket.sendall(handshake)
+    inshake = frame_reader.recvExactly(self.socket, len(handshake))
 
     self.connected = True
     if len(handshake) != len(inshake):
+        self.connected = False
         raise RuntimeError("Solver-World Model handshake error! Verify world model port and url.")
     for i in range(len(handshake)):
       if handshake[i] != inshake[i]:
         self.connected = False
         raise RuntimeError("Solver-World Model handshake error! Verify world model port and url.")
+    self.reader = frame_reader.FrameReader(self.socket)
 
-    self.name_to_alias = {}
-    self.alias_to_name = {}
+  def setReconnect(self, backoff, max_pending = 10000, peer_check_interval = 0.1):
+    """Reconnect when the connection drops, waiting between attempts as
+    given by a reconnect.Backoff. Until the connection is restored up to
+    max_pending outgoing messages are kept, dropping the oldest, and sent
+    after every type has been announced again. A send checks whether the
+    world model closed the connection if peer_check_interval seconds passed
+    since the last check; otherwise the loss is found by the next read or
+    failed send, and messages sent before that are lost. Pass None to end
+    the session when the connection drops instead."""
+    self.backoff = backoff
+    self.max_pending = max_pending
+    self.peer_check_interval = peer_check_interval
 
-    # Callback for when the world model requests transient data
-    self.start_transient_callback = start_transient_callback
-    # Callback for when the world model no longer wants a transient type
-    self.stop_transient_callback = stop_transient_callback
+  def connectionLost(self):
+    """Close the broken connection and schedule the first reconnect."""
+    self.socket.close()
+    self.connected = False
+    # Pushes in flight may have been lost, so send everything again
+    if self.push_cache is not None:
+      self.push_cache.clear()
+    # A restarted world model requests transients again
+    self.transients.clearRequests()
+    self.lost_time = time.monotonic()
+    self.backoff.reset()
+    delay = self.backoff.nextDelay()
+    self.next_attempt = None if delay is None else self.lost_time + delay
+
+  def reconnect(self, wait = True):
+    """Try to restore a lost connection, then announce every type again and
+    send the messages kept meanwhile. Waits for the backoff between attempts
+    if wait is True, otherwise makes one attempt if it is due. Returns True
+    once connected and False if not (yet) or the backoff gave up."""
+    if self.backoff is None or self.next_attempt is None:
+      return False
+    while True:
+      now = time.monotonic()
+      if now < self.next_attempt:
+        if not wait:
+          return False
+        time.sleep(self.next_attempt - now)
+      try:
+        self.connect()
+        self.replay()
+        break
+      except (OSError, RuntimeError):
+        self.socket.close()
+        self.connected = False
+        delay = self.backoff.nextDelay()
+        if delay is None:
+          self.next_attempt = None
+          return False
+        self.next_attempt = time.monotonic() + delay
+    self.reconnects += 1
+    self.recovery_time = time.monotonic() - self.lost_time
+    if self.instruments is not None:
+      self.instruments.reconnected()
+      self.instruments.timing('recover', int(self.recovery_time * 1e9))
+    return True
+
+  def replay(self):
+    """Announce all types in one message and send the kept messages."""
+    if self.announced:
+      buff = self.encoder.encodeTypeAnnounce(self.announced)
+      self.socket.sendall(buff)
+      if self.instruments is not None:
+        self.instruments.sent(self.TYPE_ANNOUNCE, len(buff))
+    while self.pending:
+      control, buff, count = self.pending[0]
+      self.socket.sendall(buff)
+      self.pending.popleft()
+      if self.instruments is not None:
+        self.instruments.sent(control, len(buff), count)
+
+  def keepPending(self, control, buff, count):
+    """Keep a message to send after reconnecting."""
+    # Replaying announces every type, so announcements are not kept
+    if self.TYPE_ANNOUNCE == control:
+      return
+    if len(self.pending) >= self.max_pending:
+      self.pending.popleft()
+      self.dropped_messages += 1
+      # The dropped message may have been a push the cache counts as sent
+      if self.push_cache is not None:
+        self.push_cache.clear()
+    self.pending.append((control, buff, count))
+    if self.instruments is not None:
+      self.instruments.queueDepth('pending', len(self.pending))
+
+  def readFrame(self):
+    """Get the next complete message, possibly already buffered, reconnecting
+    if the connection drops and reconnecting is on. Returns None once the
+    session is over."""
+    while self.connected or self.reconnect():
+      try:
+        if self.instruments is None:
+          inbuff = self.reader.nextFrame()
+        else:
+          start = time.perf_counter_ns()
+          inbuff = self.reader.nextFrame()
+          self.instruments.timing('recv', time.perf_counter_ns() - start)
+      except ConnectionError:
+        inbuff = None
+      if inbuff is not None or self.backoff is None:
+        return inbuff
+      self.connectionLost()
+    return None
 
   #Handle a message of currently unknown type
   def handleMessage(self):
-    #Get the message length as n unsigned integer
-    # Get the message length
-    in_bytes = self.socket.recv(4)
-    # Session ends of the packet is malformed or no data is read
-    if 4 != len(in_bytes):
+    inbuff = self.readFrame()
+    # Session ends if the connection closed and was not restored
+    if inbuff is None:
         self.close()
-        print("Solver Aggregator connection closed")
+        print("Solver World Model connection closed")
         return None
-    in_bytes = struct.unpack('!L', (in_bytes))[0]
-    # Attempt to receive the packet
-    inbuff = self.socket.recv(inlen)
-    # The next byte indicates the message type
+    # Empty messages carry no type and are skipped, but counted as keep
+    # alives like the aggregator's
+    if 0 == len(inbuff):
+      if self.instruments is not None:
+        self.instruments.received(self.KEEP_ALIVE, 4)
+      return self.KEEP_ALIVE
+    # The first byte indicates the message type
     control = inbuff[0]
+    self.flushIfDue()
+    if self.wheel is not None:
+      self.expireDue()
+    if self.instruments is not None:
+      self.instruments.received(control, 4 + len(inbuff))
+      start = time.perf_counter_ns()
     if control == self.START_TRANSIENT:
+      requests = self.decodeStartTransient(inbuff[1:])
+      self.transients.start(requests)
       if (self.start_transient_callback is not None):
-        self.start_transient_callback.call(decodeStartTransient(inbuff[1:]))
+        self.start_transient_callback(requests)
     elif control == self.STOP_TRANSIENT:
+      requests = self.decodeStopTransient(inbuff[1:])
+      self.transients.stop(requests)
       if (self.stop_transient_callback is not None):
-        self.stop_transient_callback.call(decodeStopTransient(inbuff[1:]))
+        self.stop_transient_callback(requests)
+    if self.instruments is not None:
+      self.instruments.timing('decode', time.perf_counter_ns() - start)
     return control
 
   def decodeStartTransient(self, inbuff):
     """Decode a start transient message"""
-    num_aliases = struct.unpack('!L', inbuff[0:4])[0]
-    rest = inbuff[4:]
-    new_trans_requests = []
-    for i in range(num_aliases):
-      type_alias = struct.unpack('!L', rest[0:4])[0]
-      total_expressions = struct.unpack('!L', rest[4:8])[0]
-      t_request = TransientRequest(type_alias, [])
-      rest = rest[8:]
-      for j in range(total_expressions):
-        exp, rest = buffer_manip.splitURIFromRest(rest)
-        t_request.expressions.append(exp)
-      new_trans_requests.append(t_request)
-    return new_trans_requests
+    return grail_codec.decodeTransientRequests(inbuff)
 
   def decodeStopTransient(self, inbuff):
     """Decode a stop transient message"""
-    num_aliases = struct.unpack('!L', inbuff[0:4])[0]
-    rest = inbuff[4:]
-    new_trans_requests = []
-    for i in range(num_aliases):
-      type_alias = struct.unpack('!L', rest[0:4])[0]
-      total_expressions = struct.unpack('!L', rest[4:8])[0]
-      t_request = TransientRequest(type_alias, [])
-      rest = rest[8:]
-      for j in range(total_expressions):
-        exp, rest = buffer_manip.splitURIFromRest(rest)
-        t_request.expressions.append(exp)
-      new_trans_requests.append(t_request)
-    return new_trans_requests
+    return grail_codec.decodeTransientRequests(inbuff)
 
   def close(self):
     """Close this connection"""
+    if self.connected:
+      self.flush()
     self.socket.close()
     self.connected = False
+    # Do not reconnect after closing
+    self.next_attempt = None
 
   def addSolutionTypes(self, attributes, transient = False):
     """Add some SolutionType objects to the known list"""
-    new_aliases = []
-    for attr in attributes:
-      # Add if this is new
-      if (attr.name not in self.name_to_alias):
-        new_alias = int(len(self.name_to_alias))
-        self.name_to_alias[attr.name] = new_alias
-        self.alias_to_name[new_alias] = attr.name
-        # TODO This would be more readable as a map or actual type
-        new_aliases.append([attr.name, new_alias, transient])
+    new_aliases = assignAliases(self.name_to_alias, self.alias_to_name, attributes, transient)
     # Need to let the world model know what types we can provide
     if (len(new_aliases) > 0):
+      if transient:
+        for name, alias, is_transient in new_aliases:
+          self.transients.addType(alias)
+      self.announced.extend(new_aliases)
       self.makeTypeAnnounce(new_aliases)
 
   def makeTypeAnnounce(self, type_info):
     """Send a message to the world model announcing the types provided by this
     solver and announcing the aliases from numbers to string to save space in
     future messages."""
-    # Start assembling a type announce message
-    buff = struct.pack('!BL', self.TYPE_ANNOUNCE, len(type_info))
-    for info in type_info:
-      # Pack the alias number, name as utf 16, and transient status
-      buff += struct.pack('!L', info[1])
-      type16 = info[0].encode('utf-16-be')
-      buff += struct.pack('!L', len(type16))
-      buff += type16
-      buff += struct.pack('!B', info[2])
-    #Add the origin string to the end of the message
-    buff += self.origin.encode('utf-16-be')
-    self.socket.send(struct.pack('!L', len(buff)) + buff)
+    self.sendMessage(self.TYPE_ANNOUNCE, self.encoder.encodeTypeAnnounce(type_info))
+
+  def sendMessage(self, control, buff):
+    """Send a complete message of the given type."""
+    self.transmit(control, [buff], 1)
+
+  def peerClosed(self):
+    """True if the world model closed the connection. Writes to a closed
+    connection succeed until the world model answers the first one with a
+    reset, losing their data, so this is checked before sending after a
+    pause. While sending steadily the failed sends find the loss."""
+    try:
+      if not select.select([self.socket], [], [], 0)[0]:
+        return False
+      return 0 == len(self.socket.recv(1, socket.MSG_PEEK))
+    except OSError:
+      return True
+
+  def checkPeer(self):
+    """Notice a connection the world model closed, checking at most once
+    per peer_check_interval while reconnecting is on."""
+    if self.connected and self.backoff is not None:
+      now = time.monotonic()
+      if now >= self.next_peer_check:
+        self.next_peer_check = now + self.peer_check_interval
+        if self.peerClosed():
+          self.connectionLost()
+
+  def transmit(self, control, buffers, count):
+    """Send count complete messages of the given type made of buffers. While
+    the connection is down and reconnecting is on the messages are kept and
+    one reconnect is attempted if it is due."""
+    self.checkPeer()
+    if not self.connected and self.backoff is not None and not self.reconnect(False):
+      if self.next_attempt is None:
+        raise ConnectionError("Unable to reconnect to the world model!")
+      self.keepPending(control, b''.join(buffers), count)
+      return
+    try:
+      if self.instruments is not None:
+        start = time.perf_counter_ns()
+      if 1 == len(buffers):
+        self.socket.sendall(buffers[0])
+      else:
+        frame_reader.sendBuffers(self.socket, buffers)
+      if self.instruments is not None:
+        self.instruments.timing('send', time.perf_counter_ns() - start)
+        self.instruments.sent(control, sum(len(buff) for buff in buffers), count)
+    except OSError:
+      if self.backoff is None:
+        raise
+      # Messages that were partly sent are sent again in full
+      self.connectionLost()
+      self.keepPending(control, b''.join(buffers), count)
 
   def pushData(self, wmdata_vector, create_uris = False):
     """Push URI attributes, automatically declaring new solution types
-    as non-streaming, non-transient types if they were not previously
-    declared."""
-    buff = struct.pack('!BB', self.SOLVER_DATA, create_uris)
+    as non-streaming types, transient if the attribute is, if they were not
+    previously declared. Attributes of transient types are only sent for
+    URIs the world model requested."""
+    #First make sure all of the solutions types have been declared
+    new_types = [attr for wmdata in wmdata_vector for attr in wmdata.attributes
+                 if attr.name not in self.name_to_alias]
+    if new_types:
+      self.addSolutionTypes([attr for attr in new_types if not attr.transient])
+      self.addSolutionTypes([attr for attr in new_types if attr.transient], True)
+    if self.transients.types:
+      # Requests of a world model that went away do not count
+      self.checkPeer()
+      wmdata_vector = self.transients.filter(wmdata_vector, self.name_to_alias)
+    if self.wheel is not None:
+      self.scheduleAttributes(wmdata_vector)
+    if self.push_cache is not None:
+      wmdata_vector = self.push_cache.filter(wmdata_vector)
+    if 0 == len(wmdata_vector):
+      return
+    if self.instruments is not None:
+      start = time.perf_counter_ns()
+    if self.coalescer is None:
+      buff = self.encoder.encodeSolverData(wmdata_vector, self.name_to_alias, create_uris)
+      if self.instruments is not None:
+        self.instruments.timing('encode', time.perf_counter_ns() - start)
+      self.sendMessage(self.SOLVER_DATA, buff)
+    else:
+      attributes, total_solns = self.encoder.encodeAttributes(wmdata_vector, self.name_to_alias)
+      flush = self.coalescer.add(attributes, total_solns, create_uris)
+      if self.instruments is not None:
+        self.instruments.timing('encode', time.perf_counter_ns() - start)
+        self.instruments.queueDepth('coalesced', len(self.coalescer))
+      if flush:
+        self.flush()
+    if self.wheel is not None:
+      self.expireDue()
 
-    # Find the total number of attributes being pushed
-    total_solns = 0
-    for wdata in wmdata_vector:
-      total_solns += len(wdata.attributes)
-    buff += struct.pack('!L', total_solns)
+  def setPushCache(self, cache):
+    """Only push attributes whose data changed since they were last pushed,
+    as tracked by a push_cache.PushCache, or push everything if cache is
+    None."""
+    self.push_cache = cache
 
-    #Now create each solution and push it back into the buffer
-    for wmdata in wmdata_vector:
-      #First make sure all of the solutions types have been declared
-      self.addSolutionTypes(wmdata.attributes)
-      #Now push back this attribute's data using an alias for the name
-      for attr in wmdata.attributes:
-        buff += struct.pack('!LQ', self.name_to_alias[attr.name], int(attr.creation))
-        # The URI must be prepended with its size
-        uri16 = wmdata.uri.encode('utf-16-be')
-        buff += struct.pack('!L', len(uri16))
-        buff += uri16
-        buff += struct.pack('!L', len(attr.data))
-        buff += attr.data
-    #Send the message with its length prepended to the front
-    self.socket.send(struct.pack('!L', len(buff)) + buff)
+  def setInstrumentation(self, instruments):
+    """Count messages and time each stage with an
+    instrumentation.Instrumentation, or stop if instruments is None."""
+    self.instruments = instruments
+
+  def setCoalescing(self, max_bytes = 65536, max_attributes = 4096, max_delay = 0.01):
+    """Accumulate pushes and send them as merged solver data messages once
+    max_bytes of attribute data or max_attributes attributes are pending or
+    the oldest pending push is max_delay seconds old. The delay is only
+    checked when pushing and handling messages, so a solver that goes quiet
+    must call flushIfDue periodically (or flush) or its last pushes are
+    never sent. Pushes with different create_uris settings are
+    never merged. Passing None for max_bytes turns coalescing off."""
+    self.flush()
+    if max_bytes is None:
+      self.coalescer = None
+    else:
+      self.coalescer = push_coalescer.PushCoalescer(max_bytes, max_attributes, max_delay)
+
+  def flush(self):
+    """Send all coalesced pushes."""
+    if self.coalescer is not None and 0 < len(self.coalescer):
+      messages = len(self.coalescer.segments)
+      self.transmit(self.SOLVER_DATA, self.coalescer.take(self.encoder), messages)
+
+  def flushIfDue(self):
+    """Send coalesced pushes if the oldest has waited long enough."""
+    if self.coalescer is not None and self.coalescer.due():
+      self.flush()
 
   ##
   #Create an object with the given name in the world model.
   def createURI(self, uri, creation_time):
-    buff = struct.pack('!B', self.CREATE_URI)
-    uri16 = uri.encode('utf-16-be')
-    buff += struct.pack('!L', len(uri16))
-    buff += uri16
-    buff += struct.pack('!Q', creation_time)
-    buff += self.origin.encode('utf-16-be')
-    #Send the message with its length prepended to the front
-    self.socket.send(struct.encode('!L', len(buff)) + buff)
+    # Keep the order of pushes and object changes
+    self.flush()
+    self.sendMessage(self.CREATE_URI, self.encoder.encodeURIMessage(self.CREATE_URI, uri, creation_time))
 
   ##
   #Expire the object with the given name in the world model, indicating that it
   #is no longer valid after the given time.
   def expireURI(self, uri, expiration_time):
-    buff = struct.pack('!B', self.EXPIRE_URI)
-    uri16 = uri.encode('utf-16-be')
-    buff += struct.pack('!L', len(uri16))
-    buff += uri16
-    buff += struct.pack('!Q', expiration_time)
-    buff += self.origin.encode('utf-16-be')
-    #Send the message with its length prepended to the front
-    self.socket.send(struct.encode('!L', len(buff)) + buff)
+    # Keep the order of pushes and object changes
+    self.flush()
+    self.invalidate(uri)
+    self.sendMessage(self.EXPIRE_URI, self.encoder.encodeURIMessage(self.EXPIRE_URI, uri, expiration_time))
 
   ##
   #Delete an object in the world model.
   def deleteURI(self, uri):
-    buff = struct.pack('!B', self.DELETE_URI)
-    uri16 = uri.encode('utf-16-be')
-    buff += struct.pack('!L', len(uri16))
-    buff += uri16
-    buff += self.origin.encode('utf-16-be')
-    #Send the message with its length prepended to the front
-    self.socket.send(struct.encode('!L', len(buff)) + buff)
-
-  #TODO Expire a URI's attribute
-  #TODO Delete a URI's attribute
+    # Keep the order of pushes and object changes
+    self.flush()
+    self.invalidate(uri)
+    self.sendMessage(self.DELETE_URI, self.encoder.encodeURIMessage(self.DELETE_URI, uri))
+
+  ##
+  #Expire an attribute of an object in the world model, indicating that it is
+  #no longer valid after the given time. The attribute's type must have been
+  #declared.
+  def expireAttribute(self, uri, name, expiration_time):
+    # Keep the order of pushes and object changes
+    self.flush()
+    self.invalidate(uri, name)
+    self.sendMessage(self.EXPIRE_ATTRIBUTE, self.encoder.encodeAttributeMessage(
+        self.EXPIRE_ATTRIBUTE, uri, self.name_to_alias[name], expiration_time))
+
+  ##
+  #Delete an attribute of an object in the world model. The attribute's type
+  #must have been declared.
+  def deleteAttribute(self, uri, name):
+    # Keep the order of pushes and object changes
+    self.flush()
+    self.invalidate(uri, name)
+    self.sendMessage(self.DELETE_ATTRIBUTE, self.encoder.encodeAttributeMessage(
+        self.DELETE_ATTRIBUTE, uri, self.name_to_alias[name]))
+
+  def invalidate(self, uri, name = None):
+    """Forget pushed data the world model no longer holds so that it is not
+    suppressed by the push cache."""
+    if self.push_cache is not None:
+      self.push_cache.invalidate(uri, name)
+
+  def setExpiration(self, tick = 100, slots = 256, levels = 4):
+    """Expire pushed attributes with a nonzero expiration time, and URIs and
+    attributes given to scheduleExpireURI and scheduleExpireAttribute, once
+    their time passes, checking in ticks of the given number of milliseconds
+    with a timer_wheel.TimerWheel. Expirations are sent when pushing and
+    handling messages; call expireDue periodically if neither happens often.
+    Passing None for tick stops expiring and forgets scheduled expirations."""
+    self.expirations.clear()
+    if tick is None:
+      self.wheel = None
+    else:
+      self.wheel = timer_wheel.TimerWheel(tick, slots, levels, round(time.time() * 1000))
+
+  def schedule(self, key, expiration_time):
+    if self.wheel is None:
+      raise RuntimeError("Call setExpiration before scheduling expirations")
+    timer = self.expirations.pop(key, None)
+    if timer is not None:
+      self.wheel.cancel(timer)
+    self.expirations[key] = self.wheel.schedule(expiration_time, key)
+
+  def scheduleExpireURI(self, uri, expiration_time):
+    """Expire an object once expiration_time (in milliseconds since the
+    epoch) passes, replacing its earlier scheduled expiration. Raises
+    RuntimeError unless setExpiration was called."""
+    self.schedule((uri, None), expiration_time)
+
+  def scheduleExpireAttribute(self, uri, name, expiration_time):
+    """Expire an attribute once expiration_time passes, replacing its earlier
+    scheduled expiration. The attribute's type must have been declared."""
+    if name not in self.name_to_alias:
+      raise KeyError("Attribute type {} was never declared".format(name))
+    self.schedule((uri, name), expiration_time)
+
+  def cancelExpiration(self, uri, name = None):
+    """Forget the scheduled expiration of an attribute, or of the object if
+    name is None."""
+    timer = self.expirations.pop((uri, name), None)
+    if timer is not None:
+      self.wheel.cancel(timer)
+
+  def scheduleAttributes(self, wmdata_vector):
+    """Schedule the expiration of pushed attributes. A new value without an
+    expiration time cancels the expiration of the one it replaces."""
+    expirations = self.expirations
+    for wmdata in wmdata_vector:
+      for attr in wmdata.attributes:
+        if attr.expiration:
+          self.schedule((wmdata.uri, attr.name), attr.expiration)
+        elif expirations:
+          timer = expirations.pop((wmdata.uri, attr.name), None)
+          if timer is not None:
+            self.wheel.cancel(timer)
+
+  def expireDue(self, now = None):
+    """Send expire messages for every scheduled expiration up to now (in
+    milliseconds since the epoch, the current time if None). All attributes
+    due are sent together, followed by all URIs due. Returns the number of
+    expire messages sent."""
+    if self.wheel is None:
+      return 0
+    if now is None:
+      now = round(time.time() * 1000)
+    due = self.wheel.advance(now)
+    if not due:
+      return 0
+    attributes = []
+    uris = []
+    for key in due:
+      timer = self.expirations.pop(key)
+      uri, name = key
+      self.invalidate(uri, name)
+      if name is None:
+        uris.append(self.encoder.encodeURIMessage(self.EXPIRE_URI, uri, timer.when))
+      else:
+        attributes.append(self.encoder.encodeAttributeMessage(
+            self.EXPIRE_ATTRIBUTE, uri, self.name_to_alias[name], timer.when))
+    # Keep the order of pushes and object changes
+    self.flush()
+    if attributes:
+      self.transmit(self.EXPIRE_ATTRIBUTE, attributes, len(attributes))
+    if uris:
+      self.transmit(self.EXPIRE_URI, uris, len(uris))
+    return len(due)
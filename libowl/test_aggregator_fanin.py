@@ -0,0 +1,71 @@
+#Tests of aggregator_fanin against fake aggregators. These need no servers:
+#
+#  python test_aggregator_fanin.py
+
+import time
+
+import aggregator_fanin
+import aggregator_rules
+import fake_servers
+
+RULES = [aggregator_rules.AggrRule(1, [aggregator_rules.IDMask(0, 0)], 0)]
+
+def test_merges_backlogs_in_order():
+  """Backlogs from aggregators read one after the other merge in timestamp
+  order without late samples."""
+  servers = [fake_servers.FakeAggregator(generator = fake_servers.SampleGenerator(start_time = 0), total = 200)
+             for i in range(2)]
+  fanin = aggregator_fanin.AggregatorFanIn([(server.host, server.port) for server in servers])
+  fanin.subscribe(RULES)
+  timestamps = [sample.timestamp for sample in fanin]
+  assert 400 == len(timestamps)
+  assert sorted(timestamps) == timestamps
+  assert [0, 0] == [stats.late for stats in fanin.stats]
+  assert [200, 200] == [stats.samples for stats in fanin.stats]
+  fanin.close()
+  for server in servers:
+    server.close()
+
+def test_silent_aggregator_is_not_waited_for():
+  """Samples are released after the reorder window while another aggregator
+  stays connected without sending."""
+  busy = fake_servers.FakeAggregator(total = 50)
+  silent = fake_servers.FakeAggregator(rate = 0.001)
+  fanin = aggregator_fanin.AggregatorFanIn([(busy.host, busy.port), (silent.host, silent.port)], reorder_window = 50)
+  fanin.subscribe(RULES)
+  timestamps = []
+  deadline = time.monotonic() + 10
+  while len(timestamps) < 50 and time.monotonic() < deadline:
+    timestamps.extend(sample.timestamp for sample in fanin.poll(0.1))
+  assert list(range(50)) == timestamps
+  assert fanin.connected()
+  fanin.close()
+  busy.close()
+  silent.close()
+
+def test_lagging_aggregator_is_bounded():
+  """An aggregator that keeps sending samples far older than the others
+  holds them back for at most the reorder window, and its samples are
+  dropped as late instead of breaking the order."""
+  ahead = fake_servers.FakeAggregator(generator = fake_servers.SampleGenerator(start_time = 100000), rate = 4000)
+  behind = fake_servers.FakeAggregator(generator = fake_servers.SampleGenerator(start_time = 0), rate = 4000)
+  fanin = aggregator_fanin.AggregatorFanIn([(ahead.host, ahead.port), (behind.host, behind.port)], reorder_window = 200)
+  fanin.subscribe(RULES)
+  timestamps = []
+  deadline = time.monotonic() + 0.5
+  while time.monotonic() < deadline:
+    timestamps.extend(sample.timestamp for sample in fanin.poll(0.05))
+    assert len(fanin.pending) < 1000
+  assert 500 < len(timestamps)
+  assert sorted(timestamps) == timestamps
+  assert 0 < fanin.stats[1].late
+  assert fanin.stats[1].lag > 90000
+  fanin.close()
+  ahead.close()
+  behind.close()
+
+if __name__ == '__main__':
+  for name, test in sorted(globals().items()):
+    if name.startswith('test_'):
+      test()
+      print("{} passed".format(name))
@@ -0,0 +1,66 @@
+#Tests of AsyncSolverAggregator against a fake aggregator. These need no
+#servers:
+#
+#  python test_async_solver_aggregator.py
+
+import asyncio
+
+import aggregator_rules
+import async_solver_aggregator
+import fake_servers
+
+RULES = [aggregator_rules.AggrRule(1, [aggregator_rules.IDMask(0, 0)], 0)]
+
+def test_subscribe_and_iterate():
+  """The subscription is answered and iteration ends with the stream."""
+  server = fake_servers.FakeAggregator(generator = fake_servers.SampleGenerator(start_time = 10), total = 300)
+  async def run():
+    async with async_solver_aggregator.AsyncSolverAggregator(server.host, server.port, queue_size = 16) as conn:
+      rules = await conn.subscribe(RULES)
+      assert 1 == len(rules) and 1 == rules[0].phy_layer
+      timestamps = [sample.timestamp async for sample in conn]
+      assert list(range(10, 310)) == timestamps
+      assert not conn.connected
+  asyncio.run(run())
+  server.close()
+
+def test_subscribe_after_disconnect():
+  """Subscribing on a closed connection fails instead of waiting forever."""
+  server = fake_servers.FakeAggregator(total = 5)
+  async def run():
+    conn = async_solver_aggregator.AsyncSolverAggregator(server.host, server.port)
+    await conn.connect()
+    await conn.subscribe(RULES)
+    assert 5 == len([sample async for sample in conn])
+    try:
+      await asyncio.wait_for(conn.subscribe(RULES), 5)
+      assert False
+    except ConnectionError:
+      pass
+    await conn.close()
+  asyncio.run(run())
+  server.close()
+
+def test_server_disconnect():
+  """Dropping the connection ends iteration."""
+  server = fake_servers.FakeAggregator(rate = 1000)
+  async def run():
+    conn = async_solver_aggregator.AsyncSolverAggregator(server.host, server.port)
+    await conn.connect()
+    await conn.subscribe(RULES)
+    count = 0
+    async for sample in conn:
+      count += 1
+      if 10 == count:
+        server.disconnectAll()
+    assert count >= 10
+    assert not conn.connected
+    await conn.close()
+  asyncio.run(asyncio.wait_for(run(), 10))
+  server.close()
+
+if __name__ == '__main__':
+  for name, test in sorted(globals().items()):
+    if name.startswith('test_'):
+      test()
+      print("{} passed".format(name))
@@ -0,0 +1,110 @@
+#Tests of AsyncSolverWorldModel against a fake world model. These need no
+#servers:
+#
+#  python test_async_solver_world_model.py
+
+import asyncio
+
+import async_solver_world_model
+import fake_servers
+import solver_world_model as swm
+import wm_data
+
+def data(uri, name = 'x', transient = False):
+  return wm_data.WMData(uri, [wm_data.WMAttribute(name, b'1', 1, transient = transient)])
+
+async def waitFor(condition, timeout = 5):
+  for i in range(int(timeout / 0.01)):
+    if condition():
+      return True
+    await asyncio.sleep(0.01)
+  return condition()
+
+def test_push_and_flush():
+  server = fake_servers.FakeWorldModel()
+  async def run():
+    async with async_solver_world_model.AsyncSolverWorldModel(server.host, server.port, 'test') as conn:
+      for i in range(20):
+        await conn.pushData([data('u{}'.format(i))])
+      await conn.flush()
+  asyncio.run(run())
+  assert server.waitForAttributes(20)
+  assert 20 == server.count(swm.SolverWorldModel.SOLVER_DATA)
+  assert 1 == server.count(swm.SolverWorldModel.TYPE_ANNOUNCE)
+  server.close()
+
+def test_transients_survive_failing_callback():
+  """Only requested URIs are pushed, and a callback that raises does not
+  stop later requests from being handled."""
+  server = fake_servers.FakeWorldModel()
+  started = []
+  def start(requests):
+    started.append(requests)
+    if 1 == len(started):
+      raise ValueError("callback failure")
+  async def run():
+    async with async_solver_world_model.AsyncSolverWorldModel(server.host, server.port, 'test', start) as conn:
+      await conn.addSolutionTypes([wm_data.WMAttribute('t', b'', 0)], True)
+      assert server.waitForClients(1)
+      server.requestTransient(swm.SolverWorldModel.START_TRANSIENT, [(0, ['a'])])
+      assert await waitFor(lambda: 1 == len(started))
+      server.requestTransient(swm.SolverWorldModel.START_TRANSIENT, [(0, ['b'])])
+      assert await waitFor(lambda: 2 == len(started))
+      assert 1 == conn.callback_errors
+      assert conn.connected
+      await conn.pushData([data(uri, 't', True) for uri in 'abc'])
+      server.requestTransient(swm.SolverWorldModel.STOP_TRANSIENT, [(0, ['a'])])
+      assert await waitFor(lambda: not conn.transients.requested(0, 'a'))
+      await conn.pushData([data('a', 't', True)])
+      await conn.flush()
+  asyncio.run(run())
+  assert server.waitForAttributes(2)
+  assert 2 == server.attributes
+  server.close()
+
+def test_put_racing_disconnect():
+  """A push waiting for room when the connection drops fails, and flush
+  does not wait for it."""
+  server = fake_servers.FakeWorldModel()
+  async def run():
+    conn = async_solver_world_model.AsyncSolverWorldModel(server.host, server.port, 'test', queue_size = 1)
+    await conn.connect()
+    # Stop the writer so that the queue stays full
+    conn.tasks[1].cancel()
+    await conn.queueMessage(b'')
+    waiting = asyncio.ensure_future(conn.queueMessage(b''))
+    await asyncio.sleep(0.01)
+    conn.connectionLost()
+    try:
+      await waiting
+      assert False
+    except ConnectionError:
+      pass
+    await asyncio.wait_for(conn.flush(), 1)
+    await conn.close()
+  asyncio.run(run())
+  server.close()
+
+def test_server_disconnect():
+  server = fake_servers.FakeWorldModel()
+  async def run():
+    conn = async_solver_world_model.AsyncSolverWorldModel(server.host, server.port, 'test')
+    await conn.connect()
+    await conn.pushData([data('u')])
+    await conn.flush()
+    server.disconnectAll()
+    assert await waitFor(lambda: not conn.connected)
+    try:
+      await conn.pushData([data('u')])
+      assert False
+    except ConnectionError:
+      pass
+    await conn.close()
+  asyncio.run(run())
+  server.close()
+
+if __name__ == '__main__':
+  for name, test in sorted(globals().items()):
+    if name.startswith('test_'):
+      test()
+      print("{} passed".format(name))
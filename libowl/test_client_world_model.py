@@ -0,0 +1,96 @@
+#Tests of the client world model and its attribute cache against a fake
+#world model. These need no servers:
+#
+#  python test_client_world_model.py
+
+import attribute_cache
+import client_world_model
+import fake_servers
+import wm_data
+
+def attr(name, data, creation = 5):
+  return wm_data.WMAttribute(name, data, creation, 0, 'gps')
+
+def test_cache_ttl():
+  """Entries are served until they are ttl seconds old."""
+  cache = attribute_cache.AttributeCache(ttl = 10)
+  cache.put('u', attr('x', b'1'), now = 0)
+  cache.putMissing('u', 'y', now = 0)
+  assert b'1' == cache.get('u', 'x', now = 10).data
+  assert [cache.get('u', 'x', now = 10)] == cache.getAll('u', ['x', 'y'], now = 10)
+  assert cache.get('u', 'x', now = 10.5) is None
+  assert cache.getAll('u', ['y'], now = 10.5) is None
+  assert 0 == len(cache)
+  assert 2 == cache.stats()['expirations']
+
+def test_cache_lru_and_updates():
+  """The least recently used entry is evicted first, older values do not
+  replace newer ones, and new values replace known absences."""
+  cache = attribute_cache.AttributeCache(max_entries = 2, ttl = None)
+  cache.put('u', attr('x', b'1'))
+  cache.put('u', attr('y', b'1'))
+  cache.get('u', 'x')
+  cache.put('u', attr('z', b'1'))
+  assert cache.get('u', 'y') is None
+  assert cache.get('u', 'x') is not None
+  assert 1 == cache.evictions
+  cache.put('u', attr('x', b'old', 1))
+  assert b'1' == cache.get('u', 'x').data
+  cache.putMissing('u', 'z')
+  assert [] == cache.getAll('u', ['z'])
+  cache.put('u', attr('z', b'2', 0))
+  assert b'2' == cache.get('u', 'z').data
+  cache.invalidate('u')
+  assert 0 == len(cache) and {} == cache.names
+
+def test_repeated_reads_use_the_cache():
+  """Attributes, present or absent, are only requested once."""
+  server = fake_servers.FakeClientWorldModel(objects = {'bus.1': [attr('location.x', b'1')]})
+  client = client_world_model.ClientWorldModel(server.host, server.port)
+  assert b'1' == client.getAttribute('bus.1', 'location.x').data
+  assert b'1' == client.getAttribute('bus.1', 'location.x').data
+  assert 1 == server.requests
+  assert client.getAttribute('bus.1', 'missing') is None
+  assert client.getAttribute('bus.1', 'missing') is None
+  assert [b'1'] == [a.data for a in client.getAttributes('bus.1', ['location.x', 'missing'])]
+  assert 2 == server.requests
+  client.close()
+  server.close()
+
+def test_stream_updates_cache():
+  """Stream updates replace cached values, including known absences, and
+  expired attributes leave the cache."""
+  server = fake_servers.FakeClientWorldModel(objects = {'bus.1': [attr('location.x', b'1')]})
+  client = client_world_model.ClientWorldModel(server.host, server.port, cache_ttl = None)
+  assert client.getAttribute('bus.1', 'speed') is None
+  updates = []
+  ticket = client.streamRequest('bus\\.1', ['.*'], 100, updates.append)
+  while len(updates) < 1:
+    client.handleMessage()
+  server.publish('bus.1', attr('location.x', b'2', 6))
+  server.publish('bus.1', attr('speed', b'3', 6))
+  while len(updates) < 3:
+    client.handleMessage()
+  requests = server.requests
+  assert b'2' == client.getAttribute('bus.1', 'location.x').data
+  assert b'3' == client.getAttribute('bus.1', 'speed').data
+  assert requests == server.requests
+  server.publish('bus.1', wm_data.WMAttribute('speed', b'3', 6, 7, 'gps'))
+  while len(updates) < 4:
+    client.handleMessage()
+  assert client.cache.get('bus.1', 'speed') is None
+  # Nothing is kept for a request with a callback once it completes
+  client.cancelRequest(ticket)
+  while client.REQUEST_COMPLETE != client.handleMessage():
+    pass
+  assert ticket not in client.results
+  assert ticket not in client.completed
+  assert ticket not in client.callbacks and ticket not in client.current
+  client.close()
+  server.close()
+
+if __name__ == '__main__':
+  for name, test in sorted(globals().items()):
+    if name.startswith('test_'):
+      test()
+      print("{} passed".format(name))
@@ -0,0 +1,110 @@
+#Tests of the solver and client classes against the fake servers. These need
+#no servers:
+#
+#  python test_fake_servers.py
+
+import aggregator_rules
+import client_world_model
+import fake_servers
+import solver_aggregator as sa
+import solver_world_model as swm
+import wm_data
+
+RULES = [aggregator_rules.AggrRule(1, [aggregator_rules.IDMask(0, 0)], 0)]
+
+def test_aggregator_subscription_and_samples():
+  """The handshake succeeds, the subscription is answered with the same
+  rules, and every generated sample arrives in order."""
+  server = fake_servers.FakeAggregator(generator = fake_servers.SampleGenerator(devices = 10, start_time = 5), total = 500)
+  solver = sa.SolverAggregator(server.host, server.port)
+  assert solver.connected
+  solver.sendSubscription(RULES)
+  assert 1 == len(solver.cur_rules)
+  assert 1 == solver.cur_rules[0].phy_layer
+  assert 1 == server.subscriptions
+  while solver.handleMessage() is not None:
+    pass
+  assert list(range(5, 505)) == [sample.timestamp for sample in solver.available_packets]
+  assert [(0, i % 10) for i in range(500)] == [sample.device_id for sample in solver.available_packets]
+  server.close()
+
+def test_aggregator_disconnect():
+  """Dropping the connection ends an endless sample stream."""
+  server = fake_servers.FakeAggregator(rate = 1000)
+  solver = sa.SolverAggregator(server.host, server.port)
+  solver.sendSubscription(RULES)
+  assert sa.SolverAggregator.SERVER_SAMPLE == solver.handleMessage()
+  server.disconnectAll()
+  while solver.handleMessage() is not None:
+    pass
+  assert not solver.connected
+  server.close()
+
+def test_world_model_records_solver_data():
+  """Type announcements and SOLVER_DATA messages and attributes are
+  counted."""
+  server = fake_servers.FakeWorldModel()
+  solver = swm.SolverWorldModel(server.host, server.port, 'test')
+  for i in range(10):
+    solver.pushData([wm_data.WMData('uri.{}'.format(i), [wm_data.WMAttribute('a', b'1', i),
+                                                         wm_data.WMAttribute('b', b'2', i)])])
+  assert server.waitForAttributes(20)
+  assert 10 == server.count(swm.SolverWorldModel.SOLVER_DATA)
+  assert 1 == server.count(swm.SolverWorldModel.TYPE_ANNOUNCE)
+  assert {0: 'a', 1: 'b'} == server.type_names
+  solver.close()
+  server.close()
+
+def test_world_model_transient_requests():
+  """Start and stop transient messages reach the solver's callbacks, and a
+  dropped connection ends the session."""
+  server = fake_servers.FakeWorldModel()
+  started = []
+  stopped = []
+  solver = swm.SolverWorldModel(server.host, server.port, 'test', started.extend, stopped.extend)
+  solver.addSolutionTypes([wm_data.WMAttribute('t', b'', 0)], True)
+  assert server.waitForClients(1)
+  server.requestTransient(swm.SolverWorldModel.START_TRANSIENT, [(0, ['uri\\..*'])])
+  assert swm.SolverWorldModel.START_TRANSIENT == solver.handleMessage()
+  assert [(0, ['uri\\..*'])] == [(request.name, request.expressions) for request in started]
+  server.requestTransient(swm.SolverWorldModel.STOP_TRANSIENT, [(0, ['uri\\..*'])])
+  assert swm.SolverWorldModel.STOP_TRANSIENT == solver.handleMessage()
+  assert 1 == len(stopped)
+  server.disconnectAll()
+  assert solver.handleMessage() is None
+  assert not solver.connected
+  server.close()
+
+def test_client_world_model_queries():
+  """Snapshots, ranges, streams, and searches are answered from the fake's
+  objects."""
+  attr = wm_data.WMAttribute
+  server = fake_servers.FakeClientWorldModel(objects = {
+      'bus.1': [attr('location.x', b'1', 5, 0, 'gps'), attr('location.y', b'2', 5, 0, 'gps')],
+      'bus.2': [attr('location.x', b'3', 6, 0, 'gps')]})
+  client = client_world_model.ClientWorldModel(server.host, server.port)
+  result = sorted(client.snapshot('bus\\..*', ['location\\.x']), key = lambda wmdata: wmdata.uri)
+  assert ['bus.1', 'bus.2'] == [wmdata.uri for wmdata in result]
+  assert [b'1'] == [a.data for a in result[0].attributes]
+  assert 'gps' == result[1].attributes[0].origin
+  assert ['bus.2'] == [wmdata.uri for wmdata in client.range('bus\\.2', ['.*'], 0, 100)]
+  assert ['bus.1', 'bus.2'] == sorted(client.searchURIs('bus\\..*'))
+  updates = []
+  ticket = client.streamRequest('bus\\.1', ['location\\.y'], 100, updates.append)
+  while len(updates) < 1:
+    client.handleMessage()
+  server.publish('bus.1', attr('location.y', b'9', 10, 0, 'gps'))
+  while len(updates) < 2:
+    client.handleMessage()
+  assert [b'2', b'9'] == [wmdata.attributes[0].data for wmdata in updates]
+  client.cancelRequest(ticket)
+  assert client_world_model.ClientWorldModel.REQUEST_COMPLETE == client.handleMessage()
+  assert 3 == server.requests
+  client.close()
+  server.close()
+
+if __name__ == '__main__':
+  for name, test in sorted(globals().items()):
+    if name.startswith('test_'):
+      test()
+      print("{} passed".format(name))
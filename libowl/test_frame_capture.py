@@ -0,0 +1,72 @@
+#Tests of frame_capture recording and replay. These need no servers:
+#
+#  python test_frame_capture.py
+
+import os
+import tempfile
+
+import aggregator_rules
+import fake_servers
+import frame_capture
+import solver_aggregator
+
+def test_record_and_replay():
+  """Recorded messages replay in order and seek finds sample timestamps."""
+  generator = fake_servers.SampleGenerator(start_time = 100)
+  frames = [generator.frame()[4:] for i in range(50)]
+  with tempfile.TemporaryDirectory() as directory:
+    path = os.path.join(directory, 'capture')
+    recorder = frame_capture.FrameRecorder(path, index_interval = 10)
+    for frame in frames:
+      recorder.record(frame)
+    recorder.close()
+    replay = frame_capture.FrameReplay(path)
+    assert frames == [bytes(frame) for frame in replay]
+    replay.seek(125)
+    assert 125 == frame_capture.sampleTimestamp(replay.nextFrame())
+    replay.close()
+
+def test_replay_empty_capture():
+  """A capture with no messages replays as empty."""
+  with tempfile.TemporaryDirectory() as directory:
+    path = os.path.join(directory, 'capture')
+    frame_capture.FrameRecorder(path).close()
+    replay = frame_capture.FrameReplay(path)
+    assert replay.nextFrame() is None
+    assert [] == replay.readFrames()
+    replay.seek(0)
+    replay.close()
+
+def test_replay_subscription():
+  """A solver reading a capture subscribes without sending and gets the
+  recorded rules and samples."""
+  rules = [aggregator_rules.AggrRule(1, [aggregator_rules.IDMask(0, 0)], 0)]
+  server = fake_servers.FakeAggregator(total = 20)
+  with tempfile.TemporaryDirectory() as directory:
+    path = os.path.join(directory, 'capture')
+    recorder = frame_capture.FrameRecorder(path)
+    aggregator = solver_aggregator.SolverAggregator(server.host, server.port)
+    aggregator.setRecorder(recorder)
+    aggregator.sendSubscription(rules)
+    while len(aggregator.available_packets) < 20:
+      aggregator.handleMessage()
+    aggregator.close()
+    server.close()
+    recorder.close()
+    replayed = solver_aggregator.SolverAggregator(None, None, source = frame_capture.FrameReplay(path))
+    replayed.sendSubscription(rules)
+    assert replayed.connected
+    assert rules == replayed.subscription
+    assert 1 == len(replayed.cur_rules)
+    assert [] == replayed.available_packets
+    while replayed.handleMessage() is not None:
+      pass
+    assert ([sample.timestamp for sample in aggregator.available_packets] ==
+            [sample.timestamp for sample in replayed.available_packets])
+    replayed.reader.close()
+
+if __name__ == '__main__':
+  for name, test in sorted(globals().items()):
+    if name.startswith('test_'):
+      test()
+      print("{} passed".format(name))
@@ -0,0 +1,96 @@
+#Tests of frame_reader over a local socket pair. These need no servers:
+#
+#  python test_frame_reader.py
+
+import socket
+import struct
+
+import frame_reader
+
+def frame(payload):
+  return struct.pack('!L', len(payload)) + payload
+
+def test_one_byte_at_a_time():
+  """Frames sent a byte at a time are reassembled."""
+  a, b = socket.socketpair()
+  reader = frame_reader.FrameReader(b, 8)
+  for byte in frame(b'\x01hello') + frame(b''):
+    a.send(bytes([byte]))
+  assert b'\x01hello' == bytes(reader.nextFrame())
+  assert b'' == bytes(reader.nextFrame())
+  a.close()
+  assert reader.nextFrame() is None
+  b.close()
+
+def test_many_frames_in_one_send():
+  """Frames arriving together are all returned by one readFrames call."""
+  a, b = socket.socketpair()
+  reader = frame_reader.FrameReader(b)
+  payloads = [bytes([i]) * i for i in range(1, 20)]
+  a.sendall(b''.join(frame(payload) for payload in payloads))
+  frames = []
+  while len(frames) < len(payloads):
+    frames.extend(bytes(f) for f in reader.readFrames())
+  assert payloads == frames
+  a.close()
+  assert [] == reader.readFrames()
+  b.close()
+
+def test_frame_larger_than_buffer():
+  """The buffer grows to hold a frame larger than its initial size, also
+  behind a partial frame that is moved to the front."""
+  a, b = socket.socketpair()
+  reader = frame_reader.FrameReader(b, 16)
+  big = bytes(range(256)) * 40
+  a.sendall(frame(b'small') + frame(big)[:10])
+  assert b'small' == bytes(reader.nextFrame())
+  a.sendall(frame(big)[10:] + frame(b'after'))
+  assert big == bytes(reader.nextFrame())
+  assert b'after' == bytes(reader.nextFrame())
+  assert len(reader.buff) >= 4 + len(big)
+  a.close()
+  b.close()
+
+class ShortSocket:
+  """Sends at most limit bytes per sendmsg call, like a full socket buffer."""
+  def __init__(self, limit):
+    self.limit = limit
+    self.data = bytearray()
+    self.calls = 0
+
+  def sendmsg(self, buffers):
+    self.calls += 1
+    sent = 0
+    for buff in buffers:
+      take = min(len(buff), self.limit - sent)
+      self.data += buff[:take]
+      sent += take
+      if sent == self.limit:
+        break
+    return sent
+
+def test_send_buffers_partial():
+  """sendBuffers continues after partial sends, including ones that end in
+  the middle of a buffer, and skips empty buffers."""
+  buffers = [b'abc', b'', bytearray(b'defghij'), memoryview(b'klmnopqrstuvwxyz')]
+  for limit in (1, 2, 5, 100):
+    sock = ShortSocket(limit)
+    frame_reader.sendBuffers(sock, buffers)
+    assert b'abcdefghijklmnopqrstuvwxyz' == bytes(sock.data)
+    assert sock.calls == -(-26 // limit)
+
+def test_send_buffers_socket():
+  """Gathered frames sent with sendBuffers read back in order."""
+  a, b = socket.socketpair()
+  reader = frame_reader.FrameReader(b)
+  payloads = [bytes([i % 256]) * (i * 37) for i in range(20)]
+  frame_reader.sendBuffers(a, [frame(payload) for payload in payloads])
+  assert payloads == [bytes(reader.nextFrame()) for payload in payloads]
+  a.close()
+  b.close()
+
+if __name__ == '__main__':
+  for name, test in sorted(globals().items()):
+    if name.startswith('test_'):
+      test()
+      print("{} passed".format(name))
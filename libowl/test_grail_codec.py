@@ -0,0 +1,207 @@
+#Round trip and fuzz tests of grail_codec. These need no servers:
+#
+#  python test_grail_codec.py
+
+import random
+import struct
+
+import aggregator_rules
+import grail_codec
+import transient_request
+import wm_data
+
+#Exceptions that decoding malformed messages may raise
+DECODE_ERRORS = (struct.error, UnicodeDecodeError)
+
+def payload(message):
+  """The payload of an encoded message, without its length and type."""
+  length, control = grail_codec.HEADER.unpack_from(message, 0)
+  assert length == len(message) - 4
+  return memoryview(message)[5:]
+
+def randomString(rng, max_length = 20):
+  return ''.join(chr(rng.choice([rng.randrange(32, 127), rng.randrange(0x100, 0xd800)]))
+                 for i in range(rng.randrange(max_length)))
+
+def randomRules(rng):
+  return [aggregator_rules.AggrRule(rng.randrange(256),
+              [aggregator_rules.IDMask(rng.getrandbits(64), rng.getrandbits(64)) for j in range(rng.randrange(5))],
+              rng.getrandbits(64))
+          for i in range(rng.randrange(10))]
+
+def randomRequests(rng):
+  return [transient_request.TransientRequest(rng.getrandbits(32),
+              [randomString(rng) for j in range(rng.randrange(5))])
+          for i in range(rng.randrange(10))]
+
+def randomData(rng, names):
+  return [wm_data.WMData(randomString(rng),
+              [wm_data.WMAttribute(rng.choice(names), rng.randbytes(rng.randrange(20)), rng.getrandbits(63))
+               for j in range(rng.randrange(1, 4))])
+          for i in range(rng.randrange(1, 10))]
+
+def randomMessages(rng):
+  """One encoded message of every kind."""
+  names = ['location.x', 'location.y', 'temperature']
+  name_to_alias = {name: alias for alias, name in enumerate(names)}
+  origin16 = randomString(rng).encode('utf-16-be')
+  return [
+    grail_codec.encodeSubscription(randomRules(rng)),
+    grail_codec.encodeSample(rng.randrange(256), (rng.getrandbits(64), rng.getrandbits(64)),
+        (rng.getrandbits(64), rng.getrandbits(64)), rng.getrandbits(64), -50.0, rng.randbytes(10)),
+    grail_codec.encodeTypeAnnounce([[name, alias, rng.random() < 0.5] for name, alias in name_to_alias.items()], origin16),
+    grail_codec.encodeTransientRequests(grail_codec.WM_START_TRANSIENT, randomRequests(rng)),
+    grail_codec.encodeSolverData(randomData(rng, names), name_to_alias, True),
+    grail_codec.encodeURIMessage(grail_codec.WM_EXPIRE_URI, randomString(rng), origin16, rng.getrandbits(64)),
+    grail_codec.encodeURIMessage(grail_codec.WM_DELETE_URI, randomString(rng), origin16),
+    grail_codec.encodeAttributeMessage(grail_codec.WM_EXPIRE_ATTRIBUTE, randomString(rng), rng.getrandbits(32),
+        origin16, rng.getrandbits(64)),
+    grail_codec.encodeAttributeMessage(grail_codec.WM_DELETE_ATTRIBUTE, randomString(rng), rng.getrandbits(32), origin16),
+    grail_codec.encodeClientRequest(grail_codec.CLIENT_RANGE_REQUEST, rng.getrandbits(32), randomString(rng),
+        [randomString(rng) for i in range(rng.randrange(5))], rng.getrandbits(64), rng.getrandbits(64)),
+    grail_codec.encodeAliases(grail_codec.CLIENT_ATTRIBUTE_ALIAS, list(enumerate(names))),
+    grail_codec.encodeDataResponse(randomString(rng), rng.getrandbits(32),
+        [(rng.getrandbits(32), rng.getrandbits(64), rng.getrandbits(64), rng.getrandbits(32), rng.randbytes(rng.randrange(20)))
+         for i in range(rng.randrange(5))]),
+    grail_codec.encodeURIResponse([randomString(rng) for i in range(rng.randrange(5))]),
+  ]
+
+def decodeMessage(protocol_index, inbuff):
+  """Decode a payload with the decoder matching randomMessages' order."""
+  decoders = [
+    grail_codec.decodeSubscription,
+    grail_codec.decodeSample,
+    grail_codec.decodeTypeAnnounce,
+    grail_codec.decodeTransientRequests,
+    grail_codec.decodeSolverData,
+    lambda buff: grail_codec.decodeURIMessage(grail_codec.WM_EXPIRE_URI, buff),
+    lambda buff: grail_codec.decodeURIMessage(grail_codec.WM_DELETE_URI, buff),
+    lambda buff: grail_codec.decodeAttributeMessage(grail_codec.WM_EXPIRE_ATTRIBUTE, buff),
+    lambda buff: grail_codec.decodeAttributeMessage(grail_codec.WM_DELETE_ATTRIBUTE, buff),
+    grail_codec.decodeClientRequest,
+    grail_codec.decodeAliases,
+    grail_codec.decodeDataResponse,
+    grail_codec.decodeURIResponse,
+  ]
+  return decoders[protocol_index](inbuff)
+
+def test_subscription_round_trip():
+  rng = random.Random(1)
+  for i in range(100):
+    rules = randomRules(rng)
+    decoded = grail_codec.decodeSubscription(payload(grail_codec.encodeSubscription(rules)))
+    assert len(rules) == len(decoded)
+    for rule, result in zip(rules, decoded):
+      assert rule.phy_layer == result.phy_layer
+      assert rule.update_interval == result.update_interval
+      assert [txer.id + txer.mask for txer in rule.txers] == result.txers
+    # Decoded rules encode back to the same message
+    assert grail_codec.encodeSubscription(decoded) == grail_codec.encodeSubscription(rules)
+
+def test_sample_round_trip():
+  message = grail_codec.encodeSample(1, (2, 3), (4, 5), 6, -42.5, b'sense')
+  assert grail_codec.AGGR_SERVER_SAMPLE == message[4]
+  assert (1, (2, 3), (4, 5), 6, -42.5, b'sense') == grail_codec.decodeSample(payload(message))
+  assert grail_codec.decodeSample(b'') is None
+
+def test_type_announce_round_trip():
+  type_info = [['location.x', 0, False], ['température', 7, True]]
+  message = grail_codec.encodeTypeAnnounce(type_info, 'solver'.encode('utf-16-be'))
+  assert (type_info, 'solver') == grail_codec.decodeTypeAnnounce(payload(message))
+
+def test_transient_round_trip():
+  rng = random.Random(2)
+  for i in range(100):
+    requests = randomRequests(rng)
+    message = grail_codec.encodeTransientRequests(grail_codec.WM_STOP_TRANSIENT, requests)
+    assert grail_codec.WM_STOP_TRANSIENT == message[4]
+    decoded = grail_codec.decodeTransientRequests(payload(message))
+    assert [(r.name, r.expressions) for r in requests] == [(r.name, r.expressions) for r in decoded]
+
+def test_solver_data_round_trip():
+  rng = random.Random(3)
+  names = ['a', 'b', 'c']
+  name_to_alias = {'a': 0, 'b': 1, 'c': 2}
+  alias_to_name = {0: 'a', 1: 'b', 2: 'c'}
+  for i in range(100):
+    wmdata_vector = randomData(rng, names)
+    message = grail_codec.encodeSolverData(wmdata_vector, name_to_alias, i % 2 == 1)
+    create_uris, decoded = grail_codec.decodeSolverData(payload(message), alias_to_name)
+    assert create_uris == (i % 2 == 1)
+    flattened = [(d.uri, a.name, a.data, a.creation) for d in wmdata_vector for a in d.attributes]
+    assert flattened == [(d.uri, a.name, a.data, a.creation) for d in decoded for a in d.attributes]
+
+def test_uri_messages_round_trip():
+  origin16 = 'solver'.encode('utf-16-be')
+  for control in (grail_codec.WM_CREATE_URI, grail_codec.WM_EXPIRE_URI):
+    message = grail_codec.encodeURIMessage(control, 'some.uri', origin16, 1234)
+    assert ('some.uri', 1234, 'solver') == grail_codec.decodeURIMessage(control, payload(message))
+  message = grail_codec.encodeURIMessage(grail_codec.WM_DELETE_URI, 'some.uri', origin16)
+  assert ('some.uri', None, 'solver') == grail_codec.decodeURIMessage(grail_codec.WM_DELETE_URI, payload(message))
+
+def test_attribute_messages_round_trip():
+  origin16 = 'solver'.encode('utf-16-be')
+  message = grail_codec.encodeAttributeMessage(grail_codec.WM_EXPIRE_ATTRIBUTE, 'some.uri', 3, origin16, 1234)
+  assert ('some.uri', 3, 1234, 'solver') == grail_codec.decodeAttributeMessage(grail_codec.WM_EXPIRE_ATTRIBUTE, payload(message))
+  message = grail_codec.encodeAttributeMessage(grail_codec.WM_DELETE_ATTRIBUTE, 'some.uri', 3, origin16)
+  assert ('some.uri', 3, None, 'solver') == grail_codec.decodeAttributeMessage(grail_codec.WM_DELETE_ATTRIBUTE, payload(message))
+
+def test_client_messages_round_trip():
+  message = grail_codec.encodeClientRequest(grail_codec.CLIENT_STREAM_REQUEST, 7, 'bus\\..*', ['location\\..*', 'speed'], 0, 1000)
+  assert grail_codec.CLIENT_STREAM_REQUEST == message[4]
+  assert (7, 'bus\\..*', ['location\\..*', 'speed'], 0, 1000) == grail_codec.decodeClientRequest(payload(message))
+  message = grail_codec.encodeTicket(grail_codec.CLIENT_REQUEST_COMPLETE, 7)
+  assert 7 == grail_codec.decodeTicket(payload(message))
+  aliases = [(0, 'location.x'), (5, 'speed')]
+  assert aliases == grail_codec.decodeAliases(payload(grail_codec.encodeAliases(grail_codec.CLIENT_ORIGIN_ALIAS, aliases)))
+  attributes = [(0, 10, 0, 1, b'data'), (5, 11, 12, 1, b'')]
+  message = grail_codec.encodeDataResponse('bus.1', 7, attributes)
+  assert ('bus.1', 7, attributes) == grail_codec.decodeDataResponse(payload(message))
+  assert 'bus.*' == grail_codec.decodeURISearch(payload(grail_codec.encodeURISearch('bus.*')))
+  assert ['bus.1', 'bus.2'] == grail_codec.decodeURIResponse(payload(grail_codec.encodeURIResponse(['bus.1', 'bus.2'])))
+  weights = {'gps': 2, 'manual': -1}
+  assert weights == grail_codec.decodeOriginPreference(payload(grail_codec.encodeOriginPreference(weights)))
+
+def test_fuzz_truncated():
+  """Every truncation of a valid payload decodes or raises a decode error."""
+  rng = random.Random(4)
+  for i in range(20):
+    for index, message in enumerate(randomMessages(rng)):
+      body = payload(message)
+      for end in range(len(body)):
+        try:
+          decodeMessage(index, body[:end])
+        except DECODE_ERRORS:
+          pass
+
+def test_fuzz_corrupted():
+  """Random bytes and corrupted payloads decode or raise a decode error
+  without reading past the message."""
+  rng = random.Random(5)
+  for i in range(200):
+    for index, message in enumerate(randomMessages(rng)):
+      body = bytearray(payload(message))
+      for j in range(rng.randrange(1, 4)):
+        if body:
+          body[rng.randrange(len(body))] = rng.randrange(256)
+      for buff in (body, rng.randbytes(rng.randrange(64))):
+        try:
+          decodeMessage(index, memoryview(buff))
+        except DECODE_ERRORS:
+          pass
+
+def test_large_messages():
+  """Large subscription responses and transient requests decode whole."""
+  rules = [aggregator_rules.AggrRule(1, [aggregator_rules.IDMask(i) for i in range(100)], 1000)
+           for j in range(100)]
+  decoded = grail_codec.decodeSubscription(payload(grail_codec.encodeSubscription(rules)))
+  assert 10000 == sum(len(rule.txers) for rule in decoded)
+  requests = [transient_request.TransientRequest(0, ['uri.{}.*'.format(i) for i in range(10000)])]
+  message = grail_codec.encodeTransientRequests(grail_codec.WM_START_TRANSIENT, requests)
+  assert 10000 == len(grail_codec.decodeTransientRequests(payload(message))[0].expressions)
+
+if __name__ == '__main__':
+  for name, test in sorted(globals().items()):
+    if name.startswith('test_'):
+      test()
+      print("{} passed".format(name))
@@ -0,0 +1,117 @@
+#Tests of instrumentation histograms, snapshots, and message counts of the
+#solver clients. These need no servers but the batch test needs NumPy:
+#
+#  python test_instrumentation.py
+
+import json
+import os
+import tempfile
+
+import fake_servers
+import frame_capture
+import grail_codec
+import instrumentation
+import solver_aggregator
+import solver_world_model as swm
+
+def test_histogram_buckets_and_percentiles():
+  """Durations go to the bucket of their bit length, and percentiles are
+  bucket bounds capped at the longest duration."""
+  histogram = instrumentation.LatencyHistogram()
+  assert 0 == histogram.percentile(0.5) and 0 == histogram.mean()
+  for nanoseconds in (0, 1, 2, 3, 1000, 2 ** 70):
+    histogram.record(nanoseconds)
+  assert 1 == histogram.buckets[0] and 1 == histogram.buckets[1]
+  assert 2 == histogram.buckets[2]
+  assert 1 == histogram.buckets[10] and 1 == histogram.buckets[63]
+  assert 6 == histogram.count and 2 ** 70 == histogram.max
+  histogram = instrumentation.LatencyHistogram()
+  for nanoseconds in range(1, 101):
+    histogram.record(nanoseconds)
+  assert 64 == histogram.percentile(0.5)
+  assert 100 == histogram.percentile(0.99)
+  assert 1 == histogram.percentile(0)
+  assert 50.5 == histogram.mean()
+
+def test_snapshot_and_export():
+  """Snapshots hold plain copies of every counter and exporters get one."""
+  instruments = instrumentation.Instrumentation()
+  events = []
+  instruments.addHook(lambda event, name, value: events.append((event, name, value)))
+  instruments.received(6, 40)
+  instruments.received(6, 44)
+  instruments.sent(4, 100, 3)
+  instruments.timing('decode', 1000)
+  instruments.queueDepth('samples', 5)
+  instruments.queueDepth('samples', 2)
+  instruments.reconnected()
+  exported = []
+  instruments.export(exported.append)
+  snapshot = exported[0]
+  assert ['bytes_in', 'bytes_out', 'latency', 'max_queue_depths', 'messages_in', 'messages_out',
+          'queue_depths', 'reconnects', 'uptime'] == sorted(snapshot)
+  assert {6: 2} == snapshot['messages_in'] and {6: 84} == snapshot['bytes_in']
+  assert {4: 3} == snapshot['messages_out'] and {4: 100} == snapshot['bytes_out']
+  assert {'decode': {'count': 1, 'mean': 1000, 'p50': 1000, 'p99': 1000, 'max': 1000}} == snapshot['latency']
+  assert {'samples': 2} == snapshot['queue_depths']
+  assert {'samples': 5} == snapshot['max_queue_depths']
+  assert 1 == snapshot['reconnects'] and 0 <= snapshot['uptime']
+  json.dumps(snapshot)
+  # Later events do not change a snapshot
+  instruments.received(6, 40)
+  assert {6: 2} == snapshot['messages_in']
+  assert [('in', 6, 40), ('in', 6, 44), ('out', 4, 100), ('latency', 'decode', 1000),
+          ('queue', 'samples', 5), ('queue', 'samples', 2), ('reconnect', None, 1)] == events[:7]
+
+def replayCounts(path, batch):
+  """Message counts of a solver reading a capture one message or one batch
+  at a time."""
+  instruments = instrumentation.Instrumentation()
+  aggregator = solver_aggregator.SolverAggregator(None, None, source = frame_capture.FrameReplay(path))
+  aggregator.setInstrumentation(instruments)
+  if batch:
+    while aggregator.handleBatch() is not None:
+      pass
+  else:
+    while aggregator.handleMessage() is not None:
+      pass
+  aggregator.reader.close()
+  return instruments.messages_in, instruments.bytes_in
+
+def test_keep_alives_counted_alike():
+  """Keep alives, typed or empty, are counted the same by the aggregator,
+  per message or in batches, and by the world model."""
+  generator = fake_servers.SampleGenerator()
+  with tempfile.TemporaryDirectory() as directory:
+    path = os.path.join(directory, 'capture')
+    recorder = frame_capture.FrameRecorder(path)
+    for i in range(3):
+      recorder.record(b'')
+      recorder.record(b'\x00')
+      recorder.record(generator.frame()[4:])
+    recorder.close()
+    single = replayCounts(path, False)
+    batched = replayCounts(path, True)
+  assert single == batched
+  assert 6 == single[0][solver_aggregator.SolverAggregator.KEEP_ALIVE]
+  assert 27 == single[1][solver_aggregator.SolverAggregator.KEEP_ALIVE]
+  server = fake_servers.FakeWorldModel()
+  solver = swm.SolverWorldModel(server.host, server.port, 'test')
+  instruments = instrumentation.Instrumentation()
+  solver.setInstrumentation(instruments)
+  assert server.waitForClients(1)
+  with server.lock:
+    for conn in server.clients:
+      conn.sendall((grail_codec.encodeKeepAlive(swm.SolverWorldModel.KEEP_ALIVE) + bytes(4)) * 3)
+  for i in range(6):
+    assert swm.SolverWorldModel.KEEP_ALIVE == solver.handleMessage()
+  assert {swm.SolverWorldModel.KEEP_ALIVE: 6} == instruments.messages_in
+  assert {swm.SolverWorldModel.KEEP_ALIVE: 27} == instruments.bytes_in
+  solver.close()
+  server.close()
+
+if __name__ == '__main__':
+  for name, test in sorted(globals().items()):
+    if name.startswith('test_'):
+      test()
+      print("{} passed".format(name))
@@ -0,0 +1,92 @@
+#Tests of push_coalescer and coalesced pushes from SolverWorldModel. These
+#need no servers:
+#
+#  python test_push_coalescer.py
+
+import socket
+import time
+
+import fake_servers
+import frame_reader
+import grail_codec
+import push_coalescer
+import solver_world_model as swm
+import wm_data
+import wm_encoder
+
+NAMES = {'x': 0}
+ALIASES = {0: 'x'}
+
+def encoded(encoder, uri, data = b'1234'):
+  return encoder.encodeAttributes([wm_data.WMData(uri, [wm_data.WMAttribute('x', data, 1)])], NAMES)
+
+def test_size_and_count_thresholds():
+  encoder = wm_encoder.WMEncoder('test')
+  attributes, total = encoded(encoder, 'u')
+  coalescer = push_coalescer.PushCoalescer(max_bytes = 3 * len(attributes), max_attributes = 100, max_delay = 60)
+  assert not coalescer.add(attributes, total, False)
+  assert not coalescer.add(attributes, total, False)
+  assert coalescer.add(attributes, total, False)
+  coalescer.take(encoder)
+  coalescer = push_coalescer.PushCoalescer(max_bytes = 1 << 20, max_attributes = 2, max_delay = 60)
+  assert not coalescer.add(attributes, total, False)
+  assert coalescer.add(attributes, total, False)
+  assert 2 == len(coalescer)
+  # Empty pushes are ignored
+  assert not push_coalescer.PushCoalescer().add(b'', 0, False)
+
+def test_delay_threshold():
+  encoder = wm_encoder.WMEncoder('test')
+  coalescer = push_coalescer.PushCoalescer(max_delay = 0.02)
+  assert not coalescer.due()
+  assert not coalescer.add(*encoded(encoder, 'u'), False)
+  assert not coalescer.due()
+  time.sleep(0.03)
+  assert coalescer.due()
+  coalescer.take(encoder)
+  assert not coalescer.due()
+
+def test_create_uris_segments():
+  """Consecutive pushes with the same create_uris flag share a message and
+  the merged messages decode to the pushes in order."""
+  encoder = wm_encoder.WMEncoder('test')
+  coalescer = push_coalescer.PushCoalescer(max_delay = 60)
+  flags = [False, False, True, True, True, False]
+  for i, create_uris in enumerate(flags):
+    coalescer.add(*encoded(encoder, 'u{}'.format(i)), create_uris)
+  a, b = socket.socketpair()
+  frame_reader.sendBuffers(a, coalescer.take(encoder))
+  reader = frame_reader.FrameReader(b)
+  decoded = []
+  for i in range(3):
+    frame = reader.nextFrame()
+    assert grail_codec.WM_SOLVER_DATA == frame[0]
+    create_uris, wmdata = grail_codec.decodeSolverData(frame[1:], ALIASES)
+    decoded.append((create_uris, [d.uri for d in wmdata]))
+  assert [(False, ['u0', 'u1']), (True, ['u2', 'u3', 'u4']), (False, ['u5'])] == decoded
+  assert 1 == coalescer.flushes and 3 == coalescer.messages and 0 == len(coalescer)
+  a.close()
+  b.close()
+
+def test_solver_flush():
+  """Coalesced pushes are sent together once a threshold is reached and by
+  an explicit flush."""
+  server = fake_servers.FakeWorldModel()
+  solver = swm.SolverWorldModel(server.host, server.port, 'test')
+  solver.setCoalescing(max_attributes = 10, max_delay = 60)
+  for i in range(25):
+    solver.pushData([wm_data.WMData('u{}'.format(i), [wm_data.WMAttribute('x', b'1', 1)])], 12 <= i < 14)
+  assert server.waitForAttributes(20)
+  assert 4 == server.count(swm.SolverWorldModel.SOLVER_DATA)
+  assert 5 == len(solver.coalescer)
+  solver.flush()
+  assert server.waitForAttributes(25)
+  assert 5 == server.count(swm.SolverWorldModel.SOLVER_DATA)
+  solver.close()
+  server.close()
+
+if __name__ == '__main__':
+  for name, test in sorted(globals().items()):
+    if name.startswith('test_'):
+      test()
+      print("{} passed".format(name))
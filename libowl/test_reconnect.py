@@ -0,0 +1,133 @@
+#Tests of reconnecting the solver clients after fake servers drop their
+#connections. These need no servers:
+#
+#  python test_reconnect.py
+
+import time
+
+import aggregator_rules
+import fake_servers
+import push_cache
+import reconnect
+import solver_aggregator as sa
+import solver_world_model as swm
+import wm_data
+
+def test_backoff_delays():
+  backoff = reconnect.Backoff(initial_delay = 1, max_delay = 5, jitter = 0, max_attempts = 4)
+  assert [1, 2, 4, 5, None] == [backoff.nextDelay() for i in range(5)]
+  backoff.reset()
+  assert 1 == backoff.nextDelay()
+
+def test_aggregator_replays_subscription():
+  """The subscription is sent again and samples keep arriving."""
+  server = fake_servers.FakeAggregator(rate = 2000)
+  solver = sa.SolverAggregator(server.host, server.port)
+  solver.setReconnect(reconnect.Backoff(initial_delay = 0.01, jitter = 0))
+  solver.sendSubscription([aggregator_rules.AggrRule(1, [aggregator_rules.IDMask(0, 0)], 0)])
+  while len(solver.available_packets) < 10:
+    solver.handleMessage()
+  server.disconnectAll()
+  while solver.reconnects < 1:
+    assert solver.handleMessage() is not None
+  received = len(solver.available_packets)
+  while len(solver.available_packets) < received + 10:
+    assert solver.handleMessage() is not None
+  assert solver.connected
+  assert 2 == server.subscriptions
+  assert 1 == len(solver.cur_rules)
+  solver.close()
+  server.close()
+
+def push(solver, name, data):
+  solver.pushData([wm_data.WMData('u', [wm_data.WMAttribute(name, data, 1)])])
+
+def test_world_model_replays_types_and_pending():
+  """Pushes made while disconnected are kept and sent after one batched
+  type announcement, and the push cache sends everything again."""
+  server = fake_servers.FakeWorldModel()
+  solver = swm.SolverWorldModel(server.host, server.port, 'test')
+  solver.setReconnect(reconnect.Backoff(initial_delay = 0.2, jitter = 0))
+  solver.setPushCache(push_cache.PushCache())
+  push(solver, 'a', b'0')
+  push(solver, 'b', b'0')
+  assert server.waitForAttributes(2)
+  server.disconnectAll()
+  # Past the peer check interval the first push finds the closed connection
+  time.sleep(0.15)
+  for i in range(5):
+    push(solver, 'a', bytes([i + 1]))
+  assert not solver.connected
+  assert 5 == len(solver.pending)
+  time.sleep(0.25)
+  # Unchanged since before the connection was lost, but sent again
+  push(solver, 'b', b'0')
+  assert solver.connected
+  assert server.waitForAttributes(8)
+  assert 1 == solver.reconnects
+  solver.close()
+  server.close()
+  TYPE_ANNOUNCE = swm.SolverWorldModel.TYPE_ANNOUNCE
+  SOLVER_DATA = swm.SolverWorldModel.SOLVER_DATA
+  assert [TYPE_ANNOUNCE, SOLVER_DATA] * 2 + [TYPE_ANNOUNCE] + [SOLVER_DATA] * 6 == server.controls
+  assert {0: 'a', 1: 'b'} == server.type_names
+
+class CountingSolver(swm.SolverWorldModel):
+  def peerClosed(self):
+    self.peer_checks = getattr(self, 'peer_checks', 0) + 1
+    return swm.SolverWorldModel.peerClosed(self)
+
+def test_world_model_peer_check_is_rate_limited():
+  """Steady pushes check the connection at most once per interval, and a
+  closed connection is still found by the failed sends."""
+  server = fake_servers.FakeWorldModel()
+  solver = CountingSolver(server.host, server.port, 'test')
+  solver.setReconnect(reconnect.Backoff(initial_delay = 10, jitter = 0), peer_check_interval = 60)
+  for i in range(200):
+    push(solver, 'a', bytes([i]))
+  assert server.waitForAttributes(200)
+  assert 1 == solver.peer_checks
+  server.disconnectAll()
+  deadline = time.monotonic() + 5
+  while solver.connected and time.monotonic() < deadline:
+    push(solver, 'a', b'x')
+    time.sleep(0.01)
+  assert not solver.connected
+  assert 1 == solver.peer_checks
+  assert 1 == len(solver.pending)
+  solver.close()
+  server.close()
+
+def test_world_model_forgets_transient_requests():
+  """Transient requests of the old connection are dropped, so the restarted
+  world model's own start and stop requests decide what is sent."""
+  server = fake_servers.FakeWorldModel()
+  solver = swm.SolverWorldModel(server.host, server.port, 'test')
+  solver.setReconnect(reconnect.Backoff(initial_delay = 0, jitter = 0))
+  solver.addSolutionTypes([wm_data.WMAttribute('t', b'', 0)], True)
+  START = swm.SolverWorldModel.START_TRANSIENT
+  STOP = swm.SolverWorldModel.STOP_TRANSIENT
+  assert server.waitForClients(1)
+  server.requestTransient(START, [(0, ['u'])])
+  assert START == solver.handleMessage()
+  assert solver.transients.requested(0, 'u')
+  server.disconnectAll()
+  time.sleep(0.15)
+  push(solver, 'a', b'1')
+  assert 1 == solver.reconnects
+  assert not solver.transients.requested(0, 'u')
+  assert {0} == solver.transients.types
+  assert server.waitForClients(1)
+  server.requestTransient(START, [(0, ['u'])])
+  assert START == solver.handleMessage()
+  server.requestTransient(STOP, [(0, ['u'])])
+  assert STOP == solver.handleMessage()
+  assert not solver.transients.requested(0, 'u')
+  solver.close()
+  server.close()
+
+if __name__ == '__main__':
+  for name, test in sorted(globals().items()):
+    if name.startswith('test_'):
+      test()
+      print("{} passed".format(name))
@@ -0,0 +1,126 @@
+#Tests of rssi_window tumbling and sliding window statistics. These need no
+#servers:
+#
+#  python test_rssi_window.py
+
+import rssi_window
+
+A = ((0, 1), (1, 1))
+B = ((0, 2), (1, 1))
+C = ((0, 3), (1, 1))
+
+def windows(summaries, link):
+  return [(s.window_start, s.window_end, s.count) for s in summaries if (s.device_id, s.receiver_id) == link]
+
+def test_tumbling():
+  """A tumbling window summarizes each link once it is over and evicts
+  links silent for a window."""
+  stats = rssi_window.WindowedRSSI(100)
+  for t, rssi in ((10, -40.0), (20, -50.0), (30, -60.0)):
+    stats.addValues(A[0], A[1], t, rssi)
+  stats.addValues(B[0], B[1], 50, -70.0)
+  assert [] == stats.summaries
+  stats.addValues(A[0], A[1], 150, -45.0)
+  first, second = stats.summaries
+  assert (A[0], A[1], 0, 100, 3) == (first.device_id, first.receiver_id, first.window_start, first.window_end, first.count)
+  assert -50.0 == first.mean
+  assert abs(first.variance - 200 / 3) < 1e-9
+  assert (-49.5, -60.0, -40.0) == (first.median, first.min, first.max)
+  assert [(0, 100, 1)] == windows(stats.summaries, B)
+  assert 0 == stats.evicted
+  stats.addValues(A[0], A[1], 250, -45.0)
+  assert [(100, 200, 1)] == windows(stats.summaries[2:], A)
+  assert [A] == list(stats.slots)
+  assert 1 == stats.evicted
+  stats.flush()
+  assert [(200, 300, 1)] == windows(stats.summaries[3:], A)
+
+def test_sliding():
+  """Sliding windows combine the panes of a window and move one pane at a
+  time."""
+  summaries = []
+  stats = rssi_window.WindowedRSSI(100, 25, handler = summaries.append)
+  for t, rssi in ((0, -40.0), (30, -50.0), (60, -60.0), (90, -70.0), (100, -80.0)):
+    stats.addValues(A[0], A[1], t, rssi)
+  stats.addValues(C[0], C[1], 125, -50.0)
+  assert [] == stats.summaries
+  assert [(-75, 25, 1), (-50, 50, 2), (-25, 75, 3), (0, 100, 4), (25, 125, 4)] == windows(summaries, A)
+  assert -65.0 == summaries[-1].mean
+  assert (-80.0, -50.0) == (summaries[-1].min, summaries[-1].max)
+
+def test_late():
+  """Samples older than every open window are counted and dropped, while
+  ones in an open pane are still added."""
+  stats = rssi_window.WindowedRSSI(100, 25)
+  stats.addValues(A[0], A[1], 125, -50.0)
+  stats.addValues(A[0], A[1], 30, -50.0)
+  assert 1 == stats.late
+  stats.addValues(A[0], A[1], 50, -60.0)
+  assert 1 == stats.late
+  stats.flush()
+  assert [(50, 150, 2)] == windows(stats.summaries, A)
+  assert -55.0 == stats.summaries[-1].mean
+
+class CountingRSSI(rssi_window.WindowedRSSI):
+  def __init__(self, *args, **kwargs):
+    super().__init__(*args, **kwargs)
+    self.emitted = 0
+
+  def emit(self, last_pane):
+    self.emitted += 1
+    super().emit(last_pane)
+
+def test_advance_skips_empty_windows():
+  """A jump far ahead emits the windows holding data and skips the empty
+  ones after them."""
+  stats = CountingRSSI(100, 25)
+  stats.addValues(A[0], A[1], 0, -50.0)
+  stats.addValues(A[0], A[1], 100000, -60.0)
+  assert 4 == stats.emitted
+  assert 100000 // 25 == stats.current
+  assert [(-75, 25, 1), (-50, 50, 1), (-25, 75, 1), (0, 100, 1)] == windows(stats.summaries, A)
+  stats.flush()
+  assert (99925, 100025, 1) == windows(stats.summaries, A)[-1]
+  assert -60.0 == stats.summaries[-1].mean
+
+def test_median_bins():
+  """The median is the middle of its 1 dB bin and values out of the
+  histogram range go to the end bins."""
+  stats = rssi_window.WindowedRSSI(100)
+  plain = rssi_window.WindowedRSSI(100, median = False)
+  for rssi in (-50.2, -50.9, -20.0, -200.0, 5.0):
+    stats.addValues(A[0], A[1], 10, rssi)
+    plain.addValues(A[0], A[1], 10, rssi)
+  stats.flush()
+  plain.flush()
+  assert -50.5 == stats.summaries[0].median
+  assert (-200.0, 5.0) == (stats.summaries[0].min, stats.summaries[0].max)
+  assert plain.summaries[0].median is None
+  assert 0 == len(plain.hists[0])
+  low = rssi_window.WindowedRSSI(100)
+  for rssi in (-300.0, -129.0, 10.0):
+    low.addValues(A[0], A[1], 10, rssi)
+  low.flush()
+  assert rssi_window.HIST_MIN + 0.5 == low.summaries[0].median
+
+def test_idle_timeout_covers_window():
+  """A short idle timeout is raised to the window, so a silent link is kept
+  in every sliding window that holds its samples and evicted after."""
+  stats = rssi_window.WindowedRSSI(100, 25, idle_timeout = 10)
+  assert 100 == stats.idle_timeout
+  stats.addValues(A[0], A[1], 0, -50.0)
+  for t in range(25, 176, 25):
+    stats.addValues(B[0], B[1], t, -60.0)
+  assert [(-75, 25, 1), (-50, 50, 1), (-25, 75, 1), (0, 100, 1)] == windows(stats.summaries, A)
+  assert [B] == list(stats.slots)
+  assert 1 == stats.evicted
+  # The freed slot is reused without the old link's samples
+  stats.addValues(C[0], C[1], 175, -70.0)
+  stats.flush()
+  assert [(100, 200, 1)] == windows(stats.summaries, C)
+
+if __name__ == '__main__':
+  for name, test in sorted(globals().items()):
+    if name.startswith('test_'):
+      test()
+      print("{} passed".format(name))
@@ -0,0 +1,86 @@
+#Tests of rule_index routing:
+#
+#  python test_rule_index.py
+
+import random
+
+import rule_index
+import sensor_sample
+from aggregator_rules import AggrRule, IDMask
+
+def sample(phy, device):
+  return sensor_sample.SensorSample(phy, (0, device), (0, 1), 0, -50.0, b'')
+
+def test_mask_matching():
+  index = rule_index.RuleIndex()
+  exact = index.addQueue(AggrRule(1, [IDMask(0x1234)], 0))
+  low_byte = index.addQueue(AggrRule(1, [IDMask(0x0100, 0xFF00)], 0))
+  other_phy = index.addQueue(AggrRule(2, [IDMask(0x1234)], 0))
+  for device in (0x1234, 0x0134, 0x01FF, 0x1235):
+    index.route(sample(1, device))
+  assert [0x1234] == [s.device_id[1] for s in exact]
+  assert [0x0134, 0x01FF] == [s.device_id[1] for s in low_byte]
+  assert 0 == len(other_phy)
+  assert 1 == index.unmatched and 3 == index.routed
+
+def test_phy_only_rules():
+  """A rule without transmitters receives every sample of its physical
+  layer."""
+  index = rule_index.RuleIndex()
+  everything = index.addQueue(AggrRule(1, [], 0))
+  index.route(sample(1, 5))
+  index.route(sample(1, 6))
+  index.route(sample(2, 5))
+  assert [5, 6] == [s.device_id[1] for s in everything]
+
+def test_overlapping_rules_route_once():
+  """A handler whose rules overlap gets each sample once, and each of
+  several matching handlers gets it."""
+  index = rule_index.RuleIndex()
+  seen = []
+  index.addHandler(AggrRule(1, [], 0), seen.append)
+  index.addHandler(AggrRule(1, [IDMask(7), IDMask(0, 0)], 0), seen.append)
+  other = index.addQueue(AggrRule(1, [IDMask(7)], 0))
+  assert 2 == index.route(sample(1, 7))
+  assert 1 == len(seen) and 1 == len(other)
+
+def test_remove_handler():
+  index = rule_index.RuleIndex()
+  seen = []
+  index.addHandler(AggrRule(1, [IDMask(7)], 0), seen.append)
+  index.addHandler(AggrRule(1, [], 0), seen.append)
+  queue = index.addQueue(AggrRule(1, [IDMask(7)], 0))
+  index.route(sample(1, 7))
+  index.removeHandler(seen.append)
+  index.route(sample(1, 7))
+  assert 1 == len(seen) and 2 == len(queue)
+  assert 1 == len(index.aggrRules())
+
+def test_matches_brute_force():
+  """Routing agrees with checking every rule against every sample."""
+  rng = random.Random(1)
+  index = rule_index.RuleIndex()
+  rules = []
+  for i in range(30):
+    txers = [IDMask(rng.randrange(64), rng.choice([0x3F, 0x3C, 0x30, 0]))
+             for j in range(rng.randrange(3))]
+    rule = AggrRule(rng.randrange(1, 3), txers, 0)
+    rules.append(rule)
+    index.addQueue(rule)
+  for k in range(500):
+    phy, device = rng.randrange(1, 3), rng.randrange(64)
+    expected = set()
+    for i, rule in enumerate(rules):
+      if rule.phy_layer == phy and (not rule.txers or any(
+          (rule_index.idValue(t.id) & rule_index.idValue(t.mask)) == (device & rule_index.idValue(t.mask))
+          for t in rule.txers)):
+        expected.add(i)
+    handlers = index.match(phy, (0, device))
+    assert len(expected) == len(handlers)
+    assert set(id(index.entries[i][1]) for i in expected) == set(id(h) for h in handlers)
+
+if __name__ == '__main__':
+  for name, test in sorted(globals().items()):
+    if name.startswith('test_'):
+      test()
+      print("{} passed".format(name))
@@ -0,0 +1,44 @@
+#Tests of sample_batch against the single sample decoder. These need no
+#servers but do need NumPy:
+#
+#  python test_sample_batch.py
+
+import random
+import struct
+
+import grail_codec
+import sample_batch
+
+def test_matches_decode_sample():
+  """Batch decoding gives the same fields as decodeSample, and skips
+  messages too short to hold a sample."""
+  rng = random.Random(1)
+  frames = []
+  for i in range(100):
+    message = grail_codec.encodeSample(rng.randrange(256), (rng.getrandbits(64), rng.getrandbits(64)),
+        (rng.getrandbits(64), rng.getrandbits(64)), rng.getrandbits(64), -rng.randrange(100) / 2,
+        rng.randbytes(rng.randrange(20)))
+    frames.append(bytes(message[5:]))
+  short = [b'', frames[0][:sample_batch.HEADER_SIZE - 1]]
+  batch = sample_batch.decodeServerSamples(frames[:50] + short + frames[50:])
+  assert len(frames) == len(batch)
+  for index, frame in enumerate(frames):
+    sample = batch.sensorSample(index)
+    fields = (sample.phy_layer, sample.device_id, sample.receiver_id, sample.timestamp, sample.rssi, sample.sense_data)
+    assert grail_codec.decodeSample(frame) == fields
+  assert grail_codec.decodeSample(short[0]) is None
+  try:
+    grail_codec.decodeSample(short[1])
+    assert False
+  except struct.error:
+    pass
+
+def test_empty():
+  assert 0 == len(sample_batch.decodeServerSamples([]))
+  assert 0 == len(sample_batch.decodeServerSamples([b'\x01']))
+
+if __name__ == '__main__':
+  for name, test in sorted(globals().items()):
+    if name.startswith('test_'):
+      test()
+      print("{} passed".format(name))
@@ -0,0 +1,70 @@
+#Tests of the overflow policies of sample_ring:
+#
+#  python test_sample_ring.py
+
+import threading
+import time
+
+import sample_ring
+
+def fill(ring, timestamps):
+  return [ring.push(1, (0, t), (0, 1), t, -50.0, b'') for t in timestamps]
+
+def timestamps(samples):
+  return [sample.timestamp for sample in samples]
+
+def test_drop_oldest():
+  ring = sample_ring.SampleRing(3, sample_ring.SampleRing.DROP_OLDEST)
+  assert [True] * 5 == fill(ring, range(5))
+  assert 2 == ring.dropped
+  assert 3 == ring.high_water
+  assert [2, 3, 4] == timestamps(ring.popAll())
+  assert ring.pop() is None
+
+def test_drop_newest():
+  ring = sample_ring.SampleRing(3, sample_ring.SampleRing.DROP_NEWEST)
+  assert [True, True, True, False, False] == fill(ring, range(5))
+  assert 2 == ring.dropped
+  assert [0, 1, 2] == timestamps(ring.popAll())
+
+def test_block_timeout():
+  """A full BLOCK ring drops the sample after the timeout, and waits for a
+  consumer to make room otherwise."""
+  ring = sample_ring.SampleRing(2, sample_ring.SampleRing.BLOCK, block_timeout = 0.05)
+  fill(ring, range(2))
+  start = time.monotonic()
+  assert [False] == fill(ring, [2])
+  assert time.monotonic() - start >= 0.05
+  assert 1 == ring.dropped
+  ring.block_timeout = None
+  consumer = threading.Timer(0.05, ring.pop)
+  consumer.start()
+  assert [True] == fill(ring, [3])
+  consumer.join()
+  assert [1, 3] == timestamps(ring.popAll())
+  assert 1 == ring.dropped
+
+def test_pop_waits():
+  ring = sample_ring.SampleRing(2)
+  threading.Timer(0.05, fill, (ring, [7])).start()
+  assert 7 == ring.pop(timeout = 5).timestamp
+  assert ring.pop(timeout = 0.01) is None
+
+def test_drain_reuses_slots():
+  """drain hands out the ring's own slots, wrapping around the end."""
+  ring = sample_ring.SampleRing(4)
+  slots = list(ring.slots)
+  fill(ring, range(3))
+  ring.drain(lambda sample: None, 2)
+  fill(ring, range(3, 6))
+  seen = []
+  assert 4 == ring.drain(lambda sample: seen.append((sample.timestamp, id(sample))))
+  assert [2, 3, 4, 5] == [t for t, i in seen]
+  assert set(id(slot) for slot in slots) == set(i for t, i in seen)
+  assert 0 == len(ring) and 0 == ring.dropped
+
+if __name__ == '__main__':
+  for name, test in sorted(globals().items()):
+    if name.startswith('test_'):
+      test()
+      print("{} passed".format(name))
@@ -0,0 +1,99 @@
+#Tests of sample_store chunked series, queries, and eviction. These need no
+#servers:
+#
+#  python test_sample_store.py
+
+import sample_store
+
+DEVICE = (0, 1)
+OTHER = (0, 2)
+RECEIVER = (1, 1)
+OTHER_RECEIVER = (1, 2)
+
+def stored(store, index):
+  return sum(chunk.count for series in index.values() for chunk in series)
+
+def checkCounts(store):
+  """len() matches the samples held by both the device and receiver series."""
+  assert len(store) == stored(store, store.device_series)
+  assert len(store) == stored(store, store.receiver_series)
+
+def timestamps(slices):
+  return [t for part in slices for t in part.timestamps]
+
+def test_last_n_across_chunks():
+  """lastN joins the ends of several chunks, oldest first, for devices and
+  for receivers."""
+  store = sample_store.SampleStore(max_age = 10 ** 6, chunk_size = 16)
+  for t in range(40):
+    store.add(1, DEVICE, RECEIVER, t, -50.0 - t % 10)
+  assert [16, 16, 8] == [chunk.count for chunk in store.device_series[DEVICE]]
+  last = store.lastN(20, device_id = DEVICE)
+  assert [12, 8] == [len(part) for part in last]
+  assert list(range(20, 40)) == timestamps(last)
+  assert [-50.0 - t % 10 for t in range(20, 40)] == [r for part in last for r in part.rssi]
+  assert [RECEIVER[1]] * 20 == [r for part in last for r in part.other_lo]
+  assert list(range(40)) == timestamps(store.lastN(100, device_id = DEVICE))
+  assert [39] == timestamps(store.lastN(1, receiver_id = RECEIVER))
+  assert [DEVICE[1]] == list(store.lastN(1, receiver_id = RECEIVER)[0].other_lo)
+  assert [] == store.lastN(0, device_id = DEVICE)
+  assert [] == store.lastN(5, device_id = OTHER)
+  checkCounts(store)
+
+def test_range_views_and_copies():
+  """Ranges of ordered chunks are views of the stored columns, and ranges
+  of chunks with out of order samples are filtered copies."""
+  store = sample_store.SampleStore(max_age = 10 ** 6, chunk_size = 16)
+  for t in range(0, 64, 2):
+    store.add(1, DEVICE, RECEIVER, t, -60.0)
+  parts = store.range(10, 41, device_id = DEVICE)
+  assert list(range(10, 41, 2)) == timestamps(parts)
+  chunks = store.device_series[DEVICE]
+  assert [chunks[0].timestamps, chunks[1].timestamps] == [part.timestamps.obj for part in parts]
+  assert [] == store.range(100, 200, device_id = DEVICE)
+  # A late sample makes the open chunk unordered
+  for t in (70, 65, 80, 1):
+    store.add(1, OTHER, RECEIVER, t, -70.0)
+  parts = store.range(60, 81, receiver_id = RECEIVER)
+  assert [60, 62, 70, 65, 80] == timestamps(parts)
+  assert not store.receiver_series[RECEIVER][-1].ordered
+  assert parts[-1].timestamps.obj is not store.receiver_series[RECEIVER][-1].timestamps
+  assert [OTHER[1]] * 3 == list(parts[-1].other_lo)
+  checkCounts(store)
+
+def test_eviction():
+  """Full chunks are evicted once their newest sample is older than
+  max_age, and series that went silent are swept with their open chunk."""
+  store = sample_store.SampleStore(max_age = 100, chunk_size = 16)
+  for t in range(33):
+    store.add(1, DEVICE, RECEIVER, t, -50.0)
+  assert 4 == len(store.full_chunks)
+  assert 33 == len(store)
+  # Cutoff 20 evicts only the first full chunk of each series
+  store.add(1, OTHER, OTHER_RECEIVER, 120, -50.0)
+  assert 18 == len(store)
+  assert 2 == store.evicted_chunks
+  assert list(range(16, 33)) == timestamps(store.lastN(100, device_id = DEVICE))
+  assert list(range(16, 33)) == timestamps(store.range(0, 200, receiver_id = RECEIVER))
+  assert sorted([DEVICE, OTHER]) == sorted(store.devices())
+  checkCounts(store)
+  # Cutoff 150 evicts the other full chunk and the sweep drops the silent
+  # series, including their open chunks
+  store.add(1, OTHER, OTHER_RECEIVER, 250, -50.0)
+  assert 2 == len(store)
+  assert [OTHER] == store.devices()
+  assert [OTHER_RECEIVER] == store.receivers()
+  assert [] == store.lastN(10, device_id = DEVICE)
+  assert 0 == len(store.full_chunks)
+  assert 6 == store.evicted_chunks
+  checkCounts(store)
+  # Older samples do not move the cutoff
+  store.add(1, DEVICE, RECEIVER, 5, -50.0)
+  assert 3 == len(store)
+  checkCounts(store)
+
+if __name__ == '__main__':
+  for name, test in sorted(globals().items()):
+    if name.startswith('test_'):
+      test()
+      print("{} passed".format(name))
@@ -0,0 +1,76 @@
+#Tests of sharded_solver worker processes. These need no servers:
+#
+#  python test_sharded_solver.py
+
+import os
+
+import sensor_sample
+import sharded_solver
+import wm_data
+
+def countDevice(sample_list, state):
+  """Count samples per device across batches and report each sample with
+  the worker that saw it."""
+  results = []
+  for sample in sample_list:
+    count = state.get(sample.device_id, 0) + 1
+    state[sample.device_id] = count
+    results.append(wm_data.WMData('{}.{}'.format(sample.device_id[1], sample.timestamp),
+        [wm_data.WMAttribute('count', count.to_bytes(4, 'big'), sample.timestamp,
+                             origin = str(os.getpid()))]))
+  return results
+
+def failOnDevice(sample_list, state):
+  for sample in sample_list:
+    if 3 == sample.device_id[1]:
+      raise ValueError("bad device {}".format(sample.device_id))
+  return []
+
+def sample(device, timestamp, sense_data = b''):
+  return sensor_sample.SensorSample(1, (0, device), (0, 1), timestamp, -50.0, sense_data)
+
+def test_partitioning_and_order():
+  """Every device stays on one worker with its state, and each device's
+  samples are solved in order, across batches that do not fit at once."""
+  solver = sharded_solver.ShardedSolver(countDevice, workers = 3, buffer_size = 2048)
+  try:
+    batch = [sample(device, t, bytes(t % 7)) for t in range(100) for device in range(10)]
+    results = solver.process(batch[:500]) + solver.process(batch[500:])
+    assert 1000 == len(results)
+    assert solver.batches > 2
+    workers = {}
+    counts = {}
+    for wmdata in results:
+      device, timestamp = map(int, wmdata.uri.split('.'))
+      attr = wmdata.attributes[0]
+      workers.setdefault(device, set()).add(attr.origin)
+      counts.setdefault(device, []).append((timestamp, int.from_bytes(attr.data, 'big')))
+    assert all(1 == len(pids) for pids in workers.values())
+    assert 1 < len(set.union(*workers.values()))
+    for device, seen in counts.items():
+      assert [(t, t + 1) for t in range(100)] == seen
+  finally:
+    solver.close()
+
+def test_worker_failure():
+  """An exception in a worker is raised in the parent with its traceback,
+  and the other workers keep going."""
+  solver = sharded_solver.ShardedSolver(failOnDevice, workers = 2)
+  try:
+    try:
+      solver.process([sample(device, 0) for device in range(6)])
+      assert False
+    except sharded_solver.WorkerError as error:
+      assert 'bad device' in str(error)
+      assert 'failOnDevice' in str(error)
+      assert isinstance(error.__cause__, ValueError)
+    assert not any(solver.busy)
+    assert [] == solver.process([sample(1, 1)])
+  finally:
+    solver.close()
+
+if __name__ == '__main__':
+  for name, test in sorted(globals().items()):
+    if name.startswith('test_'):
+      test()
+      print("{} passed".format(name))
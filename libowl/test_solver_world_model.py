@@ -0,0 +1,155 @@
+#Tests of SolverWorldModel against a fake world model. These need no
+#servers:
+#
+#  python test_solver_world_model.py
+
+import time
+
+import fake_servers
+import push_cache
+import reconnect
+import solver_world_model as swm
+import wm_data
+
+def pushX(solver, data, create_uris = False):
+  solver.pushData([wm_data.WMData('u', [wm_data.WMAttribute('x', data, 1)])], create_uris)
+
+def pushTransient(solver):
+  """Push a transient attribute t for u and v and a regular attribute x for
+  u."""
+  solver.pushData([wm_data.WMData('u', [wm_data.WMAttribute('t', b'1', 1, transient = True),
+                                        wm_data.WMAttribute('x', b'1', 1)]),
+                   wm_data.WMData('v', [wm_data.WMAttribute('t', b'1', 1, transient = True)])])
+
+def test_transients_follow_requests():
+  """Transient attributes are only pushed for requested URIs, from the
+  start request until the stop request."""
+  server = fake_servers.FakeWorldModel()
+  solver = swm.SolverWorldModel(server.host, server.port, 'test')
+  START = swm.SolverWorldModel.START_TRANSIENT
+  STOP = swm.SolverWorldModel.STOP_TRANSIENT
+  pushTransient(solver)
+  alias = solver.name_to_alias['t']
+  assert {alias} == solver.transients.types
+  assert server.waitForClients(1)
+  server.requestTransient(START, [(alias, ['u|w'])])
+  assert START == solver.handleMessage()
+  pushTransient(solver)
+  server.requestTransient(STOP, [(alias, ['u|w'])])
+  assert STOP == solver.handleMessage()
+  pushTransient(solver)
+  assert server.waitForAttributes(4)
+  solver.close()
+  server.close()
+  assert [('u', 'x'), ('u', 't'), ('u', 'x'), ('u', 'x')] == server.solutions
+  assert 5 == solver.transients.dropped
+
+def test_transient_requests_end_with_the_connection():
+  """Requests of a lost connection are cleared, so the new connection gets
+  no transients until the world model asks again."""
+  server = fake_servers.FakeWorldModel()
+  solver = swm.SolverWorldModel(server.host, server.port, 'test')
+  solver.setReconnect(reconnect.Backoff(initial_delay = 0, jitter = 0))
+  solver.addSolutionTypes([wm_data.WMAttribute('t', b'', 0)], True)
+  assert server.waitForClients(1)
+  server.requestTransient(swm.SolverWorldModel.START_TRANSIENT, [(0, ['u', 'v'])])
+  assert swm.SolverWorldModel.START_TRANSIENT == solver.handleMessage()
+  pushTransient(solver)
+  assert server.waitForAttributes(3)
+  server.disconnectAll()
+  time.sleep(0.15)
+  pushTransient(solver)
+  assert 1 == solver.reconnects
+  assert server.waitForAttributes(4)
+  solver.close()
+  server.close()
+  assert [('u', 't'), ('u', 'x'), ('v', 't'), ('u', 'x')] == server.solutions
+
+def test_push_cache_invalidation():
+  """Unchanged data is pushed again after the world model dropped it."""
+  server = fake_servers.FakeWorldModel()
+  solver = swm.SolverWorldModel(server.host, server.port, 'test')
+  solver.setPushCache(push_cache.PushCache())
+  pushX(solver, b'1')
+  pushX(solver, b'1')
+  solver.deleteURI('u')
+  pushX(solver, b'1', True)
+  solver.deleteAttribute('u', 'x')
+  pushX(solver, b'1')
+  solver.expireURI('u', 5)
+  pushX(solver, b'1')
+  solver.expireAttribute('u', 'x', 5)
+  pushX(solver, b'1')
+  assert server.waitForAttributes(5)
+  solver.close()
+  server.close()
+  assert 5 == server.count(swm.SolverWorldModel.SOLVER_DATA)
+
+def test_push_cache_invalidate():
+  cache = push_cache.PushCache(max_entries = 3)
+  attributes = [wm_data.WMAttribute(name, b'1', 1) for name in 'abc']
+  assert 3 == len(cache.filter([wm_data.WMData('u', attributes)])[0].attributes)
+  cache.invalidate('u', 'b')
+  assert ['b'] == [attr.name for attr in cache.filter([wm_data.WMData('u', attributes)])[0].attributes]
+  cache.invalidate('u')
+  assert 0 == len(cache) and {} == cache.names
+  cache.filter([wm_data.WMData(uri, attributes[:1]) for uri in 'uvwx'])
+  assert 1 == cache.evictions and ['v', 'w', 'x'] == sorted(cache.names)
+
+def test_scheduled_expirations():
+  """Expire messages carry the scheduled times, replaced and cancelled
+  expirations are not sent, and unknown attribute types are refused."""
+  server = fake_servers.FakeWorldModel()
+  solver = swm.SolverWorldModel(server.host, server.port, 'test')
+  solver.setExpiration(tick = 10)
+  now = round(time.time() * 1000)
+  solver.pushData([wm_data.WMData('u{}'.format(i), [wm_data.WMAttribute('x', b'1', now, now + 3000 + i)])
+                   for i in range(3)])
+  # A new value without an expiration time cancels the old one
+  solver.pushData([wm_data.WMData('u0', [wm_data.WMAttribute('x', b'2', now)])])
+  solver.scheduleExpireAttribute('u1', 'x', now + 5000)
+  solver.scheduleExpireURI('v', now + 4000)
+  solver.scheduleExpireURI('w', now + 4000)
+  solver.cancelExpiration('w')
+  try:
+    solver.scheduleExpireAttribute('u1', 'unknown', now)
+    assert False
+  except KeyError:
+    pass
+  assert 0 == solver.expireDue(now)
+  assert 3 == solver.expireDue(now + 10000)
+  assert 0 == len(solver.wheel)
+  assert server.waitForMessages(swm.SolverWorldModel.EXPIRE_URI, 1)
+  solver.close()
+  server.close()
+  EXPIRE_URI = swm.SolverWorldModel.EXPIRE_URI
+  EXPIRE_ATTRIBUTE = swm.SolverWorldModel.EXPIRE_ATTRIBUTE
+  # Attributes due together are sent before URIs
+  assert [(EXPIRE_ATTRIBUTE, 'u1', 0, now + 5000), (EXPIRE_ATTRIBUTE, 'u2', 0, now + 3002),
+          (EXPIRE_URI, 'v', None, now + 4000)] == sorted(server.expirations[:2]) + server.expirations[2:]
+
+def test_expiration_needs_set_expiration():
+  """Scheduling an expiration without setExpiration is refused clearly, also
+  after expiring was turned off."""
+  server = fake_servers.FakeWorldModel()
+  solver = swm.SolverWorldModel(server.host, server.port, 'test')
+  pushX(solver, b'1')
+  for turn in range(2):
+    for schedule in (lambda: solver.scheduleExpireURI('u', 5), lambda: solver.scheduleExpireAttribute('u', 'x', 5)):
+      try:
+        schedule()
+        assert False
+      except RuntimeError as error:
+        assert 'setExpiration' in str(error)
+    assert 0 == solver.expireDue()
+    solver.setExpiration()
+    solver.scheduleExpireURI('u', 5)
+    solver.setExpiration(None)
+  solver.close()
+  server.close()
+
+if __name__ == '__main__':
+  for name, test in sorted(globals().items()):
+    if name.startswith('test_'):
+      test()
+      print("{} passed".format(name))
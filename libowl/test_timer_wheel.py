@@ -0,0 +1,61 @@
+#Randomized tests of timer_wheel against a plain list of timers:
+#
+#  python test_timer_wheel.py
+
+import random
+
+import timer_wheel
+
+def test_matches_brute_force():
+  """Timers fire in the first advance that reaches their tick, never
+  earlier, and cancelled timers never fire, across cascades, overflow,
+  past due timers, and skipped idle ticks."""
+  rng = random.Random(1)
+  tick = 10
+  for trial in range(30):
+    start = rng.randrange(10000)
+    wheel = timer_wheel.TimerWheel(tick, rng.choice([4, 8, 16]), rng.choice([1, 2, 3]), start)
+    now = start
+    # Item -> (when, timer) of every pending timer
+    pending = {}
+    for step in range(300):
+      for i in range(rng.randrange(5)):
+        when = now + rng.choice([rng.randrange(-50, 100), rng.randrange(100000)])
+        item = (step, i)
+        pending[item] = (when, wheel.schedule(when, item))
+      if pending and rng.random() < 0.3:
+        item = rng.choice(sorted(pending))
+        wheel.cancel(pending.pop(item)[1])
+      now += rng.choice([0, 5, 10, 37, 500, 5000])
+      fired = wheel.advance(now)
+      expected = sorted(item for item, (when, timer) in pending.items() if when // tick <= now // tick)
+      assert expected == sorted(fired)
+      for item in fired:
+        del pending[item]
+      assert len(pending) == len(wheel)
+
+def test_fires_in_tick_order():
+  wheel = timer_wheel.TimerWheel(1, 4, 2)
+  for when in (40, 3, 17, 5):
+    wheel.schedule(when, when)
+  assert [3, 5, 17, 40] == wheel.advance(100)
+  assert 0 == len(wheel)
+
+def test_cancel():
+  wheel = timer_wheel.TimerWheel(1, 4, 2)
+  timer = wheel.schedule(10, 'a')
+  wheel.cancel(timer)
+  wheel.cancel(timer)
+  assert 0 == len(wheel)
+  assert [] == wheel.advance(20)
+  timer = wheel.schedule(25, 'b')
+  assert ['b'] == wheel.advance(25)
+  # Cancelling a timer that fired does nothing
+  wheel.cancel(timer)
+  assert 0 == len(wheel)
+
+if __name__ == '__main__':
+  for name, test in sorted(globals().items()):
+    if name.startswith('test_'):
+      test()
+      print("{} passed".format(name))
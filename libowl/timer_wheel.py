@@ -0,0 +1,112 @@
+#Hierarchical timing wheel for scheduling many timers cheaply.
+#Times are integers (milliseconds for GRAIL) rounded down to ticks. Level 0
+#has one slot per tick and each higher level has slots that span a whole
+#turn of the level below, so scheduling and cancelling a timer take constant
+#time no matter how many are pending. Timers in a higher level slot move
+#down a level when the wheel reaches that slot. Timers further out than the
+#top level are kept aside until the top level turns over, and timers that
+#are already due fire on the next advance.
+
+class Timer:
+  __slots__ = ('when', 'item', 'slot')
+
+  def __init__(self, when, item):
+    self.when = when
+    self.item = item
+    # The set holding this timer, or None once it fired or was cancelled
+    self.slot = None
+
+class TimerWheel:
+  def __init__(self, tick = 100, slots = 256, levels = 4, start = 0):
+    """Timers fire in ticks of the given length, counting from the start
+    time. Each of the levels has the given number of slots."""
+    self.tick = tick
+    self.slots = slots
+    self.levels = levels
+    # Ticks spanned by one slot of each level
+    self.spans = [slots ** level for level in range(levels + 1)]
+    self.wheels = [[set() for i in range(slots)] for level in range(levels)]
+    self.overflow = set()
+    self.due = set()
+    # The tick the wheel has advanced to
+    self.current = start // tick
+    self.pending = 0
+    self.fired = 0
+    self.cascaded = 0
+
+  def __len__(self):
+    """Number of pending timers."""
+    return self.pending
+
+  def place(self, timer):
+    delta = timer.when // self.tick - self.current
+    if delta <= 0:
+      slot = self.due
+    elif delta >= self.spans[self.levels]:
+      slot = self.overflow
+    else:
+      level = 0
+      while delta >= self.spans[level + 1]:
+        level += 1
+      slot = self.wheels[level][(timer.when // self.tick // self.spans[level]) % self.slots]
+    slot.add(timer)
+    timer.slot = slot
+
+  def schedule(self, when, item):
+    """Fire item at time when. Returns a Timer to cancel it with."""
+    timer = Timer(when, item)
+    self.place(timer)
+    self.pending += 1
+    return timer
+
+  def cancel(self, timer):
+    """Stop a timer from firing. Does nothing if it already fired."""
+    if timer.slot is not None:
+      timer.slot.discard(timer)
+      timer.slot = None
+      self.pending -= 1
+
+  def cascade(self, slot):
+    timers = list(slot)
+    slot.clear()
+    for timer in timers:
+      self.place(timer)
+    self.cascaded += len(timers)
+
+  def advance(self, now):
+    """Move the wheel up to time now and return the items of the timers that
+    are due, in the order of their ticks."""
+    target = now // self.tick
+    fired = []
+    if self.due:
+      self.collect(self.due, fired)
+    while self.current < target:
+      if 0 == self.pending:
+        # Nothing can fire, so skip the empty ticks
+        self.current = target
+        break
+      self.current += 1
+      current = self.current
+      if 0 == current % self.spans[self.levels]:
+        self.cascade(self.overflow)
+      # Higher levels first so their timers can move down more than a level
+      for level in range(self.levels - 1, 0, -1):
+        if 0 == current % self.spans[level]:
+          self.cascade(self.wheels[level][(current // self.spans[level]) % self.slots])
+      self.collect(self.wheels[0][current % self.slots], fired)
+      # Timers due by now that cascaded into the due set
+      if self.due:
+        self.collect(self.due, fired)
+    return fired
+
+  def collect(self, slot, fired):
+    for timer in slot:
+      timer.slot = None
+      fired.append(timer.item)
+    self.pending -= len(slot)
+    self.fired += len(slot)
+    slot.clear()
+
+  def stats(self):
+    """Pending, fired, and cascaded timer counts."""
+    return {'pending': self.pending, 'fired': self.fired, 'cascaded': self.cascaded}
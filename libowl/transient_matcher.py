@@ -0,0 +1,135 @@
+#Matches outgoing URIs against the transient requests of the world model.
+#The world model asks for transient attribute types with START_TRANSIENT
+#messages naming a type alias and expressions for the URIs it wants, and
+#withdraws them with STOP_TRANSIENT. The active expressions of each alias are
+#compiled into one regular expression that must match a whole URI, and the
+#result for each (alias, URI) pair is remembered in a least recently used
+#cache. Changing the requests of an alias bumps its generation so that older
+#cached results are ignored.
+
+import collections
+import re
+
+import wm_data
+
+class TransientMatcher:
+  def __init__(self, cache_size = 65536):
+    self.cache_size = cache_size
+    # Aliases of the types declared transient
+    self.types = set()
+    # Alias -> {expression: number of active requests for it}
+    self.requests = {}
+    # Alias -> combined pattern of its active expressions
+    self.patterns = {}
+    # Alias -> number of times its requests changed
+    self.generations = {}
+    # (alias, uri) -> [generation, requested]
+    self.cache = collections.OrderedDict()
+    self.hits = 0
+    self.misses = 0
+    # Attributes left out because nobody requested them
+    self.dropped = 0
+    # Expressions that are not valid regular expressions
+    self.invalid = 0
+
+  def addType(self, alias):
+    """Only send attributes of this type for requested URIs."""
+    self.types.add(alias)
+
+  def start(self, requests):
+    """Add the expressions of a list of TransientRequests."""
+    for request in requests:
+      counts = self.requests.setdefault(request.name, {})
+      for expression in request.expressions:
+        counts[expression] = counts.get(expression, 0) + 1
+      self.compile(request.name)
+
+  def stop(self, requests):
+    """Remove the expressions of a list of TransientRequests. A request
+    without expressions removes every expression of its type."""
+    for request in requests:
+      counts = self.requests.get(request.name)
+      if counts is None:
+        continue
+      if 0 == len(request.expressions):
+        counts.clear()
+      for expression in request.expressions:
+        remaining = counts.get(expression, 0) - 1
+        if 0 < remaining:
+          counts[expression] = remaining
+        else:
+          counts.pop(expression, None)
+      if 0 == len(counts):
+        del self.requests[request.name]
+      self.compile(request.name)
+
+  def clearRequests(self):
+    """Forget every request, keeping the transient types, as when the world
+    model restarts and has to request them again."""
+    aliases = list(self.requests)
+    self.requests.clear()
+    for alias in aliases:
+      self.compile(alias)
+
+  def compile(self, alias):
+    """Combine the active expressions of an alias into one pattern."""
+    self.generations[alias] = self.generations.get(alias, 0) + 1
+    valid = []
+    for expression in self.requests.get(alias, ()):
+      try:
+        re.compile(expression)
+        valid.append('(?:' + expression + ')')
+      except re.error:
+        self.invalid += 1
+    if 0 == len(valid):
+      self.patterns.pop(alias, None)
+    else:
+      self.patterns[alias] = re.compile('|'.join(valid))
+
+  def requested(self, alias, uri):
+    """True if the world model asked for the type alias of this URI."""
+    pattern = self.patterns.get(alias)
+    if pattern is None:
+      return False
+    key = (alias, uri)
+    generation = self.generations[alias]
+    entry = self.cache.get(key)
+    if entry is not None and entry[0] == generation:
+      self.hits += 1
+      self.cache.move_to_end(key)
+      return entry[1]
+    self.misses += 1
+    result = pattern.fullmatch(uri) is not None
+    if entry is not None:
+      entry[0] = generation
+      entry[1] = result
+      self.cache.move_to_end(key)
+    else:
+      self.cache[key] = [generation, result]
+      if len(self.cache) > self.cache_size:
+        self.cache.popitem(last = False)
+    return result
+
+  def filter(self, wmdata_vector, name_to_alias):
+    """Return the WMData without attributes of transient types that were not
+    requested for their URI, leaving out objects that have nothing left to
+    send."""
+    types = self.types
+    result = []
+    for wmdata in wmdata_vector:
+      attributes = [attr for attr in wmdata.attributes
+                    if name_to_alias[attr.name] not in types or
+                       self.requested(name_to_alias[attr.name], wmdata.uri)]
+      self.dropped += len(wmdata.attributes) - len(attributes)
+      if len(attributes) == len(wmdata.attributes):
+        result.append(wmdata)
+      elif 0 < len(attributes):
+        result.append(wm_data.WMData(wmdata.uri, attributes, wmdata.ticket))
+    return result
+
+  def stats(self):
+    """Request, cache, and drop counts."""
+    return {'types': len(self.types), 'requested_types': len(self.patterns),
+            'cache_entries': len(self.cache), 'hits': self.hits,
+            'misses': self.misses, 'dropped': self.dropped,
+            'invalid': self.invalid}
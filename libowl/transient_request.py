@@ -1,7 +1,7 @@
 #Transient specification - one attribute name an a list of name expressions
 
 class TransientRequest:
-  def __init___(self, name, expressions):
+  def __init__(self, name, expressions):
     #Attribute name
     self.name = name
     #Requested expressions
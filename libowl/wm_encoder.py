@@ -0,0 +1,68 @@
+#Encoder for messages sent from a solver to a GRAIL world model.
+#Messages are written by grail_codec into a single preallocated buffer each.
+#The UTF-16 encodings of URIs and attribute names are kept in a bounded LRU
+#cache since solvers usually push the same objects over and over.
+
+import collections
+
+import grail_codec
+
+class WMEncoder:
+  #Message constants, matching SolverWorldModel
+  TYPE_ANNOUNCE    = grail_codec.WM_TYPE_ANNOUNCE
+  SOLVER_DATA      = grail_codec.WM_SOLVER_DATA
+
+  def __init__(self, origin, cache_size = 8192):
+    """Encode messages for a solver with the given origin, caching the
+    encodings of up to cache_size URIs and attribute names."""
+    self.origin16 = origin.encode('utf-16-be')
+    self.cache_size = cache_size
+    self.cache = collections.OrderedDict()
+    self.cache_hits = 0
+    self.cache_misses = 0
+
+  def encodeString(self, string):
+    """Return the UTF-16 big endian encoding of the string."""
+    encoded = self.cache.get(string)
+    if encoded is not None:
+      self.cache_hits += 1
+      self.cache.move_to_end(string)
+      return encoded
+    self.cache_misses += 1
+    encoded = string.encode('utf-16-be')
+    self.cache[string] = encoded
+    if len(self.cache) > self.cache_size:
+      self.cache.popitem(last = False)
+    return encoded
+
+  def encodeTypeAnnounce(self, type_info):
+    """Encode a type announcement of [name, alias, transient] entries,
+    prepended with the message length."""
+    return grail_codec.encodeTypeAnnounce(type_info, self.origin16, self.encodeString)
+
+  def encodeAttributes(self, wmdata_vector, name_to_alias, reserve = 0):
+    """Encode the attributes of the WMData objects as they appear in a
+    solver data message, after reserve unused bytes. Returns the buffer and
+    the number of attributes. Every attribute name must already have an
+    alias."""
+    return grail_codec.encodeAttributes(wmdata_vector, name_to_alias, reserve, self.encodeString)
+
+  def encodeSolverDataHeader(self, attributes_size, total_solns, create_uris = False):
+    """Encode the length prefix and header of a solver data message holding
+    total_solns attributes that take attributes_size bytes."""
+    return grail_codec.encodeSolverDataHeader(attributes_size, total_solns, create_uris)
+
+  def encodeSolverData(self, wmdata_vector, name_to_alias, create_uris = False):
+    """Encode a solver data message, prepended with the message length.
+    Every attribute name must already have an alias."""
+    return grail_codec.encodeSolverData(wmdata_vector, name_to_alias, create_uris, self.encodeString)
+
+  def encodeURIMessage(self, control, uri, timestamp = None):
+    """Encode a create, expire, or delete URI message, prepended with the
+    message length. Delete messages have no timestamp."""
+    return grail_codec.encodeURIMessage(control, uri, self.origin16, timestamp, self.encodeString)
+
+  def encodeAttributeMessage(self, control, uri, alias, timestamp = None):
+    """Encode an expire or delete attribute message, prepended with the
+    message length. Delete messages have no timestamp."""
+    return grail_codec.encodeAttributeMessage(control, uri, alias, self.origin16, timestamp, self.encodeString)
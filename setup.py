@@ -13,6 +13,9 @@ setuptools.setup(
   long_description_content_type="text/markdown",
   url="https://github.com/OwlPlatform/libpython",
   packages=setuptools.find_packages(),
+  extras_require={
+    "batch": ["numpy"],
+    },
   classifiers=(
     "Programming Language :: Python :: 3",
     "License :: OSI Approved :: GNU General Public License v2 (GPLv2)",